@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the legal move generator in `chess.movegen`.
+
+Perft of well known positions is counted up to `-d` plies and checked
+against their known node counts, then games made by `corpus.py` are
+replayed with and without `Game(validate=True)` to report what checking
+every move costs. The run fails on a wrong count, or when validated replay
+is slower than `--max_ratio` times plain replay.
+
+    python benchmarks/bench_perft.py [-d DEPTH] [-n GAMES] [-R ROUNDS] [--max_ratio RATIO]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.join(BENCH_DIR, os.pardir)]
+
+from corpus import generate_games  # noqa: E402
+
+from chess import list_supported_state_files  # noqa: E402
+from chess.codec import load_state_from_file  # noqa: E402
+from chess.game import Game  # noqa: E402
+from chess.movegen import perft, PERFT_POSITIONS  # noqa: E402
+
+
+def replay(state, games, validate):
+    """replay applies every move of every game, returns CPU seconds."""
+    start = time.process_time()
+    for record in games:
+        game = Game(state, validate=validate)
+        for move in record.moves:
+            game.apply(move)
+    return time.process_time() - start
+
+
+def main():
+    """The main function."""
+    parser = argparse.ArgumentParser('bench_perft.py')
+    parser.add_argument('-d', '--depth', default=3, type=int, help='perft depth of positions')
+    parser.add_argument('-n', '--games', default=60, type=int, help='number of synthetic games')
+    parser.add_argument('-R', '--rounds', default=10, type=int, help='rounds of replay')
+    parser.add_argument('--max_ratio', default=2.0, type=float,
+                        help='fail when validated replay takes longer than this times plain one')
+    args = parser.parse_args()
+
+    failures = []
+    for name, (fen, counts) in PERFT_POSITIONS.items():
+        depth = min(args.depth, len(counts))
+        start = time.perf_counter()
+        nodes = perft(Game.from_fen(fen), depth)
+        elapsed = time.perf_counter() - start
+        status = 'ok' if nodes == counts[depth - 1] else 'WRONG, expect {}'.format(
+            counts[depth - 1])
+        print('{:<10} depth {} {:>9} nodes {:7.2f}s {:9.0f} nodes/s {}'.format(
+            name, depth, nodes, elapsed, nodes / elapsed, status))
+        if nodes != counts[depth - 1]:
+            failures.append('{} counts {} nodes'.format(name, nodes))
+
+    state = load_state_from_file(list_supported_state_files()['default'])
+    games = generate_games(args.games)
+    plies = sum(len(g.moves) for g in games)
+    plain = validated = float('inf')
+    for _ in range(args.rounds):
+        # interleaved, so that both see the same machine load.
+        plain = min(plain, replay(state, games, False))
+        validated = min(validated, replay(state, games, True))
+    ratio = validated / plain
+    print('replay     {:.2f} us/ply, validated {:.2f} us/ply, {:.2f}x over {} plies'.format(
+        plain / plies * 1e6, validated / plies * 1e6, ratio, plies))
+    if ratio > args.max_ratio:
+        failures.append('validation costs {:.2f}x over {:.2f}x'.format(ratio, args.max_ratio))
+
+    if failures:
+        print('failed: {}'.format('; '.join(failures)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of frame composition in `chess.board.Board`.
+
+It renders the games under `misc/input` with the ndarray path, which
+writes tiles into one preallocated frame buffer, and with the PIL path
+`Board` had before, which pastes tiles into an image and copies it into an
+array per move. Frames of both paths are checked to be pixel-identical.
+
+    python benchmarks/bench_render.py [--font_path FONT_PATH] [-R ROUNDS] [pgn ...]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from numpy import array, array_equal  # noqa: E402
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+from chess import list_supported_state_files, COLORS, PIECES  # noqa: E402
+from chess.assets import FONT_PATH, ICONS_DIR  # noqa: E402
+from chess.board import (Board, BOARD_EDGE, BOARD_MARGIN, FONT_SIZE,  # noqa: E402
+                         SQUARE_COORDINATES, SQUARE_EDGE, SQUARE_SHADES, _get_text_loc)
+from chess.codec import load_moves_from_file, load_state_from_file  # noqa: E402
+from chess.game import Game, PIECE_NAMES  # noqa: E402
+
+
+INPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'misc', 'input')
+
+
+class PilBoard():
+    """PilBoard composes frames like `Board` did before frames were arrays.
+
+    It is a copy of that code, kept apart from `chess.board` so that changes
+    there are measured and checked against it: tiles of squares with pieces
+    are pasted into one PIL image, which is converted to an array per move.
+    """
+
+    def __init__(self, init_state, white_color='#EAE9D2', black_color='#4B7399',
+                 font_path=FONT_PATH):
+        self.ttfont = ImageFont.truetype(font_path, FONT_SIZE)
+        self.chesspieces = {c + p: Image.open(os.path.join(ICONS_DIR, c + p + '.png'))
+                            for c in COLORS for p in PIECES}
+        self.white_square = Image.new('RGBA', (SQUARE_EDGE, SQUARE_EDGE), white_color)
+        self.black_square = Image.new('RGBA', (SQUARE_EDGE, SQUARE_EDGE), black_color)
+        # tiles[shade][code] is a square of shade with chesspiece code on it, fully composited.
+        self.tiles = tuple(tuple(self._create_tile(square, name) for name in PIECE_NAMES)
+                           for square in (self.white_square, self.black_square))
+        self.game = Game(init_state)
+
+    def _create_tile(self, square, piece):
+        tile = Image.new('RGB', (SQUARE_EDGE, SQUARE_EDGE))
+        tile.paste(square, (0, 0), square)
+        if piece:
+            img = self.chesspieces[piece]
+            tile.paste(img, (0, 0), img)
+        return tile
+
+    def reset(self, init_state, is_white_run=True):
+        """reset puts the game back to `init_state` before rendering another game."""
+        self.game = Game(init_state, is_white_run=is_white_run)
+
+    def _draw_square(self, image, square, code):
+        image.paste(self.tiles[SQUARE_SHADES[square]][code], SQUARE_COORDINATES[square])
+
+    def _init_board(self):
+        width, height = BOARD_EDGE + 2 * BOARD_MARGIN, BOARD_EDGE + 2 * BOARD_MARGIN
+        initial_board = Image.new('RGB', (width, height))
+        draw = ImageDraw.Draw(initial_board)
+        for square in range(64):
+            self._draw_square(initial_board, square, 0)
+
+        for i in range(8):
+            col = SQUARE_EDGE * i
+            text = chr(ord('a') + i)
+            left, top = _get_text_loc(text, self.ttfont, (SQUARE_EDGE, BOARD_MARGIN))
+            draw.text((col + BOARD_MARGIN + left, top), text,
+                      fill=(255, 255, 255), font=self.ttfont)
+            draw.text((col + BOARD_MARGIN + left, BOARD_EDGE + BOARD_MARGIN), text,
+                      fill=(255, 255, 255), font=self.ttfont)
+
+            text = chr(ord('8') - i)
+            left, top = _get_text_loc(text, self.ttfont, (BOARD_MARGIN, SQUARE_EDGE))
+            draw.text((left, BOARD_MARGIN + col + top), text,
+                      fill=(255, 255, 255), font=self.ttfont)
+            draw.text((BOARD_EDGE + BOARD_MARGIN + left, BOARD_MARGIN + col + top), text,
+                      fill=(255, 255, 255), font=self.ttfont)
+
+        return initial_board
+
+    def _update_state(self, initial_board):
+        board_image = initial_board.copy()
+        for square, code in enumerate(self.game.position.squares):
+            if code:
+                self._draw_square(board_image, square, code)
+        return board_image
+
+    def _apply_move(self, board_image, current, previous):
+        changed = [s for s in range(64) if current[s] != previous[s]]
+
+        for square in changed:
+            self._draw_square(board_image, square, current[square])
+
+    def _create_images(self, initial_board, moves):
+        board_image = initial_board.copy()
+        images = [array(board_image)]
+
+        for move in moves:
+            previous = bytes(self.game.position.squares)
+            self.game.apply(move)
+            self._apply_move(board_image, self.game.position.squares, previous)
+            images.append(array(board_image))
+
+        return images
+
+
+def compose(board, state, games):
+    """compose composes frames of every game, returns frames of the last one."""
+    # pylint: disable=protected-access
+    board.reset(state)
+    initial_board = board._update_state(board._init_board())
+    for moves in games:
+        board.reset(state)
+        frames = board._create_images(initial_board, moves)
+    return frames
+
+
+def main():
+    """The main function."""
+    parser = argparse.ArgumentParser('bench_render.py')
+    parser.add_argument('path', nargs='*', help='path to the pgn files, default misc/input/*.pgn',
+                        default=sorted(glob.glob(os.path.join(INPUT_DIR, '*.pgn'))))
+    parser.add_argument('--font_path', default=FONT_PATH,
+                        help='path of the display font used in board, default: bundled Lato')
+    parser.add_argument('-r', '--repeat', default=3, type=int, help='times to render the games')
+    parser.add_argument('-R', '--rounds', default=5, type=int, help='rounds of measurement')
+    args = parser.parse_args()
+
+    state = load_state_from_file(list_supported_state_files()['default'])
+    games = [load_moves_from_file(p) for p in args.path]
+    frames = sum(len(moves) + 1 for moves in games)
+
+    boards = (('PIL + array', PilBoard(state, font_path=args.font_path)),
+              ('ndarray', Board(state, font_path=args.font_path, show_copyright=False)))
+    for moves in games:
+        expected, actual = (compose(board, state, [moves]) for _, board in boards)
+        assert all(array_equal(lhs, rhs) for lhs, rhs in zip(expected, actual)), 'frames differ'
+
+    results = {name: float('inf') for name, _ in boards}
+    # interleave runs so that both sides see the same machine noise.
+    for _ in range(args.rounds):
+        for name, board in boards:
+            elapsed = timeit.timeit(lambda: compose(board, state, games), number=args.repeat)
+            results[name] = min(results[name], elapsed / (args.repeat * frames) * 1e6)
+
+    for name, _ in boards:
+        print('{:<12} {:8.1f} us/frame'.format(name, results[name]))
+    print('{} games, {} frames, pixel-identical, speedup {:.2f}x'.format(
+        len(games), frames, results['PIL + array'] / results['ndarray']))
+
+
+if __name__ == '__main__':
+    main()
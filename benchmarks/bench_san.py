@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmark of SAN origin resolution in `chess.game.Game`.
+
+It collects every piece move of the games under `misc/input` with the
+position it is made from, then resolves the origins of them with
+`Game._find_non_pawn`, which uses piece lists and attack tables, and with
+`scan_origin`, a copy of the lookup before them, which scans all 64 squares
+and walks paths square by square. Both are checked to find the same
+origins, the time spent per move is printed.
+
+    python benchmarks/bench_san.py [-r REPEAT] [-R ROUNDS] [pgn ...]
+"""
+
+import argparse
+import glob
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from chess import list_supported_state_files, BISHOP, BLACK, KNIGHT, ROCK, WHITE  # noqa: E402
+from chess.codec import load_moves_from_file, load_state_from_file  # noqa: E402
+from chess.game import Game, Position, SAN_CODES, SQUARES, SQUARE_NAMES, PIECE_NAMES  # noqa: E402
+
+
+LOGGER = logging.getLogger('ROOT')
+
+INPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'misc', 'input')
+
+
+# the lookup below is a copy of `chess.game` before piece lists, keep it as it is.
+
+def _is_path_clear(squares, src, dest, step):
+    return all(squares[i] == 0 for i in range(src + step, dest, step))
+
+
+def _is_knight_move(squares, src, dest):  # pylint: disable=unused-argument
+    col_diff = abs((src & 7) - (dest & 7))
+    row_diff = abs((src >> 3) - (dest >> 3))
+    return (col_diff == 2 and row_diff == 1) or (col_diff == 1 and row_diff == 2)
+
+
+def _is_line_move(squares, src, dest):
+    if src >> 3 == dest >> 3:
+        return _is_path_clear(squares, src, dest, 1 if dest > src else -1)
+    if src & 7 == dest & 7:
+        return _is_path_clear(squares, src, dest, 8 if dest > src else -8)
+    return False
+
+
+def _is_diagonal_move(squares, src, dest):
+    col_diff = (dest & 7) - (src & 7)
+    row_diff = (dest >> 3) - (src >> 3)
+    if col_diff == 0 or abs(col_diff) != abs(row_diff):
+        return False
+    step = (8 if row_diff > 0 else -8) + (1 if col_diff > 0 else -1)
+    return _is_path_clear(squares, src, dest, step)
+
+
+def _is_queen_move(squares, src, dest):
+    return _is_line_move(squares, src, dest) or _is_diagonal_move(squares, src, dest)
+
+
+SCAN_CHECKS = {
+    ROCK: _is_line_move,
+    BISHOP: _is_diagonal_move,
+    KNIGHT: _is_knight_move,
+}
+
+
+def scan_origin(squares, move, to, code):
+    """scan_origin is `Game._find_non_pawn` before piece lists, it returns origin of move."""
+    if len(move) == 5:
+        return SQUARES[move[1:3]]
+
+    key = '' if len(move) == 3 else move[1]
+    check = SCAN_CHECKS.get(PIECE_NAMES[code][1], _is_queen_move)
+
+    if PIECE_NAMES[code][1] == KNIGHT:
+        LOGGER.debug("move: %s, to: %s, pt: %s", move, SQUARE_NAMES[to], PIECE_NAMES[code])
+    return next(s for s, pt in enumerate(squares)
+                if pt == code and key in SQUARE_NAMES[s] and check(squares, s, to))
+
+
+def collect(state, games):
+    """collect returns `(squares, is_white_run, move, to, code)` of every piece move of games."""
+    lookups = []
+    for moves in games:
+        game = Game(state)
+        for move in moves:
+            san = move.rstrip('+#!?').replace('x', '')
+            if san[0] in 'KQRBN' and '=' not in san:
+                code = SAN_CODES[WHITE if game.is_white_run else BLACK][san[0]]
+                lookups.append((bytes(game.position.squares), game.is_white_run,
+                                san, SQUARES[san[-2:]], code))
+            game.apply(move)
+    return lookups
+
+
+def main():
+    """The main function."""
+    parser = argparse.ArgumentParser('bench_san.py')
+    parser.add_argument('path', nargs='*', help='path to the pgn files, default misc/input/*.pgn',
+                        default=sorted(glob.glob(os.path.join(INPUT_DIR, '*.pgn'))))
+    parser.add_argument('-r', '--repeat', default=50, type=int, help='times to resolve the moves')
+    parser.add_argument('-R', '--rounds', default=20, type=int, help='rounds of measurement')
+    args = parser.parse_args()
+
+    state = load_state_from_file(list_supported_state_files()['default'])
+    lookups = collect(state, [load_moves_from_file(p) for p in args.path])
+    scans = [(bytearray(squares), move, to, code) for squares, _, move, to, code in lookups]
+    games = [(Game(Position(squares), is_white_run=is_white_run), move, to, code)
+             for squares, is_white_run, move, to, code in lookups]
+    # pylint: disable=protected-access
+    expected = [scan_origin(*lookup) for lookup in scans]
+    assert [game._find_non_pawn(*lookup) for game, *lookup in games] == expected, 'origins differ'
+
+    impls = (('board scan', lambda: [scan_origin(*lookup) for lookup in scans]),
+             ('piece lists', lambda: [game._find_non_pawn(*lookup) for game, *lookup in games]))
+    results = dict.fromkeys((name for name, _ in impls), float('inf'))
+    # interleave runs so that both sides see the same machine noise.
+    for _ in range(args.rounds):
+        for name, func in impls:
+            elapsed = timeit.timeit(func, number=args.repeat)
+            results[name] = min(results[name], elapsed / (args.repeat * len(lookups)) * 1e6)
+
+    for name, _ in impls:
+        print('{:<12} {:8.3f} us/move'.format(name, results[name]))
+    print('{} games, {} piece moves, same origins, speedup {:.2f}x'.format(
+        len(args.path), len(lookups), results['board scan'] / results['piece lists']))
+
+
+if __name__ == '__main__':
+    main()
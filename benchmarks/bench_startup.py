@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Startup benchmark of `main.py` commands which do not render images.
+
+Each command is run in a fresh interpreter with `python -X importtime`,
+the best wall time over rounds and the slowest imports are reported. The
+run fails when a command takes longer than `--max_ms`, or when it imports
+a module of `--forbid`, heavy dependencies only rendering needs and modules
+of the other sub-commands.
+
+    python benchmarks/bench_startup.py [-R ROUNDS] [--max_ms MS] [--top N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+COMMANDS = {
+    'version': ['--version'],
+    'manual': ['manual', os.path.join('misc', 'input', 'opera.pgn')],
+}
+FORBIDDEN = ('PIL', 'numpy', 'imageio', 'asyncio', 'chess.archive', 'chess.cache', 'chess.game',
+             'chess.index', 'chess.manifest', 'chess.movegen', 'chess.positions')
+
+
+def run(args):
+    """run runs main.py with args, returns wall seconds and `{module: cumulative us}`.
+
+    Names of nested imports keep their indentation.
+    """
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', 'main.py'] + args, cwd=ROOT_DIR,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+    elapsed = time.perf_counter() - start
+    imports = {}
+    for line in proc.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports[name[1:].rstrip()] = int(cumulative)
+    return elapsed, imports
+
+
+def main():
+    """The main function."""
+    parser = argparse.ArgumentParser('bench_startup.py')
+    parser.add_argument('--commands', nargs='+', choices=sorted(COMMANDS),
+                        default=sorted(COMMANDS), help='commands to run')
+    parser.add_argument('-R', '--rounds', default=5, type=int, help='rounds of measurement')
+    parser.add_argument('--max_ms', default=150.0, type=float,
+                        help='fail when best wall time of a command is longer, in ms')
+    parser.add_argument('--forbid', nargs='*', default=list(FORBIDDEN),
+                        help='modules a command must not import, with their submodules')
+    parser.add_argument('--top', default=5, type=int, help='number of slowest imports printed')
+    args = parser.parse_args()
+
+    failures = []
+    for command in args.commands:
+        best, imports = float('inf'), {}
+        for _ in range(args.rounds):
+            elapsed, imports = run(COMMANDS[command])
+            best = min(best, elapsed)
+        # only top level imports, nested ones are included in their cumulative time.
+        top_level = {name: us for name, us in imports.items() if name == name.lstrip()}
+        print('{:<8} {:8.1f} ms, {} modules imported, {:.1f} ms in imports'.format(
+            command, best * 1e3, len(imports), sum(top_level.values()) / 1e3))
+        for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+            print('    {:<24} {:8.1f} ms'.format(name, us / 1e3))
+
+        forbidden = sorted({f for f in args.forbid for name in imports
+                            if name.strip() == f or name.strip().startswith(f + '.')})
+        if forbidden:
+            failures.append('{} imports {}'.format(command, ', '.join(forbidden)))
+        if best * 1e3 > args.max_ms:
+            failures.append('{} takes {:.1f} ms over {:.0f} ms'.format(
+                command, best * 1e3, args.max_ms))
+
+    if failures:
+        print('failed: {}'.format('; '.join(failures)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
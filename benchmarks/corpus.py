@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""Seeded generator of synthetic chess games for benchmarks.
+
+Games are played by picking random legal moves, with captures, castling,
+promotions and pawn pushes weighted up so that games look like played ones:
+pieces get traded, pawns promote, kings castle. The same seed gives the same games.
+
+    python benchmarks/corpus.py [-n GAMES] [-s SEED] [-o OUT]
+"""
+
+import argparse
+import os
+import random
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from chess import list_supported_state_files  # noqa: E402
+from chess.codec import load_state_from_file  # noqa: E402
+from chess.game import (EMPTY, PIECE_NAMES, SQUARE_NAMES, Position, KING_ATTACKS,  # noqa: E402
+                        KNIGHT_ATTACKS, ROCK_RAYS, BISHOP_RAYS, PIECE_CODES)
+
+
+WHITE_CODES = frozenset(range(1, 7))
+# SAN_LETTERS maps piece code to its SAN letter.
+SAN_LETTERS = tuple(name[1:].upper() for name in PIECE_NAMES)
+PROMOTIONS = 'QRBN'
+
+# SyntheticRecord holds SAN moves, result and another legal move, without check suffix, per ply.
+SyntheticRecord = namedtuple('SyntheticRecord', ['moves', 'result', 'alternatives'])
+
+
+def _is_white(code):
+    return code in WHITE_CODES
+
+
+def _code(white, letter):
+    return PIECE_CODES[('w' if white else 'b') + letter.lower()]
+
+
+def is_attacked(squares, square, by_white):
+    """is_attacked tells whether square is attacked by pieces of the given color."""
+    own = _code(by_white, 'N')
+    if any(squares[s] == own for s in KNIGHT_ATTACKS[square]):
+        return True
+    own = _code(by_white, 'K')
+    if any(squares[s] == own for s in KING_ATTACKS[square]):
+        return True
+    pawn, col = _code(by_white, 'P'), square & 7
+    origin = square - 8 if by_white else square + 8
+    if 0 <= origin < 64:
+        if col > 0 and squares[origin - 1] == pawn:
+            return True
+        if col < 7 and squares[origin + 1] == pawn:
+            return True
+    queen = _code(by_white, 'Q')
+    for rays, slider in ((ROCK_RAYS, _code(by_white, 'R')), (BISHOP_RAYS, _code(by_white, 'B'))):
+        for ray in rays[square]:
+            for s in ray:
+                if squares[s]:
+                    if squares[s] in (slider, queen):
+                        return True
+                    break
+    return False
+
+
+class SyntheticGame():
+    """SyntheticGame plays random legal moves from the default position."""
+
+    def __init__(self, rng):
+        state = load_state_from_file(list_supported_state_files()['default'])
+        self.rng = rng
+        self.squares = Position.from_state(state).squares
+        self.white = True
+        self.castling = set('KQkq')
+        self.ep = None
+
+    def _pseudo_moves(self):
+        # yields (src, dest, promotion letter or '', castle SAN or '').
+        squares, white = self.squares, self.white
+        for src, code in enumerate(squares):
+            if not code or _is_white(code) != white:
+                continue
+            letter = SAN_LETTERS[code]
+            if letter == 'P':
+                yield from self._pawn_moves(src)
+                continue
+            if letter in 'NK':
+                targets = (KNIGHT_ATTACKS if letter == 'N' else KING_ATTACKS)[src]
+            else:
+                rays = ((ROCK_RAYS[src] if letter in 'RQ' else ()) +
+                        (BISHOP_RAYS[src] if letter in 'BQ' else ()))
+                targets = []
+                for ray in rays:
+                    for s in ray:
+                        targets.append(s)
+                        if squares[s]:
+                            break
+            for dest in targets:
+                if not squares[dest] or _is_white(squares[dest]) != white:
+                    yield src, dest, '', ''
+        yield from self._castle_moves()
+
+    def _pawn_moves(self, src):
+        squares, white = self.squares, self.white
+        step = 8 if white else -8
+        last = (56 <= src + step < 64) if white else (0 <= src + step < 8)
+        dests = []
+        if not squares[src + step]:
+            dests.append(src + step)
+            start = 8 <= src < 16 if white else 48 <= src < 56
+            if start and not squares[src + 2 * step]:
+                dests.append(src + 2 * step)
+        for side in (-1, 1):
+            if 0 <= (src & 7) + side < 8:
+                dest = src + step + side
+                target = squares[dest]
+                if (target and _is_white(target) != white) or dest == self.ep:
+                    dests.append(dest)
+        for dest in dests:
+            for promotion in (PROMOTIONS if last else ('',)):
+                yield src, dest, promotion, ''
+
+    def _castle_moves(self):
+        squares, white = self.squares, self.white
+        row = 0 if white else 56
+        rights = 'KQ' if white else 'kq'
+        if squares[row + 4] != _code(white, 'K') or is_attacked(squares, row + 4, not white):
+            return
+        if (rights[0] in self.castling and squares[row + 7] == _code(white, 'R') and
+                not squares[row + 5] and not squares[row + 6] and
+                not is_attacked(squares, row + 5, not white)):
+            yield row + 4, row + 6, '', 'O-O'
+        if (rights[1] in self.castling and squares[row] == _code(white, 'R') and
+                not squares[row + 1] and not squares[row + 2] and not squares[row + 3] and
+                not is_attacked(squares, row + 3, not white)):
+            yield row + 4, row + 2, '', 'O-O-O'
+
+    def _make(self, move):
+        # returns undo information.
+        src, dest, promotion, castle = move
+        squares = self.squares
+        code, captured = squares[src], squares[dest]
+        undo = [(src, code), (dest, captured)]
+        if SAN_LETTERS[code] == 'P' and dest == self.ep:
+            taken = dest - 8 if self.white else dest + 8
+            undo.append((taken, squares[taken]))
+            squares[taken] = EMPTY
+        if castle:
+            row = src & ~7
+            r, r_to = (row + 7, row + 5) if castle == 'O-O' else (row, row + 3)
+            undo.extend([(r, squares[r]), (r_to, squares[r_to])])
+            squares[r_to], squares[r] = squares[r], EMPTY
+        squares[src] = EMPTY
+        squares[dest] = _code(self.white, promotion) if promotion else code
+        return undo
+
+    def _unmake(self, undo):
+        for square, code in reversed(undo):
+            self.squares[square] = code
+
+    def _king(self, white):
+        return self.squares.index(_code(white, 'K'))
+
+    def legal_moves(self):
+        """legal_moves returns moves which do not leave the own king in check."""
+        moves = []
+        for move in self._pseudo_moves():
+            undo = self._make(move)
+            if not is_attacked(self.squares, self._king(self.white), not self.white):
+                moves.append(move)
+            self._unmake(undo)
+        return moves
+
+    def san(self, move, moves):
+        """san returns SAN of move without check suffix."""
+        src, dest, promotion, castle = move
+        if castle:
+            return castle
+        code = self.squares[src]
+        letter = SAN_LETTERS[code]
+        capture = bool(self.squares[dest]) or (letter == 'P' and dest == self.ep)
+        to = SQUARE_NAMES[dest]
+        if letter == 'P':
+            san = (SQUARE_NAMES[src][0] + 'x' + to) if capture else to
+            return san + ('=' + promotion if promotion else '')
+        others = [m[0] for m in moves
+                  if m[1] == dest and m[0] != src and self.squares[m[0]] == code]
+        key = ''
+        if others:
+            name = SQUARE_NAMES[src]
+            if all(SQUARE_NAMES[s][0] != name[0] for s in others):
+                key = name[0]
+            elif all(SQUARE_NAMES[s][1] != name[1] for s in others):
+                key = name[1]
+            else:
+                key = name
+        return letter + key + ('x' if capture else '') + to
+
+    def _weight(self, move):
+        src, dest, promotion, castle = move
+        if castle or promotion == 'Q':
+            return 8
+        if self.squares[dest]:
+            return 4
+        if SAN_LETTERS[self.squares[src]] == 'P':
+            return 2
+        return 1
+
+    def push(self, move, san):
+        """push plays move, updating castling rights and en passant square."""
+        src, dest = move[0], move[1]
+        letter = SAN_LETTERS[self.squares[src]]
+        self._make(move)
+        for square in (src, dest):
+            self.castling.discard({0: 'Q', 7: 'K', 56: 'q', 63: 'k'}.get(square))
+        if letter == 'K':
+            self.castling -= set('KQ' if self.white else 'kq')
+        self.ep = (src + dest) // 2 if letter == 'P' and abs(dest - src) == 16 else None
+        self.white = not self.white
+        return san
+
+    def play(self, max_plies):
+        """play returns `SyntheticRecord` of a game of at most `max_plies` plies."""
+        sans, alternatives = [], []
+        moves = self.legal_moves()
+        while moves and len(sans) < max_plies:
+            move = self.rng.choices(moves, weights=[self._weight(m) for m in moves])[0]
+            san = self.san(move, moves)
+            alternatives.append(self.san(self.rng.choice(moves), moves))
+            self.push(move, san)
+            moves = self.legal_moves()
+            if is_attacked(self.squares, self._king(self.white), not self.white):
+                san += '+' if moves else '#'
+            sans.append(san)
+            if sum(1 for c in self.squares if c) == 2:
+                # bare kings.
+                return SyntheticRecord(sans, '1/2-1/2', alternatives)
+        if moves:
+            result = '*'
+        elif sans[-1].endswith('#'):
+            result = '0-1' if self.white else '1-0'
+        else:
+            result = '1/2-1/2'
+        return SyntheticRecord(sans, result, alternatives)
+
+
+def generate_games(count, seed=0, min_plies=60, max_plies=240):
+    """generate_games returns `count` games as `SyntheticRecord`, the same for the same seed."""
+    rng = random.Random(seed)
+    return [SyntheticGame(rng).play(rng.randint(min_plies, max_plies)) for _ in range(count)]
+
+
+def to_pgn(games, seed=0):
+    """to_pgn returns PGN text of games, with tags, comments, NAGs and variations sprinkled in."""
+    rng = random.Random(seed)
+    chunks = []
+    for i, (moves, result, alternatives) in enumerate(games):
+        tags = [('Event', 'Synthetic'), ('Site', '?'),
+                ('Date', '2019.10.{:02d}'.format(i % 28 + 1)), ('Round', str(i + 1)),
+                ('White', 'Player "{}"'.format(2 * i)), ('Black', 'Player {}'.format(2 * i + 1)),
+                ('Result', result)]
+        chunks.extend('[{} "{}"]\n'.format(k, v.replace('"', '\\"')) for k, v in tags)
+        chunks.append('\n')
+        tokens = []
+        for ply, san in enumerate(moves):
+            if ply % 2 == 0:
+                tokens.append('{}.'.format(ply // 2 + 1))
+            tokens.append(san)
+            roll = rng.random()
+            if roll < 0.03:
+                tokens.append('{a comment on %s}' % san)
+            elif roll < 0.05:
+                tokens.append('$' + str(rng.randint(1, 6)))
+            elif roll < 0.06:
+                tokens.append('({}{} {})'.format(ply // 2 + 1, '...' if ply % 2 else '.',
+                                                 alternatives[ply]))
+        tokens.append(result)
+        line = []
+        for token in tokens:
+            if sum(len(t) + 1 for t in line) + len(token) > 79:
+                chunks.append(' '.join(line) + '\n')
+                line = []
+            line.append(token)
+        chunks.append(' '.join(line) + '\n\n')
+    return ''.join(chunks)
+
+
+def main():
+    """The main function."""
+    parser = argparse.ArgumentParser('corpus.py')
+    parser.add_argument('-n', '--games', default=10, type=int, help='number of games')
+    parser.add_argument('-s', '--seed', default=0, type=int, help='random seed')
+    parser.add_argument('-o', '--out', help='PGN file to write, default stdout')
+    args = parser.parse_args()
+
+    text = to_pgn(generate_games(args.games, seed=args.seed), seed=args.seed)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+
+if __name__ == '__main__':
+    main()
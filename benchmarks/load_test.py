@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Load test of `main.py serve` on localhost.
+
+It posts games made by `corpus.py` with `-c` connections in parallel, each
+of them keeps its connection alive, and reports latency percentiles,
+throughput and counts of response status.
+
+    python main.py serve -j 4 &
+    python benchmarks/load_test.py [-n REQUESTS] [-c CONNECTIONS] [--port PORT]
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import generate_games, to_pgn  # noqa: E402
+
+
+async def post(reader, writer, host, path, body):
+    """post sends a request on the connection, returns status and body of the response."""
+    writer.write('POST {} HTTP/1.1\r\nHost: {}\r\nContent-Length: {}\r\n\r\n'.format(
+        path, host, len(body)).encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def client(args, bodies, queue, latencies, statuses):
+    """client posts bodies taken from queue on one connection."""
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    try:
+        while not queue.empty():
+            i = queue.get_nowait()
+            start = time.perf_counter()
+            status, _ = await post(reader, writer, args.host, args.path, bodies[i % len(bodies)])
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+    finally:
+        writer.close()
+
+
+def percentile(values, p):
+    """percentile returns the p-th percentile of values, nearest rank."""
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+async def run(args):
+    """run posts requests and prints the report."""
+    games = generate_games(args.games, seed=args.seed)
+    bodies = [to_pgn([g]).encode('utf-8') for g in games]
+    queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+    latencies, statuses = [], Counter()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(args, bodies, queue, latencies, statuses)
+                           for _ in range(args.connections)))
+    elapsed = time.perf_counter() - start
+
+    print('{} requests, {} connections, {:.2f}s, {:.1f} requests/s'.format(
+        len(latencies), args.connections, elapsed, len(latencies) / elapsed))
+    print('latency p50 {:.1f} ms, p90 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+        *(percentile(latencies, p) * 1e3 for p in (50, 90, 99, 100))))
+    print('status', dict(sorted(statuses.items())))
+
+
+def main():
+    """The main function."""
+    parser = argparse.ArgumentParser('load_test.py')
+    parser.add_argument('--host', default='127.0.0.1', help='address of the server')
+    parser.add_argument('-p', '--port', default=8080, type=int, help='port of the server')
+    parser.add_argument('--path', default='/render', help='path and query of requests')
+    parser.add_argument('-n', '--requests', default=200, type=int, help='number of requests')
+    parser.add_argument('-c', '--connections', default=8, type=int,
+                        help='number of connections posting in parallel')
+    parser.add_argument('-g', '--games', default=20, type=int,
+                        help='number of distinct synthetic games posted')
+    parser.add_argument('-s', '--seed', default=0, type=int, help='random seed of the games')
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite timing each stage of GIF generation on a synthetic corpus.
+
+Stages are measured on their own:
+
+    tokenize  `chess.codec.parse_games` on a multi-game PGN text, per game
+    replay    `chess.game.Game.apply` over every move, per ply
+    compose   `chess.board.Board.iter_frames`, per frame
+    encode    `chess.codec.save_image_to_file` of palette frames, per frame
+
+Each stage reports the best time per unit over rounds. With `--baseline`
+results are compared against a JSON file written by `--save`, and the run
+fails when a stage is slower than baseline by more than `--threshold`.
+
+    python benchmarks/suite.py [--font_path FONT_PATH] [--baseline FILE] [--save FILE]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.join(BENCH_DIR, os.pardir)]
+
+from corpus import generate_games, to_pgn  # noqa: E402
+
+from chess import list_supported_state_files  # noqa: E402
+from chess.assets import FONT_PATH  # noqa: E402
+from chess.board import Board  # noqa: E402
+from chess.codec import load_state_from_file, parse_games, save_image_to_file  # noqa: E402
+from chess.game import Game  # noqa: E402
+
+
+STAGES = ('tokenize', 'replay', 'compose', 'encode')
+
+
+def best_of(rounds, func):
+    """best_of returns the shortest elapsed seconds of calling func."""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_tokenize(ctx, rounds):
+    """bench_tokenize parses the corpus PGN text."""
+    text = ctx['text']
+    elapsed = best_of(rounds, lambda: sum(1 for _ in parse_games(io.StringIO(text))))
+    return elapsed, len(ctx['games']), 'game'
+
+
+def bench_replay(ctx, rounds):
+    """bench_replay replays every game."""
+    state, games = ctx['state'], ctx['games']
+
+    def replay():
+        for record in games:
+            game = Game(state)
+            for move in record.moves:
+                game.apply(move)
+
+    elapsed = best_of(rounds, replay)
+    return elapsed, sum(len(g.moves) for g in games), 'ply'
+
+
+def bench_compose(ctx, rounds):
+    """bench_compose composes palette frames of the first games."""
+    board, state, games = ctx['board'], ctx['state'], ctx['games'][:ctx['render_games']]
+
+    def compose():
+        for record in games:
+            board.reset(state)
+            for _ in board.iter_frames(record.moves):
+                pass
+
+    elapsed = best_of(rounds, compose)
+    return elapsed, sum(len(g.moves) + 1 for g in games), 'frame'
+
+
+def bench_encode(ctx, rounds):
+    """bench_encode encodes frames of the first game to a GIF file."""
+    board, state = ctx['board'], ctx['state']
+    board.reset(state)
+    frames = [f.copy() for f in board.iter_frames(ctx['games'][0].moves)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'bench.gif')
+        elapsed = best_of(rounds, lambda: save_image_to_file(path, frames, 1.0,
+                                                             palette=board.palette))
+    return elapsed, len(frames), 'frame'
+
+
+BENCHES = {'tokenize': bench_tokenize, 'replay': bench_replay, 'compose': bench_compose,
+           'encode': bench_encode}
+
+
+def compare(results, baseline, threshold):
+    """compare prints results against baseline, returns names of regressed stages."""
+    regressed = []
+    for stage, result in results.items():
+        base = baseline.get('stages', {}).get(stage)
+        if base is None:
+            print('{:<10} {:10.2f} us/{:<6} (no baseline)'.format(
+                stage, result['us'], result['unit']))
+            continue
+        ratio = result['us'] / base['us']
+        status = 'ok'
+        if ratio > 1 + threshold:
+            status = 'REGRESSED'
+            regressed.append(stage)
+        print('{:<10} {:10.2f} us/{:<6} baseline {:10.2f} {:6.2f}x {}'.format(
+            stage, result['us'], result['unit'], base['us'], ratio, status))
+    return regressed
+
+
+def main():
+    """The main function."""
+    parser = argparse.ArgumentParser('suite.py')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES),
+                        help='stages to run')
+    parser.add_argument('-n', '--games', default=60, type=int, help='number of synthetic games')
+    parser.add_argument('--render_games', default=4, type=int,
+                        help='number of games composed by the compose stage')
+    parser.add_argument('-s', '--seed', default=0, type=int, help='random seed of the corpus')
+    parser.add_argument('-R', '--rounds', default=5, type=int, help='rounds of measurement')
+    parser.add_argument('--font_path', default=FONT_PATH,
+                        help='path of the display font used in board, default: bundled Lato')
+    parser.add_argument('--baseline', help='JSON results to compare with, fail on regression')
+    parser.add_argument('--threshold', default=0.25, type=float,
+                        help='allowed slowdown against baseline, 0.25 for 25%%')
+    parser.add_argument('--save', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    games = generate_games(args.games, seed=args.seed)
+    ctx = dict(games=games, text=to_pgn(games, seed=args.seed), render_games=args.render_games,
+               state=load_state_from_file(list_supported_state_files()['default']))
+    print('corpus: {} games, {} plies, {} bytes, generated in {:.1f}s'.format(
+        len(games), sum(len(g.moves) for g in games), len(ctx['text']),
+        time.perf_counter() - start))
+    if {'compose', 'encode'} & set(args.stages):
+        ctx['board'] = Board(ctx['state'], font_path=args.font_path, show_copyright=False)
+
+    results = {}
+    for stage in STAGES:
+        if stage in args.stages:
+            elapsed, units, unit = BENCHES[stage](ctx, args.rounds)
+            results[stage] = {'us': elapsed / units * 1e6, 'unit': unit, 'units': units}
+
+    corpus = {'games': args.games, 'seed': args.seed}
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('corpus') != corpus:
+            print('warning: baseline corpus {} differs from {}'.format(
+                baseline.get('corpus'), corpus))
+    regressed = compare(results, baseline, args.threshold)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'corpus': corpus,
+                       'python': platform.python_version(), 'machine': platform.machine(),
+                       'stages': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if regressed:
+        print('regressed over {:.0%}: {}'.format(args.threshold, ', '.join(regressed)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -30,6 +30,12 @@ ROWS = [chr(ord('1') + i) for i in range(8)]
 
 EMPTY_STATE = 'empty'
 
+# FILE_MODE is the mode files are created with under the umask of the process, files written to
+# a temporary file first, by `tempfile.mkstemp`, are given it before they replace their target.
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
 
 def list_supported_state_files():
     """load_supported_states returns predefined state dict."""
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""archive module packs games into a binary file, games are replayed from it without PGN.
+
+An archive file is laid out as:
+
+    ARCHIVE_HEADER  magic, version, sizes, counts, side to move first, initial squares
+    GAME_ENTRY      one per game: number of its first move, plies, source number, game index
+    MOVE            one per ply: origin, destination, piece code of a promotion or 0
+    names           source names, UTF-8, one per line
+
+Moves are resolved from SAN once, when packing. `Archive` maps the file and
+finds game N by its entry, the moves it returns are made by `Game.apply`
+as they are, with no text parsed and no SAN resolved.
+"""
+
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+from . import FILE_MODE
+from .codec import load_games_from_bytes
+from .game import Game, Position
+
+
+LOGGER = logging.getLogger('ROOT')
+
+ARCHIVE_VERSION = 1
+ARCHIVE_MAGIC = b'CPGA'
+# ARCHIVE_HEADER is magic, version, entry size, move size, number of games, number of sources,
+# offset of names, whether white runs first and piece codes of the initial squares.
+ARCHIVE_HEADER = struct.Struct('<4sHHHIIQ?64s')
+# GAME_ENTRY is number of the first move, plies, source number and game index in the source.
+GAME_ENTRY = struct.Struct('<QIII')
+# MOVE is origin, destination and promotion code of a move, like `Game.last`.
+MOVE = struct.Struct('<BBB')
+
+
+def archive_moves_of_bytes(data, state, is_white_run=True, strict=True):
+    """archive_moves_of_bytes resolves the moves of every game of PGN content to MOVE records.
+
+    It returns `(chunk, games, errors)`, `chunk` holds the records of games
+    one after another and `games` their `(game index, plies)`. With `strict`
+    moves are replayed by `Game(validate=True)`. A game with a move which can
+    not be made is left out, `(game index, ply, move, message)` is added to
+    `errors`.
+    """
+    chunks, games, errors = [], [], []
+    pack = MOVE.pack
+    for index, pgn_game in enumerate(load_games_from_bytes(data)):
+        game = Game(state, is_white_run=is_white_run, validate=strict)
+        records = []
+        for ply, move in enumerate(pgn_game.moves, 1):
+            try:
+                game.apply(move)
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append((index, ply, move, '{}: {}'.format(type(e).__name__, e)))
+                break
+            records.append(pack(*game.last))
+        else:
+            chunks += records
+            games.append((index, len(records)))
+    return b''.join(chunks), games, errors
+
+
+class ArchiveWriter():
+    """ArchiveWriter writes an archive to `path`, source by source.
+
+    Move records are spooled to a temporary file next to `path`, `close`
+    writes header and entries in front of them and replaces `path` at once.
+    Used as a context manager, nothing is written when an exception is raised.
+    """
+
+    def __init__(self, path, state, is_white_run=True):
+        self.path = path
+        self.squares = bytes(Position.from_state(state).squares)
+        self.is_white_run = is_white_run
+        self.names, self.entries, self.moves = [], [], 0
+        fd, self.spool_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                               suffix='.tmp')
+        self.spool = os.fdopen(fd, 'w+b')
+
+    def add(self, name, chunk, games):
+        """add appends games of source `name`, `chunk` and `games` of `archive_moves_of_bytes`."""
+        source = len(self.names)
+        self.names.append(name)
+        self.spool.write(chunk)
+        for index, plies in games:
+            self.entries.append((self.moves, plies, source, index))
+            self.moves += plies
+
+    def close(self):
+        """close writes the archive and removes the spooled moves."""
+        names = '\n'.join(self.names).encode('utf-8')
+        moves_offset = ARCHIVE_HEADER.size + len(self.entries) * GAME_ENTRY.size
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                        suffix='.tmp')
+        try:
+            os.chmod(tmp_path, FILE_MODE)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(ARCHIVE_HEADER.pack(
+                    ARCHIVE_MAGIC, ARCHIVE_VERSION, GAME_ENTRY.size, MOVE.size,
+                    len(self.entries), len(self.names), moves_offset + self.moves * MOVE.size,
+                    self.is_white_run, self.squares))
+                f.write(b''.join(GAME_ENTRY.pack(*entry) for entry in self.entries))
+                self.spool.seek(0)
+                shutil.copyfileobj(self.spool, f)
+                f.write(names)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        finally:
+            self.discard()
+
+    def discard(self):
+        """discard removes the spooled moves, the archive is not written."""
+        if not self.spool.closed:
+            self.spool.close()
+            os.unlink(self.spool_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class Archive():
+    """Archive reads an archive file through `mmap`, a game is found in O(1) by its entry.
+
+    `state` and `is_white_run` are what games were replayed from when
+    packed, `names` are the source names and `stat` the `os.stat_result` of
+    the file when it was mapped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, entry_size, move_size, self.count, sources, names_offset,
+             self.is_white_run, squares) = ARCHIVE_HEADER.unpack_from(self.data)
+        except struct.error:
+            magic = None
+        if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION or \
+                (entry_size, move_size) != (GAME_ENTRY.size, MOVE.size):
+            self.data.close()
+            raise ValueError('"{}" is not an archive of version {}'.format(path, ARCHIVE_VERSION))
+        self.state = Position(squares).to_state()
+        self.names = self.data[names_offset:].decode('utf-8').split('\n') if sources else []
+        self._moves_offset = ARCHIVE_HEADER.size + self.count * GAME_ENTRY.size
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, n):
+        """entry returns `(source name, game index, plies)` of game n."""
+        _, plies, source, index = self._entry(n)
+        return self.names[source], index, plies
+
+    def _entry(self, n):
+        if not 0 <= n < self.count:
+            raise IndexError('game {} out of {} games'.format(n, self.count))
+        return GAME_ENTRY.unpack_from(self.data, ARCHIVE_HEADER.size + n * GAME_ENTRY.size)
+
+    def records(self, n):
+        """records returns the MOVE records of game n as bytes."""
+        first, plies = self._entry(n)[:2]
+        start = self._moves_offset + first * MOVE.size
+        return self.data[start:start + plies * MOVE.size]
+
+    def moves(self, n):
+        """moves returns the moves of game n, `(origin, destination, promotion)` tuples."""
+        return list(MOVE.iter_unpack(self.records(n)))
+
+    def close(self):
+        """close unmaps the file."""
+        self.data.close()
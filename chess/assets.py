@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""assets module keeps images and fonts of boards, each of them is loaded once per process.
+
+Assets are plain objects in memory, no file is kept open and nothing is
+locked, so a registry filled before worker processes are forked is shared
+by them, copy-on-write. Assets must not be modified by their users.
+"""
+
+import logging
+import os
+
+from PIL import Image, ImageFont
+
+
+LOGGER = logging.getLogger('ROOT')
+
+ICONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'asset')
+# FONT_PATH is the font shipped with the package, Lato under the SIL Open Font License.
+FONT_PATH = os.path.join(ICONS_DIR, 'Lato-Regular.ttf')
+
+
+class AssetRegistry():
+    """AssetRegistry maps keys to assets, an asset is created on first use of its key."""
+
+    def __init__(self):
+        self.assets = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, create):
+        """get returns the asset of key, calling `create()` to make it if there is none."""
+        asset = self.assets.get(key)
+        if asset is None:
+            self.misses += 1
+            LOGGER.debug('create asset %s', key[0])
+            asset = self.assets[key] = create()
+        else:
+            self.hits += 1
+        return asset
+
+    def font(self, font_path, size):
+        """font returns the TrueType font of path and size."""
+        return self.get(('font', font_path, size), lambda: ImageFont.truetype(font_path, size))
+
+    def piece(self, name, edge=None):
+        """piece returns the RGBA image of chesspiece `name`, e.g. `wk`, resampled to `edge`."""
+        def load():
+            with Image.open(os.path.join(ICONS_DIR, name + '.png')) as image:
+                return image.convert('RGBA')
+
+        def resample():
+            image = self.piece(name)
+            if image.size == (edge, edge):
+                return image
+            return image.resize((edge, edge), Image.LANCZOS)
+
+        if edge is None:
+            return self.get(('piece', name), load)
+        return self.get(('piece', name, edge), resample)
+
+    def clear(self):
+        """clear drops every asset."""
+        self.assets.clear()
+
+
+# ASSETS is the registry of current process.
+ASSETS = AssetRegistry()
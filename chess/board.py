@@ -2,13 +2,15 @@
 """board module contains classes and functions used while rendering board image."""
 
 import logging
-import os
+from collections import namedtuple
+from functools import partial
 
+from PIL import Image, ImageColor, ImageDraw
+from numpy import array, asarray, concatenate, empty, frombuffer, int32, stack, uint8, unique, zeros
 
-from PIL import Image, ImageDraw, ImageFont
-from numpy import array
-
-from .game import Game
+from .assets import ASSETS
+from .cache import cache_key
+from .game import Game, SQUARE_NAMES, PIECE_NAMES
 from . import COLORS, PIECES
 
 
@@ -19,153 +21,330 @@ SQUARE_EDGE = BOARD_EDGE // 8
 # text font
 FONT_SIZE = 15
 BOARD_MARGIN = 20
+# board image, margins included
+BOARD_SIZE = BOARD_EDGE + 2 * BOARD_MARGIN
 
 
 def _get_text_loc(text, font, box):
     box_width, box_height = box[0], box[1]
-    text_width, text_height = font.getsize(text)
+    # right and bottom of the box drawn from (0, 0) are what `getsize`, gone in Pillow 10, gave.
+    _, _, text_width, text_height = font.getbbox(text)
     left = (box_width - text_width) // 2
     top = (box_height - text_height) // 2
     return left, top
 
 
 def _show_copyright(initial_board, text='头条@淞南北丁巷',
-                    font_path='/Library/Fonts/Arial Unicode.ttf'):
-    font_size = int(FONT_SIZE * 2.5)
+                    font_path='/Library/Fonts/Arial Unicode.ttf', font_size=FONT_SIZE):
+    font_size = int(font_size * 2.5)
     LOGGER.debug('setup copyright font by "%s", size %s', font_path, font_size)
 
     board_image = initial_board.copy()
     draw = ImageDraw.Draw(board_image)
-    ttfont = ImageFont.truetype(font_path, font_size)
-    left, top = _get_text_loc(text, ttfont,
-                              (BOARD_EDGE + 2 * BOARD_MARGIN, BOARD_EDGE + 2 * BOARD_MARGIN))
+    ttfont = ASSETS.font(font_path, font_size)
+    left, top = _get_text_loc(text, ttfont, board_image.size)
     draw.text((left, top), text, fill=(255, 0, 0), font=ttfont)
 
     return board_image
 
 
-def coordinates_of_square(crd):
+def to_indices(image, palette):
+    """to_indices maps each pixel of RGB image to the index of the nearest color in palette."""
+    pixels = asarray(image, dtype=uint8)
+    rgb = pixels.reshape(-1, 3).astype(int32)
+    packed, inverse = unique((rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2], return_inverse=True)
+    colors = stack([packed >> 16, (packed >> 8) & 0xff, packed & 0xff], axis=1)
+    palette = frombuffer(bytes(palette), dtype=uint8).reshape(-1, 3).astype(int32)
+    distance = ((colors[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2)
+    return distance.argmin(axis=1).astype(uint8)[inverse.reshape(-1)].reshape(pixels.shape[:2])
+
+
+def coordinates_of_square(crd, square_edge=SQUARE_EDGE, board_margin=BOARD_MARGIN):
     """coordinates_of_square convert coordinations of square in board to pixel in image."""
     col = ord(crd[0]) - ord('a')
     row = int(crd[1]) - 1
-    return (col * SQUARE_EDGE + BOARD_MARGIN, (7 - row) * SQUARE_EDGE + BOARD_MARGIN)
+    return (col * square_edge + board_margin, (7 - row) * square_edge + board_margin)
+
+
+# SQUARE_COORDINATES maps square index to pixel in image.
+SQUARE_COORDINATES = tuple(coordinates_of_square(s) for s in SQUARE_NAMES)
+
+# Geometry holds pixel sizes of a board image, `coordinates` maps square index to pixel.
+Geometry = namedtuple('Geometry', ['size', 'square_edge', 'board_edge', 'board_margin',
+                                   'font_size', 'coordinates'])
+
+
+def geometry_of_size(size=BOARD_SIZE):
+    """geometry_of_size returns `Geometry` of a board image `size` pixels wide, margins included.
+
+    Squares, margins and fonts are scaled from the default 520 pixels, the
+    image is a pixel smaller when the margins can not be split evenly.
+    """
+    square_edge = round(size * SQUARE_EDGE / BOARD_SIZE)
+    if square_edge < 4:
+        raise ValueError('board size {} is too small'.format(size))
+    board_margin = (size - 8 * square_edge) // 2
+    return Geometry(8 * square_edge + 2 * board_margin, square_edge, 8 * square_edge,
+                    board_margin, max(round(FONT_SIZE * square_edge / SQUARE_EDGE), 1),
+                    tuple(coordinates_of_square(s, square_edge, board_margin)
+                          for s in SQUARE_NAMES))
+
+
+# DEFAULT_GEOMETRY is the geometry of module constants.
+DEFAULT_GEOMETRY = geometry_of_size()
+# SQUARE_SHADES maps square index to 0 for white square, 1 for black square.
+SQUARE_SHADES = tuple(0 if ((s & 7) + (s >> 3)) % 2 else 1 for s in range(64))
+# EMPTY_SQUARES are squares of the empty board.
+EMPTY_SQUARES = bytes(64)
+# COLOR_ASSETS are attributes of a board which depend on colors, font and size only.
+COLOR_ASSETS = ('white_square', 'black_square', 'tiles', 'tile_arrays', 'palette',
+                'tile_indices', 'background', 'background_indices', 'render_key')
+
+
+def changed_box(current, previous, geometry=DEFAULT_GEOMETRY):
+    """changed_box returns pixel box `(left, top, right, bottom)` of squares which differ."""
+    coordinates, square_edge = geometry.coordinates, geometry.square_edge
+    box = [geometry.size, geometry.size, 0, 0]
+    for square in range(64):
+        if current[square] != previous[square]:
+            left, top = coordinates[square]
+            box = [min(box[0], left), min(box[1], top),
+                   max(box[2], left + square_edge), max(box[3], top + square_edge)]
+    return tuple(box) if box[2] else (0, 0, 0, 0)
 
 
 class Board():  # pylint: disable=too-few-public-methods
-    """Board is a class that represents chess board."""
+    """Board is a class that represents chess board.
+
+    Set `metrics` to a `chess.metrics.Metrics` to time replay, composition
+    and conversion of frames.
+
+    `size` is the width of board image in pixels, margins included, see
+    `geometry_of_size`.
+
+    Fonts, chesspiece images, tiles, palette, background and copyright slide
+    are kept in `chess.assets.ASSETS`, boards of the same colors, font and
+    size share them, so creating a board or rendering another game redraws
+    none. Chesspiece images are resampled once per size.
+    """
 
     def __init__(self, init_state,  # pylint: disable=too-many-arguments
                  white_color='#EAE9D2', black_color='#4B7399',
                  font_path='/Library/Fonts/Arial.ttf',
                  is_white_run=True,
                  show_copyright=True,
-                 verbose=False):
+                 verbose=False,
+                 size=BOARD_SIZE):
         self.verbose = verbose
         self.show_copyright = show_copyright
-        # initialize black and white squares.
-        LOGGER.debug('setup squares by white color "%s", black color "%s"',
-                     white_color, black_color)
-        self.white_square = Image.new(
-            'RGBA', (SQUARE_EDGE, SQUARE_EDGE), white_color)
-        self.black_square = Image.new(
-            'RGBA', (SQUARE_EDGE, SQUARE_EDGE), black_color)
+        self.font_path = font_path
+        self.metrics = None
+        self.geometry = geometry_of_size(size)
+        square_edge = self.geometry.square_edge
 
         # initialize font.
-        LOGGER.debug('setup border font by "%s", size %s', font_path, FONT_SIZE)
-        self.ttfont = ImageFont.truetype(font_path, FONT_SIZE)
+        LOGGER.debug('setup border font by "%s", size %s', font_path, self.geometry.font_size)
+        self.ttfont = ASSETS.font(font_path, self.geometry.font_size)
 
         # load chess images, king, queen, bishop, knight, rock and pawn.
-        icons_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'asset')
-        LOGGER.debug('setup chess icon by loading images from path "%s"', icons_dir)
-        self.chesspieces = {c + p: Image.open(os.path.join(icons_dir, c + p + '.png'))
+        LOGGER.debug('setup chess icon, size %s', square_edge)
+        self.chesspieces = {c + p: ASSETS.piece(c + p, square_edge)
                             for c in COLORS for p in PIECES}
 
+        self.set_colors(white_color, black_color)
         self.game = Game(init_state, is_white_run=is_white_run)
 
-    def _clear(self, image, crd):
-        if (crd[0] < (BOARD_EDGE + BOARD_MARGIN) and
-                crd[1] < (BOARD_EDGE + BOARD_MARGIN)):
-            if (crd[0] + crd[1] - 2 * BOARD_MARGIN) % (SQUARE_EDGE * 2) == 0:
-                image.paste(self.white_square, crd, self.white_square)
-            else:
-                image.paste(self.black_square, crd, self.black_square)
+    def set_colors(self, white_color, black_color):
+        """set_colors sets square colors, the tile atlas, palette and background of them."""
+        self.asset_key = (white_color, black_color, self.font_path, self.geometry.size)
+        assets = ASSETS.get(('colors',) + self.asset_key,
+                            partial(self._create_colors, white_color, black_color))
+        for name, value in assets.items():
+            setattr(self, name, value)
+
+    def preload(self):
+        """preload creates assets which are otherwise created by the first render.
+
+        Call it before forking worker processes, so that they share the assets.
+        """
+        if self.show_copyright:
+            self._copyright_indices()
+
+    def _create_colors(self, white_color, black_color):
+        # returns attributes of COLOR_ASSETS.
+        # initialize black and white squares.
+        LOGGER.debug('setup squares by white color "%s", black color "%s"',
+                     white_color, black_color)
+        square_edge = self.geometry.square_edge
+        self.white_square = Image.new(
+            'RGBA', (square_edge, square_edge), white_color)
+        self.black_square = Image.new(
+            'RGBA', (square_edge, square_edge), black_color)
+
+        # tiles[shade][code] is a square of shade with chesspiece code on it, fully composited.
+        LOGGER.debug('setup tile atlas')
+        self.tiles = tuple(tuple(self._create_tile(square, name) for name in PIECE_NAMES)
+                           for square in (self.white_square, self.black_square))
+        # tile_arrays holds the same tiles as `square_edge x square_edge x 3` arrays.
+        self.tile_arrays = tuple(tuple(array(tile) for tile in row) for row in self.tiles)
+
+        # background is the empty board with coordinates, background_indices is its indices.
+        LOGGER.debug('setup background')
+        self.background = self._draw_background()
+
+        # palette is the global palette, 256 RGB triples, used by palette-indexed frames.
+        LOGGER.debug('setup palette')
+        self.palette = self._create_palette(white_color, black_color)
+        # tile_indices holds the same tiles as `square_edge x square_edge` palette indices.
+        self.tile_indices = tuple(tuple(to_indices(tile, self.palette) for tile in row)
+                                  for row in self.tile_arrays)
+        self.background_indices = to_indices(self.background, self.palette)
+        # render_key identifies everything but positions that a frame depends on.
+        geometry = self.geometry
+        self.render_key = cache_key(self.palette, self.font_path, str(geometry.font_size),
+                                    str(geometry.board_edge), str(geometry.board_margin))
+        return {name: getattr(self, name) for name in COLOR_ASSETS}
+
+    def _create_palette(self, white_color, black_color):
+        # square, text, copyright and background colors are kept exactly, so
+        # are copyright text edges blended onto squares, the rest of palette
+        # is quantized from tiles and board margins.
+        squares = [ImageColor.getrgb(c)[:3] for c in (white_color, black_color)]
+        red = (255, 0, 0)
+        reserved = []
+        for rgb in squares + [(255, 255, 255), red, (0, 0, 0)] + [
+                tuple((a * r + (8 - a) * c) // 8 for r, c in zip(red, color))
+                for color in squares for a in range(1, 8)]:
+            if list(rgb) not in reserved:
+                reserved.append(list(rgb))
+
+        pixels = concatenate([tile.reshape(-1, 3) for row in self.tile_arrays for tile in row] +
+                             [asarray(self.background).reshape(-1, 3)])
+        sample = Image.fromarray(pixels.reshape(-1, 1, 3)).quantize(256 - len(reserved))
+        quantized = sample.getpalette()[:3 * len(sample.getcolors())]
+
+        palette = zeros((256, 3), dtype=uint8)
+        colors = reserved + [quantized[i:i + 3] for i in range(0, len(quantized), 3)]
+        palette[:len(colors)] = colors
+        return bytes(palette)
+
+    def _create_tile(self, square, piece):
+        tile = Image.new('RGB', (self.geometry.square_edge, self.geometry.square_edge))
+        tile.paste(square, (0, 0), square)
+        if piece:
+            img = self.chesspieces[piece]
+            tile.paste(img, (0, 0), img)
+        return tile
+
+    def reset(self, init_state, is_white_run=True):
+        """reset puts the game back to `init_state` before rendering another game."""
+        self.game = Game(init_state, is_white_run=is_white_run)
+
+    def _draw_square(self, image, square, code):
+        image.paste(self.tiles[SQUARE_SHADES[square]][code], self.geometry.coordinates[square])
 
     def _init_board(self):
+        """_init_board returns the empty board, which must not be modified."""
+        return self.background
 
+    def _draw_background(self):
         # initialize board.
-        width, height = BOARD_EDGE + 2 * BOARD_MARGIN, BOARD_EDGE + 2 * BOARD_MARGIN
+        square_edge, board_edge, board_margin = self.geometry[1:4]
+        width, height = self.geometry.size, self.geometry.size
         LOGGER.debug('setup board size by width "%s px", height "%s px"', width, height)
         initial_board = Image.new('RGB', (width, height))
         draw = ImageDraw.Draw(initial_board)
 
         # draw empty board.
         LOGGER.debug('draw empty board squares')
-        for i in range(0 + BOARD_MARGIN, BOARD_EDGE + 2 * BOARD_MARGIN, SQUARE_EDGE):
-            for j in range(0 + BOARD_MARGIN, BOARD_EDGE + 2 * BOARD_MARGIN, SQUARE_EDGE):
-                self._clear(initial_board, (i, j))
+        for square in range(64):
+            self._draw_square(initial_board, square, 0)
 
         # draw text.
         LOGGER.debug('draw cord text on board margins')
         for i in range(8):
-            col = SQUARE_EDGE * i
+            col = square_edge * i
             text = chr(ord('a') + i)
-            left, top = _get_text_loc(text, self.ttfont, (SQUARE_EDGE, BOARD_MARGIN))
+            left, top = _get_text_loc(text, self.ttfont, (square_edge, board_margin))
             # draw top 'a' to 'h'
             draw.text(
-                (col + BOARD_MARGIN + left, top), text,
+                (col + board_margin + left, top), text,
                 fill=(255, 255, 255), font=self.ttfont)
             # draw bottom 'a' to 'h'
             draw.text(
-                (col + BOARD_MARGIN + left, BOARD_EDGE + BOARD_MARGIN),
+                (col + board_margin + left, board_edge + board_margin),
                 text, fill=(255, 255, 255), font=self.ttfont)
 
             text = chr(ord('8') - i)
-            left, top = _get_text_loc(text, self.ttfont, (BOARD_MARGIN, SQUARE_EDGE))
+            left, top = _get_text_loc(text, self.ttfont, (board_margin, square_edge))
             # draw left '1' to '8'
             draw.text(
-                (left, BOARD_MARGIN + col + top),
+                (left, board_margin + col + top),
                 text, fill=(255, 255, 255), font=self.ttfont)
             draw.text(
-                (BOARD_EDGE + BOARD_MARGIN + left, BOARD_MARGIN + col + top),
+                (board_edge + board_margin + left, board_margin + col + top),
                 text, fill=(255, 255, 255), font=self.ttfont)
 
         return initial_board
 
+    def _copyright_image(self):
+        return ASSETS.get(('copyright',) + self.asset_key,
+                          lambda: _show_copyright(self.background,
+                                                  font_size=self.geometry.font_size))
+
+    def _copyright_indices(self):
+        return ASSETS.get(('copyright_indices',) + self.asset_key,
+                          lambda: to_indices(self._copyright_image(), self.palette))
+
     def _update_state(self, initial_board):
         board_image = initial_board.copy()
         # draw chess.
-        for pos, piece in self.game.state.items():
-            if piece:
-                row = SQUARE_EDGE * (ord(pos[0]) - ord('a'))
-                col = SQUARE_EDGE * (8 - int(pos[1]))
-                img = self.chesspieces[piece]
-                board_image.paste(img, (row + BOARD_MARGIN, col + BOARD_MARGIN), img)
+        for square, code in enumerate(self.game.position.squares):
+            if code:
+                self._draw_square(board_image, square, code)
         return board_image
 
-    def _apply_move(self, board_image, current, previous):
-        changed = [s for s in current.keys() if current[s] != previous[s]]
-
-        for square in changed:
-            crd = coordinates_of_square(square)
-            self._clear(board_image, crd)
-
-            if current[square] != '':
-                pt = current[square]  # pylint: disable=invalid-name
-                img = self.chesspieces[pt]
-                board_image.paste(img, crd, img)
+    def _apply_move(self, frame, current, previous):
+        """_apply_move writes tiles of changed squares into frame array.
+
+        Frame is either RGB or palette-indexed. It returns box `(left, top,
+        right, bottom)` covering changed squares.
+        """
+        tile_arrays = self.tile_arrays if frame.ndim == 3 else self.tile_indices
+        coordinates, square_edge = self.geometry.coordinates, self.geometry.square_edge
+        for square in range(64):
+            code = current[square]
+            if code != previous[square]:
+                left, top = coordinates[square]
+                frame[top:top + square_edge, left:left + square_edge] = \
+                    tile_arrays[SQUARE_SHADES[square]][code]
+        return changed_box(current, previous, self.geometry)
+
+    def _iter_moves(self, moves):
+        """_iter_moves applies moves one by one, yields squares after and before each move."""
+        squares, metrics = self.game.position.squares, self.metrics
+        for move in moves:
+            LOGGER.debug('move %s', move)
+            previous = bytes(squares)
+            if metrics is None:
+                self.game.apply(move)
+            else:
+                mark = metrics.begin()
+                self.game.apply(move)
+                metrics.end('replay', mark)
+            yield squares, previous
 
     def _create_images(self, initial_board, moves):
-        board_image = initial_board.copy()
-        images = [array(board_image)]
+        """_create_images fills one preallocated `(len(moves) + 1, H, W, 3)` array with frames."""
+        first = array(initial_board)
+        frames = empty((len(moves) + 1,) + first.shape, dtype=first.dtype)
+        frames[0] = first
 
-        for move in moves:
-            LOGGER.debug('move %s', move)
-            previous = self.game.state.copy()
-            self.game.apply(move)
-            self._apply_move(board_image, self.game.state, previous)
-            images.append(array(board_image))
+        for i, (current, previous) in enumerate(self._iter_moves(moves), 1):
+            frames[i] = frames[i - 1]
+            self._apply_move(frames[i], current, previous)
 
-        return images
+        return frames
 
     def _print_state(self):
         for pos, chesspiece in self.game.state.items():
@@ -178,20 +357,121 @@ class Board():  # pylint: disable=too-few-public-methods
         empty_board = self._init_board()
         initial_board = self._update_state(empty_board)
 
-        LOGGER.debug('filter out "x" in each move')
-        moves = [x.replace('x', '') for x in moves]
-
         LOGGER.debug('render moves on board')
-        images = self._create_images(initial_board, moves)
+        images = list(self._create_images(initial_board, moves))
         LOGGER.debug('len of images: %s, show_copyright: %s', len(images), self.show_copyright)
 
         if len(images) > 1 and self.show_copyright:
             # avoid appending copyright slide if there is only one image.
             LOGGER.debug('append copyright')
-            _copyright = _show_copyright(empty_board)
+            _copyright = self._copyright_image()
             images += [_copyright] * copyright_slide
 
         if self.verbose:
             self._print_state()
 
         return images
+
+    def iter_plies(self, moves, plies):
+        """iter_plies yields `(ply, frame, box)` of selected plies only, in ascending order.
+
+        `plies` are sorted ply numbers, e.g. of `chess.plies.PlySelection.select`. Moves
+        in between are only replayed, no pixel is touched. Frames are the
+        same as `iter_deltas`, and so is the overwritten array, `box` covers
+        squares changed since the previous selected ply.
+        """
+        squares, metrics = self.game.position.squares, self.metrics
+        frame, drawn, ply = self.background_indices.copy(), EMPTY_SQUARES, 0
+        for target in plies:
+            mark = metrics.begin() if metrics else None
+            while ply < target:
+                self.game.apply(moves[ply])
+                ply += 1
+            if metrics:
+                metrics.end('replay', mark)
+                mark = metrics.begin()
+            self._apply_move(frame, squares, drawn)
+            box = None if drawn is EMPTY_SQUARES else changed_box(squares, drawn, self.geometry)
+            drawn = bytes(squares)
+            if metrics:
+                metrics.end('compose', mark)
+                metrics.add('composed')
+            yield ply, frame, box
+
+        if self.verbose:
+            for move in moves[ply:]:
+                self.game.apply(move)
+            self._print_state()
+
+    def iter_frames(self, moves, copyright_slide=2):
+        """iter_frames yields the frames of `render` one at a time.
+
+        Frames are `H x W` arrays of indices into `palette`. Only one frame is
+        kept in memory, the yielded array is overwritten by the next move, so
+        consume each frame before asking for the next one.
+        """
+        for frame, _ in self.iter_deltas(moves, copyright_slide=copyright_slide):
+            yield frame
+
+    def iter_deltas(self, moves, copyright_slide=2):
+        """iter_deltas yields `(frame, box)` pairs, frames are the same as `iter_frames`.
+
+        `box` is `(left, top, right, bottom)` of the part changed since the
+        previous frame, None stands for the whole frame.
+        """
+        for _, delta in self.iter_keyed_deltas(moves, copyright_slide=copyright_slide):
+            yield delta()
+
+    def iter_keyed_deltas(self, moves, copyright_slide=2):
+        """iter_keyed_deltas yields `(key, delta)` pairs, one per frame of `iter_deltas`.
+
+        `key` identifies the frame by `render_key` and the positions before
+        and after the move, `delta()` composes the frame and returns `(frame,
+        box)`. Frames are composed only when asked for, so a frame found in a
+        cache by its key costs just the replay. Call `delta` before moving on
+        to the next pair.
+        """
+        squares, metrics, geometry = self.game.position.squares, self.metrics, self.geometry
+        frame, drawn = None, None
+
+        def delta(previous):
+            nonlocal frame, drawn
+            mark = metrics.begin() if metrics else None
+            if frame is None:
+                # the first frame is the background with pieces of initial state on it.
+                frame = self.background_indices.copy()
+                drawn = EMPTY_SQUARES
+            self._apply_move(frame, squares, drawn)
+            drawn = bytes(squares)
+            if metrics:
+                metrics.end('compose', mark)
+                metrics.add('composed')
+            return frame, None if previous is None else changed_box(squares, previous, geometry)
+
+        yield cache_key(self.render_key, b'', squares), partial(delta, None)
+
+        LOGGER.debug('render moves on board')
+        count = 1
+        for current, previous in self._iter_moves(moves):
+            count += 1
+            yield cache_key(self.render_key, previous, current), partial(delta, previous)
+        LOGGER.debug('len of images: %s, show_copyright: %s', count, self.show_copyright)
+
+        if count > 1 and self.show_copyright:
+            # avoid appending copyright slide if there is only one image.
+            LOGGER.debug('append copyright')
+
+            def copyright_delta(box):
+                mark = metrics.begin() if metrics else None
+                slide = self._copyright_indices()
+                if metrics:
+                    metrics.end('convert', mark)
+                    metrics.add('composed')
+                return slide, box
+
+            for i in range(copyright_slide):
+                yield (cache_key(self.render_key, 'copyright', str(bool(i))),
+                       partial(copyright_delta, (0, 0, 0, 0) if i else None))
+
+        if self.verbose:
+            self._print_state()
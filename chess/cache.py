@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""cache module contains an on-disk cache of encoded frames shared by processes."""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+from . import FILE_MODE
+
+
+LOGGER = logging.getLogger('ROOT')
+
+
+def cache_key(*parts):
+    """cache_key hashes parts, str or bytes, into a hex key."""
+    digest = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        data = part.encode('utf-8') if isinstance(part, str) else bytes(part)
+        digest.update(len(data).to_bytes(4, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class FrameCache():
+    """FrameCache is a content-addressed store of encoded frames in a folder.
+
+    An entry is one file named by its key. Entries are written to a temporary
+    file and renamed into place, so processes sharing the folder never read a
+    partial entry. Reading an entry touches it, and when the folder grows over
+    `max_size` bytes the least recently used entries are removed.
+    """
+
+    def __init__(self, path, max_size=256 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # bytes written since the last eviction check.
+        self._written = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        """get returns data of key, None if key is not cached."""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            # evicted by another process since read, the data read is still good.
+            pass
+        return data
+
+    def put(self, key, data):
+        """put stores data under key."""
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix='.tmp')
+        try:
+            os.chmod(tmp_path, FILE_MODE)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, entry_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self._written += len(data)
+        if self._written > self.max_size // 16:
+            self.evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                entry_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, entry_path
+
+    def evict(self):
+        """evict removes least recently used entries until cache fits in `max_size`."""
+        self._written = 0
+        entries = sorted(self._entries())
+        size = sum(e[1] for e in entries)
+        LOGGER.debug('cache "%s" holds %s entries, %s bytes', self.path, len(entries), size)
+        for _, entry_size, entry_path in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.unlink(entry_path)
+            except FileNotFoundError:
+                # removed by another process.
+                pass
+            size -= entry_size
+
+    def stats(self):
+        """stats returns hit and miss counters."""
+        return {'hits': self.hits, 'misses': self.misses}
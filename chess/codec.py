@@ -1,24 +1,167 @@
 # -*- coding: utf-8 -*-
 """files module contains functions that load data from files."""
 
+import io
 import logging
+import os
 import re
+import struct
+from collections import namedtuple
 
-import imageio
+from . import FILE_MODE
 
 
 LOGGER = logging.getLogger('ROOT')
 
+# PgnGame is a game loaded from PGN, `tags` holds tag pairs, `moves` holds SAN moves.
+PgnGame = namedtuple('PgnGame', ['tags', 'moves', 'result'])
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+_TAG_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# _TOKEN_RE splits movetext, only the last group of a match is set.
+_TOKEN_RE = re.compile(
+    r'(\{[^}]*\}?|;[^\n]*)'                   # 1. comment
+    r'|(1-0|0-1|1/2-1/2|\*)'                  # 2. result
+    r'|(\()|(\))'                             # 3. and 4. variation
+    r'|([NBRQK]?[a-h]?[1-8]?x?[a-h][1-8](?:=?[NBRQ])?|[O0]-[O0](?:-[O0])?)'  # 5. SAN
+    r'|\d+\.*|\$\d+'                           # move number, NAG
+)
+# _COMMENT_MARK_RE matches characters which open or close a comment.
+_COMMENT_MARK_RE = re.compile(r'[{};]')
+
+
+def _unescape_tag(value):
+    return re.sub(r'\\(.)', r'\1', value) if '\\' in value else value
+
+
+def _normalize_san(san):
+    if san[0] == '0':
+        return san.replace('0', 'O')
+    if san[-1] in 'NBRQ' and san[-2] != '=' and san[0].islower():
+        return san[:-1] + '=' + san[-1]
+    return san
+
+
+def _strip_comment(line, in_comment):
+    """_strip_comment returns line without its `;` comment and whether a `{` comment is open.
+
+    `in_comment` tells whether a `{` comment is open at the start of line,
+    `;` in it and `{` after `;` are comment text.
+    """
+    for match in _COMMENT_MARK_RE.finditer(line):
+        mark = match.group()
+        if in_comment:
+            in_comment = mark != '}'
+        elif mark == '{':
+            in_comment = True
+        elif mark == ';':
+            return line[:match.start()], False
+    return line, in_comment
+
+
+def _parse_movetext(tags, text):
+    """_parse_movetext yields games in movetext, a result token ends a game."""
+    moves, depth = [], 0
+    for match in _TOKEN_RE.finditer(text):
+        group = match.lastindex
+        if group == 5:
+            if depth == 0:
+                moves.append(_normalize_san(match.group(5)))
+        elif group == 3:
+            depth += 1
+        elif group == 4:
+            depth = max(depth - 1, 0)
+        elif group == 2 and depth == 0:
+            yield PgnGame(tags, moves, match.group(2))
+            tags, moves = {}, []
+    if tags or moves:
+        yield PgnGame(tags, moves, None)
+
+
+def parse_games(lines):
+    """parse_games yields games one by one from an iterable of PGN text lines.
+
+    Only the lines of the current game are kept in memory.
+    """
+    tags, movetext, in_comment = {}, [], False
+    for line in lines:
+        if not in_comment:
+            stripped = line.strip()
+            if stripped.startswith('['):
+                if movetext:
+                    yield from _parse_movetext(tags, ''.join(movetext))
+                    tags, movetext = {}, []
+                match = _TAG_RE.match(stripped)
+                if match:
+                    tags[match.group(1)] = _unescape_tag(match.group(2))
+                continue
+            if stripped.startswith('%'):
+                # escaped line.
+                continue
+            if not movetext and not stripped:
+                continue
+        movetext.append(line)
+        if in_comment or '{' in line or ';' in line:
+            line, in_comment = _strip_comment(line, in_comment)
+        if not in_comment and line.rstrip().endswith(RESULTS):
+            yield from _parse_movetext(tags, ''.join(movetext))
+            tags, movetext = {}, []
+
+    if tags or movetext:
+        yield from _parse_movetext(tags, ''.join(movetext))
+
+
+def load_games_from_file(file_path, metrics=None):
+    """load_games_from_file yields games from a PGN file which may hold many games.
+
+    The file is read line by line, never as a whole. With `metrics`, parsing
+    is timed as stage `parse`, games are counted and the file size is added
+    as `bytes`.
+    """
+    LOGGER.debug('load games from file "%s"', file_path)
+    with open(file_path, encoding='utf-8', errors='replace') as f:
+        if metrics is None:
+            yield from parse_games(f)
+            return
+        metrics.add('bytes', os.fstat(f.fileno()).st_size)
+        yield from _timed_games(parse_games(f), metrics)
+
+
+def load_games_from_bytes(data, metrics=None):
+    """load_games_from_bytes yields games from content of a PGN file.
+
+    With `metrics`, parsing is timed as stage `parse` and games are counted.
+    """
+    games = parse_games(io.StringIO(data.decode('utf-8', errors='replace'), newline=None))
+    if metrics is None:
+        yield from games
+        return
+    yield from _timed_games(games, metrics)
+
+
+def _timed_games(games, metrics):
+    while True:
+        mark = metrics.begin()
+        game = next(games, None)
+        metrics.end('parse', mark)
+        if game is None:
+            return
+        metrics.add('games')
+        yield game
+
+
+def load_moves_from_bytes(data, metrics=None):
+    """load_moves_from_bytes loads moves of the first game from content of a PGN file."""
+    game = next(load_games_from_bytes(data, metrics=metrics), None)
+    return game.moves if game else []
+
 
 def load_moves_from_file(file_path):
-    """load_moves_from_file loads moves from file."""
+    """load_moves_from_file loads moves of the first game from file."""
     LOGGER.debug('load moves from file "%s"', file_path)
-    with open(file_path) as f:
-        data = f.read()
-        data = re.sub(r'\{.*?\}', '', data)  # remove png comments
-        return re.findall(
-            r'[a-h]x?[a-h]?[1-8]?=?[BKNRQ]?|O-O-?O?|[BKNRQ][a-h1-8]?[a-h1-8]?x?[a-h][1-8]',
-            data)
+    game = next(load_games_from_file(file_path), None)
+    return game.moves if game else []
 
 
 def load_state_from_file(file_path):
@@ -32,7 +175,238 @@ def load_state_from_file(file_path):
         return dict(p.split('=') for p in pairs)
 
 
-def save_image_to_file(file_path, images, duration):
-    """save_image_to_file dump image serial in GIF format to file."""
+class GifWriter():
+    """GifWriter writes an animated GIF frame by frame.
+
+    Each appended frame is quantized, encoded and written to file right away,
+    so memory does not grow with the number of frames. A frame may cover only
+    the box changed since the previous frame, the rest of the previous frame
+    is kept on screen.
+
+    With `palette`, 256 RGB triples, frames are `H x W` arrays of indices into
+    it, they are written with the global palette as is, no quantization.
+
+    With `metrics`, a `chess.metrics.Metrics`, encoding and writing are timed
+    as stages `encode` and `write`, and written frames and bytes are counted.
+
+    Frames go to a temporary file next to `file_path`, which replaces it on
+    `close`. Used as a context manager, nothing is written when an
+    exception is raised, an earlier file at `file_path` is kept as it is.
+
+    `file_path` may also be a binary file object, e.g. `io.BytesIO`, which
+    is left open by `close`.
+    """
+
+    def __init__(self, file_path, duration,  # pylint: disable=too-many-arguments
+                 loop=0, palette=None, metrics=None):
+        self.owns_fp = not hasattr(file_path, 'write')
+        self.file_path, self.tmp_path = file_path, None
+        if self.owns_fp:
+            # imported here, so that parsing PGN starts fast.
+            import tempfile  # pylint: disable=import-outside-toplevel
+
+            fd, self.tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(file_path)), suffix='.tmp')
+            os.chmod(self.tmp_path, FILE_MODE)
+            self.fp = os.fdopen(fd, 'wb')
+        else:
+            self.fp = file_path
+        self.closed = False
+        self.metrics = metrics
+        self.duration = duration
+        self.loop = loop
+        self.palette = palette
+        self.size = None
+        self.count = 0
+
+    def _write_header(self, size):
+        if self.palette is None:
+            self.fp.write(b'GIF89a' + struct.pack('<HHBBB', size[0], size[1], 0, 0, 0))
+        else:
+            # global color table with 256 colors.
+            self.fp.write(b'GIF89a' + struct.pack('<HHBBB', size[0], size[1], 0xf7, 0, 0))
+            self.fp.write(bytes(self.palette).ljust(3 * 256, b'\x00'))
+        # NETSCAPE2.0 application extension, loop count.
+        self.fp.write(b'!\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', self.loop) + b'\x00')
+
+    def encode(self, image, box=None):
+        """encode returns image data of a frame, which is written by `write_encoded`.
+
+        See `append` for arguments. Encoded data does not depend on delay, so
+        it may be cached and written into other files using the same palette.
+        """
+        if self.metrics is None:
+            return self._encode(image, box)
+        with self.metrics.stage('encode'):
+            return self._encode(image, box)
+
+    def _encode(self, image, box):
+        # imported here, so that parsing PGN does not load Pillow and NumPy.
+        from numpy import asarray  # pylint: disable=import-outside-toplevel
+        from PIL import Image, GifImagePlugin  # pylint: disable=import-outside-toplevel
+
+        if isinstance(image, Image.Image):
+            # palette-indexed PIL image is taken as indices.
+            image = asarray(image.convert('RGB') if self.palette is None else image)
+        if self.size is None:
+            self.size = (image.shape[1], image.shape[0])
+            box = None
+        if box is None:
+            box = (0, 0) + self.size
+        elif box[2] <= box[0] or box[3] <= box[1]:
+            # nothing changed, still a frame is needed to keep the delay.
+            box = (0, 0, 1, 1)
+
+        left, top, right, bottom = box
+        chunks = []
+        if self.palette is None:
+            frame = Image.fromarray(image[top:bottom, left:right]).quantize()
+            palette = frame.getpalette()[:3 * 256]
+            bits = max((len(palette) // 3 - 1).bit_length(), 1)
+            palette += [0] * (3 * (1 << bits) - len(palette))
+            # image descriptor with local color table.
+            chunks.append(struct.pack('<BHHHHB', 0x2c, left, top, right - left, bottom - top,
+                                      0x80 | (bits - 1)))
+            chunks.append(bytes(palette))
+        else:
+            # indices are encoded as they are, using the global color table.
+            frame = Image.fromarray(image[top:bottom, left:right], 'L')
+            chunks.append(struct.pack('<BHHHHB', 0x2c, left, top, right - left, bottom - top, 0))
+        # skip the descriptor written by PIL, keep LZW code size and data.
+        chunks.append(b''.join(GifImagePlugin.getdata(frame))[10:])
+        return b''.join(chunks)
+
+    def write_encoded(self, data):
+        """write_encoded writes frame data returned by `encode` as next frame."""
+        mark = self.metrics.begin() if self.metrics else None
+        if self.count == 0:
+            # the first frame covers the whole image.
+            self.size = struct.unpack('<HH', data[5:9])
+            self._write_header(self.size)
+        # graphic control extension, do not dispose, delay in 1/100 second.
+        self.fp.write(struct.pack('<4BHBB', 0x21, 0xf9, 4, 1 << 2,
+                                  int(self.duration * 100 + 0.5), 0, 0))
+        self.fp.write(data)
+        self.count += 1
+        if self.metrics:
+            self.metrics.end('write', mark)
+            self.metrics.add('frames')
+
+    def append(self, image, box=None):
+        """append encodes image, a PIL image or `H x W x 3` array, as next frame.
+
+        With `box` as `(left, top, right, bottom)`, only that part of image is
+        encoded, the first frame is always encoded as a whole.
+        """
+        self.write_encoded(self.encode(image, box))
+
+    def close(self):
+        """close writes GIF trailer and closes file, which replaces `file_path`."""
+        if self.closed:
+            return
+        try:
+            self.fp.write(b';')
+            if self.metrics:
+                self.metrics.add('bytes', self.fp.tell())
+            if self.owns_fp:
+                self.fp.close()
+                os.replace(self.tmp_path, self.file_path)
+        except BaseException:
+            self.discard()
+            raise
+        self.closed = True
+
+    def discard(self):
+        """discard closes file without trailer, the temporary file is removed."""
+        if not self.closed:
+            self.closed = True
+            if self.owns_fp:
+                self.fp.close()
+                os.unlink(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def save_image_to_file(file_path, images, duration, palette=None, metrics=None):
+    """save_image_to_file dump image serial in GIF format to file.
+
+    `images` may be any iterable, e.g. `Board.iter_frames`, each image is
+    encoded and written as soon as it is produced. Palette-indexed images
+    come with their `palette`, see `GifWriter`.
+    """
+    save_deltas_to_file(file_path, ((image, None) for image in images), duration,
+                        palette=palette, metrics=metrics)
+
+
+def save_deltas_to_file(file_path, deltas, duration, palette=None, metrics=None):
+    """save_deltas_to_file dump `(image, box)` serial, e.g. `Board.iter_deltas`, to GIF file.
+
+    Only `box` of each image is encoded, see `GifWriter.append`.
+    """
+    LOGGER.debug('create GIF image "%s"', file_path)
+    with GifWriter(file_path, duration, palette=palette, metrics=metrics) as writer:
+        for image, box in deltas:
+            writer.append(image, box)
+
+
+def save_game_to_file(file_path, board, moves, duration,  # pylint: disable=too-many-arguments
+                      cache=None, metrics=None):
+    """save_game_to_file renders `moves` on `board` to GIF file, reusing frames found in cache.
+
+    Encoded frames of `Board.iter_keyed_deltas` are looked up in `cache`, a
+    `FrameCache`, a frame is only composed and encoded on a miss. `metrics`
+    is given to the writer, cache lookups are timed as stage `cache`.
+    """
     LOGGER.debug('create GIF image "%s"', file_path)
-    imageio.mimsave(file_path, images, duration=duration)
+    with GifWriter(file_path, duration, palette=board.palette, metrics=metrics) as writer:
+        for key, delta in board.iter_keyed_deltas(moves):
+            data = None
+            if cache is not None:
+                mark = metrics.begin() if metrics else None
+                data = cache.get(key)
+                if metrics:
+                    metrics.end('cache', mark)
+                    metrics.add('cache_hits', data is not None)
+            if data is None:
+                data = writer.encode(*delta())
+                if cache is not None:
+                    cache.put(key, data)
+            writer.write_encoded(data)
+
+
+def save_frame_to_file(file_path, frame, palette):
+    """save_frame_to_file writes a palette-indexed frame, `H x W` indices into `palette`, as PNG."""
+    from PIL import Image  # pylint: disable=import-outside-toplevel
+
+    image = Image.fromarray(frame, 'L')
+    image.putpalette(palette)
+    image.save(file_path, format='PNG')
+
+
+def save_plies_to_file(file_path, board, moves, plies,  # pylint: disable=too-many-arguments
+                       duration, metrics=None):
+    """save_plies_to_file renders selected `plies` of `moves` on `board`, see `Board.iter_plies`.
+
+    A single ply is written as PNG, more as GIF with `duration` between them,
+    without copyright slides. It raises ValueError if no ply is selected.
+    """
+    if not plies:
+        raise ValueError('no ply selected of {} moves'.format(len(moves)))
+    if len(plies) == 1:
+        LOGGER.debug('create PNG image "%s"', file_path)
+        for _, frame, _ in board.iter_plies(moves, plies):
+            mark = metrics.begin() if metrics else None
+            save_frame_to_file(file_path, frame, board.palette)
+            if metrics:
+                metrics.end('encode', mark)
+                metrics.add('frames')
+        return
+    deltas = ((frame, box) for _, frame, box in board.iter_plies(moves, plies))
+    save_deltas_to_file(file_path, deltas, duration, palette=board.palette, metrics=metrics)
@@ -1,17 +1,327 @@
 # -*- coding: utf-8 -*-
 """game module contains classes and functions which represents a chess game."""
 
+import functools
 import logging
+import random
+import re
+import struct
+from collections import namedtuple
+from collections.abc import MutableMapping
 
-from . import ROWS, COLUMNS
+from . import ROWS, COLUMNS, PIECES, WHITE, BLACK, KING, QUEEN, BISHOP, KNIGHT, ROCK, PAWN
 
 
 LOGGER = logging.getLogger('ROOT')
 
+# SQUARE_NAMES maps square index (a1=0, b1=1, ..., h8=63) to its name.
+SQUARE_NAMES = tuple(c + r for r in ROWS for c in COLUMNS)
+# SQUARES maps square name to its index.
+SQUARES = {name: idx for idx, name in enumerate(SQUARE_NAMES)}
+# STATE_KEYS is the key order of a state dict, a1, a2, ..., h8.
+STATE_KEYS = tuple(c + r for c in COLUMNS for r in ROWS)
+
+EMPTY = 0
+# PIECE_NAMES maps piece code to chesspiece name, code 0 stands for empty square.
+PIECE_NAMES = ('',) + tuple(c + p for c in (WHITE, BLACK) for p in PIECES)
+# PIECE_CODES maps chesspiece name to piece code.
+PIECE_CODES = {name: code for code, name in enumerate(PIECE_NAMES)}
+# SAN_CODES maps color and SAN piece letter, like `N` or `P`, to piece code.
+SAN_CODES = {c: {p.upper(): PIECE_CODES[c + p] for p in PIECES} for c in (WHITE, BLACK)}
+
 
 def load_empty_state():
     """load_empty_state returns an empty board state."""
-    return {c + r: '' for c in COLUMNS for r in ROWS}
+    return dict.fromkeys(STATE_KEYS, '')
+
+
+def _ray(square, col_step, row_step):
+    col, row = (square & 7) + col_step, (square >> 3) + row_step
+    ray = []
+    while 0 <= col < 8 and 0 <= row < 8:
+        ray.append(row * 8 + col)
+        col, row = col + col_step, row + row_step
+    return tuple(ray)
+
+
+def _leaps(square, offsets):
+    return tuple(sorted(r[0] for r in (_ray(square, c, r) for c, r in offsets) if r))
+
+
+def _paths(rays):
+    return {dest: ray[:i] for ray in rays for i, dest in enumerate(ray)}
+
+
+ROCK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+KNIGHT_OFFSETS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))
+
+# KNIGHT_ATTACKS and KING_ATTACKS map square index to the squares attacked from it.
+KNIGHT_ATTACKS = tuple(_leaps(s, KNIGHT_OFFSETS) for s in range(64))
+KING_ATTACKS = tuple(_leaps(s, ROCK_DIRECTIONS + BISHOP_DIRECTIONS) for s in range(64))
+# PAWN_ATTACKS maps color, 0 for white and 1 for black, and square index to the squares attacked
+# by a pawn of the color on it.
+PAWN_ATTACKS = tuple(tuple(_leaps(s, ((-1, step), (1, step))) for s in range(64))
+                     for step in (1, -1))
+# ROCK_RAYS and BISHOP_RAYS map square index to the rays sliding out of it, nearest square first.
+ROCK_RAYS = tuple(tuple(_ray(s, c, r) for c, r in ROCK_DIRECTIONS) for s in range(64))
+BISHOP_RAYS = tuple(tuple(_ray(s, c, r) for c, r in BISHOP_DIRECTIONS) for s in range(64))
+# ROCK_PATHS and BISHOP_PATHS map square index to {reachable square: squares in between}.
+ROCK_PATHS = tuple(_paths(rays) for rays in ROCK_RAYS)
+BISHOP_PATHS = tuple(_paths(rays) for rays in BISHOP_RAYS)
+# LINES maps square index to {square on a ray out of it: (squares in between, squares beyond,
+# SAN letter of the slider moving along the ray, R or B)}, pins and discovered checks are found
+# by looking beyond a piece standing on a line from the king.
+LINES = tuple({dest: (ray[:i], ray[i + 1:], letter)
+               for rays, letter in ((ROCK_RAYS[s], 'R'), (BISHOP_RAYS[s], 'B'))
+               for ray in rays for i, dest in enumerate(ray)} for s in range(64))
+
+# ZOBRIST_PIECES maps piece code and square index to a 64-bit random number, those of code 0 are
+# 0, ZOBRIST_BLACK marks black to move. The seed is fixed, so keys are the same in every process.
+_zobrist_random = random.Random(0x5a0b)
+ZOBRIST_PIECES = ((0,) * 64,) + tuple(tuple(_zobrist_random.getrandbits(64) for _ in range(64))
+                                      for _ in PIECE_NAMES[1:])
+ZOBRIST_BLACK = _zobrist_random.getrandbits(64)
+
+
+# SIDE_CODES maps whether white is to move to SAN_CODES of the side to move and of the other.
+SIDE_CODES = {True: (SAN_CODES[WHITE], SAN_CODES[BLACK]),
+              False: (SAN_CODES[BLACK], SAN_CODES[WHITE])}
+# PIECE_ATTACKS maps piece code to the table of squares it attacks, None for a slider.
+PIECE_ATTACKS = (None,) + tuple(
+    {KING: KING_ATTACKS, KNIGHT: KNIGHT_ATTACKS, PAWN: PAWN_ATTACKS[name[0] == BLACK]}.get(name[1])
+    for name in PIECE_NAMES[1:])
+# SLIDER_LETTERS maps piece code to the LINES letters it slides along.
+SLIDER_LETTERS = tuple({QUEEN: 'RB', ROCK: 'R', BISHOP: 'B'}.get(name[1:], '')
+                       for name in PIECE_NAMES)
+
+# PAWN_CODES are piece codes of white and black pawns.
+PAWN_CODES = (PIECE_CODES['wp'], PIECE_CODES['bp'])
+# KING_CODES are piece codes of white and black kings.
+KING_CODES = (PIECE_CODES['wk'], PIECE_CODES['bk'])
+# CASTLING_RIGHTS are FEN letters of castling rights, bit i of a rights mask stands for letter i.
+CASTLING_RIGHTS = 'KQkq'
+# CASTLING_HOMES maps castling right bit to squares of its king and rook with their codes.
+CASTLING_HOMES = ((4, PIECE_CODES['wk'], 7, PIECE_CODES['wr']),
+                  (4, PIECE_CODES['wk'], 0, PIECE_CODES['wr']),
+                  (60, PIECE_CODES['bk'], 63, PIECE_CODES['br']),
+                  (60, PIECE_CODES['bk'], 56, PIECE_CODES['br']))
+# CASTLING_KEEP maps square index to the mask of rights kept when a piece leaves or lands on it,
+# so moving a king or a rook, or capturing a rook, on its home square drops its rights.
+CASTLING_KEEP = tuple(15 & ~sum(1 << bit for bit, home in enumerate(CASTLING_HOMES)
+                                if s in (home[0], home[2])) for s in range(64))
+# CASTLING_PATHS maps castling right bit to the squares between its king and rook, and the
+# squares the king passes and lands on.
+CASTLING_PATHS = tuple((tuple(range(min(k, r) + 1, max(k, r))),
+                        (k + 1, k + 2) if r > k else (k - 1, k - 2))
+                       for k, _, r, _ in CASTLING_HOMES)
+# CASTLING_FEN maps a mask of castling rights to its FEN field.
+CASTLING_FEN = tuple(''.join(r for bit, r in enumerate(CASTLING_RIGHTS) if mask >> bit & 1) or '-'
+                     for mask in range(16))
+# FEN_TABLE translates piece codes to FEN letters, `.` for an empty square.
+FEN_TABLE = bytes.maketrans(bytes(range(13)), b'.KQBNRPkqbnrp')
+# FEN_CODES maps FEN piece letter to piece code.
+FEN_CODES = {chr(FEN_TABLE[code]): code for code in range(1, 13)}
+# PACKED_POSITION is the layout of `Game.pack`: two squares per byte, a1 and b1 first, low
+# nibble first, side to move in bit 4 (set for black) with castling rights in bits 0-3, en
+# passant square or 64, halfmove clock and fullmove number.
+PACKED_POSITION = struct.Struct('<32sBBHH')
+# PackedPosition is a position unpacked by `unpack_position`, `ep` is None without en passant.
+PackedPosition = namedtuple('PackedPosition', ['squares', 'is_white_run', 'castling', 'ep',
+                                               'halfmove', 'fullmove'])
+# SAN_PATTERN matches SAN with groups castling, piece letter, origin file and rank, capture,
+# destination and promotion letter.
+SAN_PATTERN = re.compile(
+    r'(?:(O-O(?:-O)?)|([KQRBN])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=([QRBN]))?)[+#!?]*$')
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_san(san):
+    """parse_san returns `(castle, letter, file, rank, capture, dest, promotion)` of SAN.
+
+    `castle` is `O-O` or `O-O-O`, or None. `letter` is the SAN letter of
+    the piece, None for a pawn, `file` and `rank` of the origin are indexes
+    from 0 or None, `capture` is a bool, `dest` a square index and
+    `promotion` a SAN letter or None. It raises ValueError for a string which
+    is not SAN.
+    """
+    match = SAN_PATTERN.match(san)
+    if not match:
+        raise ValueError('"{}" is not SAN'.format(san))
+    castle, letter, from_file, from_rank, capture, to, promotion = match.groups()
+    return (castle, letter, None if from_file is None else ord(from_file) - ord('a'),
+            None if from_rank is None else int(from_rank) - 1, capture is not None,
+            None if to is None else SQUARES[to], promotion)
+
+
+class IllegalMoveError(ValueError):
+    """IllegalMoveError is raised by `Game.apply` for a move which can not be made."""
+
+    def __init__(self, move, reason):
+        # args are kept as they are, so that the error is pickled back from worker processes.
+        super().__init__(move, reason)
+        self.move = move
+        self.reason = reason
+
+    def __str__(self):
+        return 'illegal move "{}", {}'.format(self.move, self.reason)
+
+
+def castling_of_squares(squares):
+    """castling_of_squares returns the mask of castling rights whose king and rook are at home."""
+    return sum(1 << bit for bit, (king, king_code, rock, rock_code) in enumerate(CASTLING_HOMES)
+               if squares[king] == king_code and squares[rock] == rock_code)
+
+
+def unpack_position(data):
+    """unpack_position returns `PackedPosition` of a record written by `Game.pack`."""
+    packed, flags, ep, halfmove, fullmove = PACKED_POSITION.unpack(data)
+    squares = bytearray(64)
+    squares[0::2] = bytes(b & 15 for b in packed)
+    squares[1::2] = bytes(b >> 4 for b in packed)
+    return PackedPosition(squares, not flags & 16, flags & 15, None if ep == 64 else ep,
+                          halfmove, fullmove)
+
+
+def is_attacked(position, square, by_white):
+    """is_attacked tells whether square is attacked by a piece of the given color."""
+    squares, pieces = position.squares, position.pieces
+    codes = SAN_CODES[WHITE if by_white else BLACK]
+    if (not pieces[codes['N']].isdisjoint(KNIGHT_ATTACKS[square]) or
+            # pawns attacking square stand where a pawn of the other color on it attacks.
+            not pieces[codes['P']].isdisjoint(PAWN_ATTACKS[by_white][square]) or
+            not pieces[codes['K']].isdisjoint(KING_ATTACKS[square])):
+        return True
+    queen = codes['Q']
+    for paths, slider in ((ROCK_PATHS[square], codes['R']), (BISHOP_PATHS[square], codes['B'])):
+        for code in (slider, queen):
+            for s in pieces[code]:
+                path = paths.get(s)
+                if path is not None and not any(squares[i] for i in path):
+                    return True
+    return False
+
+
+def slider_behind(squares, king, square, codes):
+    """slider_behind tells whether a slider of `codes` would attack king through square.
+
+    It is true when nothing stands between king and square on a line and the
+    first piece beyond square is a queen, or a rock or bishop moving along it.
+    """
+    line = LINES[king].get(square)
+    if line is None:
+        return False
+    between, beyond, letter = line
+    if any(squares[i] for i in between):
+        return False
+    for i in beyond:
+        code = squares[i]
+        if code:
+            return code in (codes[letter], codes['Q'])
+    return False
+
+
+def zobrist_key(squares, is_white_run=True):
+    """zobrist_key computes the 64-bit Zobrist key of board squares and side to move."""
+    key = 0 if is_white_run else ZOBRIST_BLACK
+    for square, code in enumerate(squares):
+        key ^= ZOBRIST_PIECES[code][square]
+    return key
+
+
+class Position():
+    """Position is a compact board, one byte of piece code per square.
+
+    `pieces` keeps the squares of each piece code, so finding a chesspiece
+    does not scan the board. `key` is the Zobrist key of the squares, it is
+    updated by `put` and `move`.
+    """
+
+    __slots__ = ('squares', 'pieces', 'key')
+
+    def __init__(self, squares=None):
+        self.squares = bytearray(64) if squares is None else bytearray(squares)
+        self.pieces = [set() for _ in PIECE_NAMES]
+        for square, code in enumerate(self.squares):
+            if code:
+                self.pieces[code].add(square)
+        self.key = zobrist_key(self.squares)
+
+    @classmethod
+    def from_state(cls, state):
+        """from_state creates position from a state dict like `{'e1': 'wk'}`."""
+        position = cls()
+        for square, piece in state.items():
+            if piece:
+                position.put(SQUARES[square], PIECE_CODES[piece])
+        return position
+
+    def to_state(self):
+        """to_state returns the position as a 64-entry state dict."""
+        squares = self.squares
+        return {s: PIECE_NAMES[squares[SQUARES[s]]] for s in STATE_KEYS}
+
+    def put(self, square, code):
+        """put places piece `code` on square, code 0 clears it."""
+        previous = self.squares[square]
+        if previous:
+            self.pieces[previous].discard(square)
+        if code:
+            self.pieces[code].add(square)
+        self.squares[square] = code
+        self.key ^= ZOBRIST_PIECES[previous][square] ^ ZOBRIST_PIECES[code][square]
+
+    def move(self, src, dest, code):
+        """move takes the piece on src away and places piece `code` on dest."""
+        squares, pieces = self.squares, self.pieces
+        piece, captured = squares[src], squares[dest]
+        pieces[piece].discard(src)
+        pieces[captured].discard(dest)
+        pieces[code].add(dest)
+        squares[src] = EMPTY
+        squares[dest] = code
+        self.key ^= ZOBRIST_PIECES[piece][src] ^ ZOBRIST_PIECES[captured][dest]
+        self.key ^= ZOBRIST_PIECES[code][dest]
+
+    def copy(self):
+        """copy returns a copy of the position."""
+        return Position(self.squares)
+
+    def __eq__(self, other):
+        return isinstance(other, Position) and self.squares == other.squares
+
+    def __repr__(self):
+        return 'Position({})'.format(
+            ', '.join('{}={}'.format(SQUARE_NAMES[i], PIECE_NAMES[code])
+                      for i, code in enumerate(self.squares) if code))
+
+
+class StateView(MutableMapping):
+    """StateView exposes a position as a state dict keyed by square name."""
+
+    __slots__ = ('position',)
+
+    def __init__(self, position):
+        self.position = position
+
+    def __getitem__(self, square):
+        return PIECE_NAMES[self.position.squares[SQUARES[square]]]
+
+    def __setitem__(self, square, piece):
+        self.position.put(SQUARES[square], PIECE_CODES[piece])
+
+    def __delitem__(self, square):
+        self.position.put(SQUARES[square], EMPTY)
+
+    def __iter__(self):
+        return iter(STATE_KEYS)
+
+    def __len__(self):
+        return len(STATE_KEYS)
+
+    def copy(self):
+        """copy returns a snapshot of the state as a plain dict."""
+        return self.position.to_state()
 
 
 def check_knight_move(lhs, rhs):
@@ -56,94 +366,454 @@ def check_diagonal(state, lhs, rhs):
     return False
 
 
+def _is_path_clear(squares, path):
+    return path is not None and not any(squares[i] for i in path)
+
+
+def _is_knight_move(squares, src, dest):  # pylint: disable=unused-argument
+    return dest in KNIGHT_ATTACKS[src]
+
+
+def _is_king_move(squares, src, dest):  # pylint: disable=unused-argument
+    return dest in KING_ATTACKS[src]
+
+
+def _is_line_move(squares, src, dest):
+    return _is_path_clear(squares, ROCK_PATHS[src].get(dest))
+
+
+def _is_diagonal_move(squares, src, dest):
+    return _is_path_clear(squares, BISHOP_PATHS[src].get(dest))
+
+
+def _is_queen_move(squares, src, dest):
+    return _is_line_move(squares, src, dest) or _is_diagonal_move(squares, src, dest)
+
+
+# MOVE_CHECKS maps chesspiece to the function which checks whether it reaches a square.
+MOVE_CHECKS = {
+    KING: _is_king_move,
+    QUEEN: _is_queen_move,
+    ROCK: _is_line_move,
+    BISHOP: _is_diagonal_move,
+    KNIGHT: _is_knight_move,
+}
+
+
 class Game():  # pylint: disable=too-few-public-methods
-    """Game is a class that represents chess game."""
+    """Game is a class that represents chess game.
+
+    With `verify`, the incremental Zobrist key is checked against a full
+    recompute after every move, which is slow and meant for debugging.
+    With `validate`, `apply` takes legal SAN only: the piece must be the only
+    one which can make the move without leaving its king in check, castling
+    needs its right and neither the king nor the squares it crosses may be
+    attacked, captures must be marked with `x` and promotions given.
+
+    Besides the position, a game keeps what FEN needs: `castling` rights as
+    a mask of CASTLING_RIGHTS bits, taken from kings and rooks at home when
+    the state is set, `ep` square behind a pawn which just moved two
+    squares, `halfmove` clock and `fullmove` number. `last` is the last move
+    made as `(origin, destination, promotion code)`, which `apply` takes
+    back without resolving SAN again.
+    """
 
-    def __init__(self, state, is_white_run=True):
+    def __init__(self, state, is_white_run=True, verify=False, validate=False):
         self.is_white_run = is_white_run
+        self.verify = verify
+        self.validate = validate
+        self.position = None
+        self.castling, self.ep, self.halfmove, self.fullmove = 0, None, 0, 1
+        self.irreversible = False
+        # checked tells whether the side to move is in check, None when it is not known.
+        self.checked = None
+        self.last = None
         self.state = state
 
-    def _update_state(self, src, dest, pt):
-        self.state[src] = ''
-        self.state[dest] = pt
+    @classmethod
+    def from_fen(cls, fen):
+        """from_fen creates a game from FEN, missing trailing fields take their defaults."""
+        fields = fen.split()
+        try:
+            rows = fields[0].split('/')
+            if len(rows) != 8 or len(fields) > 6:
+                raise ValueError
+            squares = bytearray()
+            for row in reversed(rows):
+                line = bytearray()
+                for char in row:
+                    line += bytes(int(char)) if char.isdigit() else bytes((FEN_CODES[char],))
+                if len(line) != 8:
+                    raise ValueError
+                squares += line
+            side, castling, ep, halfmove, fullmove = fields[1:] + ['w', '-', '-', '0', '1'][
+                len(fields) - 1:]
+            if side not in ('w', 'b') or castling != '-' and castling.strip(CASTLING_RIGHTS):
+                raise ValueError
+            game = cls(Position(squares), is_white_run=side == 'w')
+            game.castling = sum(1 << CASTLING_RIGHTS.index(r) for r in set(castling) - {'-'})
+            game.ep = None if ep == '-' else SQUARES[ep]
+            game.halfmove, game.fullmove = int(halfmove), int(fullmove)
+        except (IndexError, KeyError, ValueError):
+            raise ValueError('bad FEN "{}"'.format(fen)) from None
+        return game
+
+    @property
+    def key(self):
+        """key returns the 64-bit Zobrist key of current position and side to move."""
+        return self.position.key ^ (0 if self.is_white_run else ZOBRIST_BLACK)
+
+    @property
+    def state(self):
+        """state returns a dict view of current position keyed by square name."""
+        return StateView(self.position)
+
+    @state.setter
+    def state(self, state):
+        if isinstance(state, Position):
+            self.position = state.copy()
+        else:
+            self.position = Position.from_state(state)
+        self.castling = castling_of_squares(self.position.squares)
+        self.ep, self.halfmove, self.fullmove = None, 0, 1
+        self.checked = None
+
+    def fen(self):
+        """fen returns FEN of current position."""
+        board = self.position.squares.translate(FEN_TABLE)
+        placement = b'/'.join(board[row:row + 8] for row in range(56, -1, -8)).decode('ascii')
+        for count in range(8, 0, -1):
+            placement = placement.replace('.' * count, str(count))
+        return '{} {} {} {} {} {}'.format(
+            placement, 'w' if self.is_white_run else 'b', CASTLING_FEN[self.castling],
+            '-' if self.ep is None else SQUARE_NAMES[self.ep], self.halfmove, self.fullmove)
+
+    def pack(self):
+        """pack returns current position as a record of PACKED_POSITION, 38 bytes."""
+        squares = self.position.squares
+        return PACKED_POSITION.pack(
+            bytes(low | high << 4 for low, high in zip(squares[0::2], squares[1::2])),
+            (0 if self.is_white_run else 16) | self.castling,
+            64 if self.ep is None else self.ep, self.halfmove, self.fullmove)
 
-    def _find_non_pawn(self, move, to, piece):
+    def _color(self):
+        return WHITE if self.is_white_run else BLACK
+
+    def _update_state(self, src, dest, code):
+        position = self.position
+        if position.squares[dest] or position.squares[src] in PAWN_CODES:
+            self.irreversible = True
+        self.castling &= CASTLING_KEEP[src] & CASTLING_KEEP[dest]
+        position.move(src, dest, code)
+
+    def _find_non_pawn(self, move, to, code):
+        squares = self.position.squares
+        target = squares[to]
+        if target and (target > 6) == (code > 6):
+            raise IllegalMoveError(move, 'own piece on {}'.format(SQUARE_NAMES[to]))
+        check = MOVE_CHECKS[PIECE_NAMES[code][1]]
         if len(move) == 5:
-            return move[1:3]
+            origin = SQUARES[move[1:3]]
+            if squares[origin] != code or not check(squares, origin, to):
+                raise IllegalMoveError(move, 'no {} can move from {} to {}'.format(
+                    PIECE_NAMES[code], SQUARE_NAMES[origin], SQUARE_NAMES[to]))
+            return origin
 
-        p = piece[1]
         key = '' if len(move) == 3 else move[1]
 
-        if p == 'r':
-            return next(s for s, pt in self.state.items()
-                        if pt == piece and key in s and check_line(self.state, s, to))
-        if p == 'b':
-            return next(s for s, pt in self.state.items()
-                        if pt == piece and key in s and check_diagonal(self.state, s, to))
-        if p == 'n':
-            LOGGER.debug("move: %s, to: %s, pt: %s", move, to, piece)
-            return next(s for s, pt in self.state.items()
-                        if pt == piece and key in s and check_knight_move(s, to))
-        return next(s for s, pt in self.state.items()
-                    if pt == piece and key in s and (check_line(self.state, s, to) or
-                                                     check_diagonal(self.state, s, to)))
-
-    def _find_pawn(self, move):
-        pt = 'wp' if self.is_white_run else 'bp'
-        c = move[-2]
-        r = int(move[-1])
+        candidates = [s for s in sorted(self.position.pieces[code])
+                      if key in SQUARE_NAMES[s] and check(squares, s, to)]
+        if len(candidates) > 1:
+            # SAN leaves out the origin of a piece which could not move for a pin.
+            candidates = [s for s in candidates if not self._is_pinned(s, to)] or candidates
+        if not candidates:
+            raise IllegalMoveError(move, 'no {} can move to {}'.format(
+                PIECE_NAMES[code], SQUARE_NAMES[to]))
+        return candidates[0]
+
+    def _is_pinned(self, src, to):
+        """_is_pinned tells whether moving the piece on src to `to` exposes own king to a slider."""
+        squares = self.position.squares
+        color, enemy = (WHITE, BLACK) if self.is_white_run else (BLACK, WHITE)
+        kings = self.position.pieces[SAN_CODES[color]['K']]
+        if not kings:
+            return False
+        king = next(iter(kings))
+        for rays, slider in ((ROCK_RAYS, 'R'), (BISHOP_RAYS, 'B')):
+            attackers = (SAN_CODES[enemy][slider], SAN_CODES[enemy]['Q'])
+            for ray in rays[king]:
+                if src not in ray:
+                    continue
+                for s in ray:
+                    if s == to:
+                        break
+                    if s != src and squares[s]:
+                        if squares[s] in attackers:
+                            return True
+                        break
+        return False
+
+    def _find_pawn(self, move, to, code, ep):
+        squares = self.position.squares
+        # step walks from destination back to the origin row.
+        step = -8 if self.is_white_run else 8
+        origin = to + step
+        if to >> 3 == (7 if self.is_white_run else 0):
+            raise IllegalMoveError(move, 'pawns promote on the last rank')
 
         if len(move) == 2:
             # just pawn move.
-            if self.is_white_run:
-                origin = c + next(str(i) for i in range(r, 0, -1) if self.state[c + str(i)] == pt)
-            else:
-                origin = c + next(str(i) for i in range(r, 9) if self.state[c + str(i)] == pt)
-        else:
-            # with others.
-            if self.state[move[-2:]] != '':
-                origin = move[0] + (str(r - 1) if self.is_white_run else str(r + 1))
-            else:
-                nps = c + (str(r - 1)) if self.is_white_run else str(r + 1)
-                self.state[nps] = ''
-                origin = move[0] + nps[-1]
+            if 0 <= origin < 64 and not squares[origin] and \
+                    to >> 3 == (3 if self.is_white_run else 4):
+                # a double push, the square passed is empty.
+                origin += step
+            if squares[to] or not 0 <= origin < 64 or squares[origin] != code:
+                raise IllegalMoveError(move, 'no pawn can move to {}'.format(SQUARE_NAMES[to]))
+            return origin
 
-        return origin
+        # with others.
+        col = ord(move[0]) - ord('a')
+        target = squares[to]
+        if not 0 <= origin < 64 or abs(col - (to & 7)) != 1 or \
+                squares[(origin & ~7) | col] != code or \
+                (target and (target > 6) == (code > 6)) or (not target and to != ep):
+            raise IllegalMoveError(move, 'no pawn can capture on {}'.format(SQUARE_NAMES[to]))
+        if not target:
+            # en passant, remove the captured pawn.
+            self.position.put(origin, EMPTY)
+        return (origin & ~7) | col
 
     def _castle(self, move):
-        row, color = ('1', 'w') if self.is_white_run else ('8', 'b')
+        color = self._color()
+        row = 0 if self.is_white_run else 56
         if move.count('O') == 2:
-            r = 'h' + row
-            k_to = 'g' + row
-            r_to = 'f' + row
+            r, k_to, r_to = row + 7, row + 6, row + 5
         else:
-            r = 'a' + row
-            k_to = 'c' + row
-            r_to = 'd' + row
+            r, k_to, r_to = row, row + 2, row + 3
+        squares = self.position.squares
+        between = CASTLING_PATHS[(0 if self.is_white_run else 2) + (r == row)][0]
+        if squares[row + 4] != SAN_CODES[color]['K'] or squares[r] != SAN_CODES[color]['R']:
+            raise IllegalMoveError(move, 'no king and rock at home to castle')
+        if any(squares[s] for s in between):
+            raise IllegalMoveError(move, 'castling path is blocked')
 
-        self._update_state('e' + row, k_to, color + 'k')
-        self._update_state(r, r_to, color + 'r')
+        self._update_state(row + 4, k_to, SAN_CODES[color]['K'])
+        self._update_state(r, r_to, SAN_CODES[color]['R'])
+        self.last = (row + 4, k_to, EMPTY)
 
     def _promote(self, move):
-        pt = ('w' if self.is_white_run else 'b') + move[-1].lower()
-        origin = move[0] + ('7' if self.is_white_run else '2')
-        self._update_state(origin, move[-4:-2], pt)
+        # move is like `e8=Q`, or `ed8=Q` for a capture, `x` is left out.
+        codes = SAN_CODES[self._color()]
+        squares = self.position.squares
+        dest = SQUARES[move[-4:-2]]
+        col = ord(move[0]) - ord('a')
+        origin = (48 if self.is_white_run else 8) + col
+        target = squares[dest]
+        if len(move) == 4:
+            movable = not target and col == dest & 7
+        else:
+            movable = target and (target > 6) == self.is_white_run and abs(col - (dest & 7)) == 1
+        if not movable or squares[origin] != codes['P'] or \
+                dest >> 3 != (7 if self.is_white_run else 0):
+            raise IllegalMoveError(move, 'no pawn can promote on {}'.format(SQUARE_NAMES[dest]))
+        self._update_state(origin, dest, codes[move[-1]])
+        self.last = (origin, dest, codes[move[-1]])
 
     def apply(self, move):
-        """apply make move on game."""
+        """apply make move on game, raises IllegalMoveError for a move which can not be made.
+
+        `move` is SAN, or a tuple like `last` of a move resolved before, which
+        is made as it is, with no check. A failed move may leave the game half
+        updated.
+        """
+        if move.__class__ is not str:
+            self._make(*move)
+        elif self.validate:
+            self._apply_legal(move)
+        else:
+            self._apply(move)
+
+        self.halfmove = 0 if self.irreversible else self.halfmove + 1
+        if not self.is_white_run:
+            self.fullmove += 1
+        self.is_white_run = not self.is_white_run
+        if self.verify:
+            self._verify_key(move)
+
+    def _apply(self, move):
+        move = move.rstrip('+#!?').replace('x', '')
+        ep, self.ep, self.irreversible, self.checked = self.ep, None, False, None
         if 'O' in move:
             self._castle(move)
         elif '=' in move:
             self._promote(move)
         else:
-            dest = move[-2:]
+            dest = SQUARES[move[-2:]]
+            codes = SAN_CODES[self._color()]
             if move.islower():
-                pt = ('w' if self.is_white_run else 'b') + 'p'
-                origin = self._find_pawn(move)
+                code = codes['P']
+                origin = self._find_pawn(move, dest, code, ep)
+                if dest - origin in (16, -16):
+                    self.ep = (origin + dest) >> 1
             else:
-                pt = ('w' if self.is_white_run else 'b') + move[0].lower()
-                origin = self._find_non_pawn(move, dest, pt)
+                code = codes[move[0]]
+                origin = self._find_non_pawn(move, dest, code)
 
-            self._update_state(origin, dest, pt)
+            self._update_state(origin, dest, code)
+            self.last = (origin, dest, EMPTY)
 
-        self.is_white_run = not self.is_white_run
+    def _make(self, src, dest, promotion):
+        squares = self.position.squares
+        code = squares[src]
+        self.ep, self.irreversible, self.checked = None, False, None
+        if code in PAWN_CODES:
+            if not squares[dest] and (dest - src) & 7:
+                # en passant, the pawn taken stands beside the origin.
+                self.position.put((src & ~7) | (dest & 7), EMPTY)
+            elif dest - src in (16, -16):
+                self.ep = (src + dest) >> 1
+        elif code in KING_CODES and dest - src in (2, -2):
+            rock, rock_to = (src + 3, src + 1) if dest > src else (src - 4, src - 1)
+            self._update_state(rock, rock_to, squares[rock])
+        self._update_state(src, dest, promotion or code)
+        self.last = (src, dest, promotion)
+
+    def _apply_legal(self, san):  # pylint: disable=too-many-locals,too-many-branches
+        try:
+            castle, letter, from_file, from_rank, capture, dest, promotion = parse_san(san)
+        except ValueError:
+            raise IllegalMoveError(san, 'not SAN') from None
+        white = self.is_white_run
+        codes, enemy = SIDE_CODES[white]
+        position = self.position
+        squares, pieces = position.squares, position.pieces
+        ep, self.ep, self.irreversible = self.ep, None, False
+        king = enemy_king = None
+        for king in pieces[codes['K']]:
+            break
+        for enemy_king in pieces[enemy['K']]:
+            break
+        in_check = self.checked
+        if in_check is None:
+            in_check = king is not None and is_attacked(position, king, not white)
+        if castle:
+            self._castle_legal(san, castle, in_check)
+            self.checked = enemy_king is not None and is_attacked(position, enemy_king, white)
+            return
+
+        target = squares[dest]
+        if target and (target <= 6) == white:
+            raise IllegalMoveError(san, 'own piece on {}'.format(SQUARE_NAMES[dest]))
+        taken = None
+        if letter:
+            code = codes[letter]
+            check = MOVE_CHECKS[letter.lower()]
+            origins = [s for s in pieces[code] if check(squares, s, dest)]
+            if from_file is not None:
+                origins = [s for s in origins if s & 7 == from_file]
+            if from_rank is not None:
+                origins = [s for s in origins if s >> 3 == from_rank]
+            if promotion:
+                raise IllegalMoveError(san, 'only pawns promote')
+        else:
+            code = codes['P']
+            step = 8 if white else -8
+            origin = dest - step
+            if from_file is not None:
+                if from_rank is not None or abs(from_file - (dest & 7)) != 1:
+                    raise IllegalMoveError(san, 'pawns capture on the next file')
+                origin += from_file - (dest & 7)
+                if not target:
+                    if dest != ep:
+                        raise IllegalMoveError(san, 'nothing to capture on {}'.format(
+                            SQUARE_NAMES[dest]))
+                    taken = dest - step
+            elif target:
+                raise IllegalMoveError(san, 'pawns capture diagonally')
+            elif dest >> 3 == (3 if white else 4) and not squares[origin]:
+                # a double push, the square passed is empty.
+                origin -= step
+            origins = [origin] if 0 <= origin < 64 and squares[origin] == code else []
+            if (promotion is not None) != (dest >> 3 == (7 if white else 0)):
+                raise IllegalMoveError(san, 'pawns promote on the last rank, and only there')
+        if capture != bool(target or taken is not None):
+            raise IllegalMoveError(san, 'captures, and only captures, are marked by x')
+
+        if king is None:
+            pass
+        elif letter == 'K':
+            # the king may not stand in the way of a slider attacking its destination.
+            squares[king] = EMPTY
+            if is_attacked(position, dest, not white):
+                origins = []
+            squares[king] = code
+        elif len(origins) > 1 or in_check or taken is not None or origins and \
+                origins[0] in LINES[king] and slider_behind(squares, king, origins[0], enemy):
+            origins = [s for s in origins if self._is_safe(s, dest, king, taken)]
+        if len(origins) != 1:
+            raise IllegalMoveError(san, '{} {} can move to {}'.format(
+                'no' if not origins else 'more than one', PIECE_NAMES[code], SQUARE_NAMES[dest]))
+        origin = origins[0]
+
+        if taken is not None:
+            position.put(taken, EMPTY)
+        elif not letter and dest - origin in (16, -16):
+            self.ep = (origin + dest) >> 1
+        if promotion:
+            code = codes[promotion]
+        self._update_state(origin, dest, code)
+        self.last = (origin, dest, code if promotion else EMPTY)
+
+        # the other side is in check by the piece moved or by a slider it uncovered.
+        if enemy_king is None:
+            self.checked = False
+        elif taken is not None:
+            self.checked = is_attacked(position, enemy_king, white)
+        elif origin in LINES[enemy_king] and slider_behind(squares, enemy_king, origin, codes):
+            self.checked = True
+        else:
+            attacks = PIECE_ATTACKS[code]
+            if attacks is None:
+                line = LINES[dest].get(enemy_king)
+                self.checked = line is not None and line[2] in SLIDER_LETTERS[code] and \
+                    not any(squares[i] for i in line[0])
+            else:
+                self.checked = enemy_king in attacks[dest]
+
+    def _castle_legal(self, san, castle, in_check):
+        white = self.is_white_run
+        bit = (0 if white else 2) + (len(castle) > 3)
+        between, crossed = CASTLING_PATHS[bit]
+        if not self.castling >> bit & 1:
+            raise IllegalMoveError(san, 'no castling right')
+        if any(self.position.squares[s] for s in between):
+            raise IllegalMoveError(san, 'castling path is blocked')
+        if in_check or any(is_attacked(self.position, s, not white) for s in crossed):
+            raise IllegalMoveError(san, 'king is in check or crosses an attacked square')
+        self._castle(castle)
+
+    def _is_safe(self, src, dest, king, taken=None):
+        """_is_safe tells whether moving the piece on src to dest leaves own king out of check.
+
+        The move is tried on the board and taken back, `taken` is the square of
+        a pawn captured en passant.
+        """
+        position = self.position
+        squares = position.squares
+        code, captured = squares[src], squares[dest]
+        taken_code = squares[taken] if taken is not None else EMPTY
+        position.move(src, dest, code)
+        if taken is not None:
+            position.put(taken, EMPTY)
+        legal = not is_attacked(position, dest if src == king else king, not self.is_white_run)
+        if taken is not None:
+            position.put(taken, taken_code)
+        position.move(dest, src, code)
+        position.put(dest, captured)
+        return legal
+
+    def _verify_key(self, move):
+        expected = zobrist_key(self.position.squares, self.is_white_run)
+        if self.key != expected:
+            raise RuntimeError('zobrist key {:016x} after "{}" differs from {:016x}'.format(
+                self.key, move, expected))
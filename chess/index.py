@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""index module keeps an on-disk index of the positions reached by games of a PGN corpus.
+
+An index is a folder of segments and a `sources.json` table. A segment is a
+file of ENTRY records sorted by key, the Zobrist key of pieces and side to
+move (`Game.key`), so castling rights and en passant do not tell positions
+apart. Segments are searched by binary search through `mmap`, only the
+pages on the search path are read. Building again adds a segment of the new
+and changed sources, entries of replaced or removed sources stay in older
+segments and are hidden by `sources.json` until segments are compacted.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+from . import FILE_MODE
+from .codec import load_games_from_bytes
+from .game import Game
+from .manifest import file_digest, params_digest, stat_of
+
+
+LOGGER = logging.getLogger('ROOT')
+
+SOURCES_NAME = 'sources.json'
+INDEX_VERSION = 1
+# ENTRY is a record of position key, source id, game index in the source and ply.
+ENTRY = struct.Struct('<QIIH')
+# ENTRY_FIELDS is the NumPy dtype of ENTRY, used to sort entries when a segment is written.
+ENTRY_FIELDS = [('key', '<u8'), ('source', '<u4'), ('game', '<u4'), ('ply', '<u2')]
+# SEGMENT_HEADER is magic, version, entry size and number of entries of a segment file.
+SEGMENT_HEADER = struct.Struct('<4sHHQ')
+SEGMENT_MAGIC = b'CPIX'
+# MAX_SEGMENTS is the number of segments over which building compacts them into one.
+MAX_SEGMENTS = 16
+# RUN_ENTRIES is the number of entries sorted in memory at a time when a segment is written.
+RUN_ENTRIES = 1 << 20
+# MERGE_ENTRIES is the number of entries read from each sorted run at a time when runs are merged.
+MERGE_ENTRIES = 1 << 16
+
+_KEY = struct.Struct('<Q')
+
+
+def index_entries_of_bytes(data, state, is_white_run=True, source_id=0):
+    """index_entries_of_bytes replays every game of PGN content, returns ENTRY records of its plies.
+
+    It returns `(chunk, games, plies, errors)` like `positions_of_bytes`,
+    `chunk` holds one unsorted record per ply, ply 0 included.
+    """
+    # records are packed into one buffer, not kept as an object per ply.
+    chunk, games, errors = bytearray(), 0, []
+    pack = ENTRY.pack
+    for index, pgn_game in enumerate(load_games_from_bytes(data)):
+        game = Game(state, is_white_run=is_white_run)
+        games += 1
+        chunk += pack(game.key, source_id, index, 0)
+        for ply, move in enumerate(pgn_game.moves, 1):
+            try:
+                game.apply(move)
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append((index, ply, move, '{}: {}'.format(type(e).__name__, e)))
+                break
+            chunk += pack(game.key, source_id, index, ply)
+    return bytes(chunk), games, len(chunk) // ENTRY.size, errors
+
+
+def merge_runs(runs, f, keep=None, block=MERGE_ENTRIES):
+    """merge_runs writes entries of runs, ENTRY_FIELDS arrays sorted by key, to f sorted by key.
+
+    Runs are read `block` entries at a time, so memory mapped runs are never
+    loaded as a whole. With `keep`, sorted source ids, only entries of those
+    sources are written. It returns the number of entries written.
+    """
+    from numpy import argsort, concatenate, isin  # pylint: disable=import-outside-toplevel
+
+    runs = [run for run in runs if len(run)]
+    starts = [0] * len(runs)
+    count = 0
+    while runs:
+        blocks = [run[start:start + block] for run, start in zip(runs, starts)]
+        # every entry up to the least last key of blocks, which do not end their runs, is read.
+        ends = [b['key'][-1] for run, start, b in zip(runs, starts, blocks)
+                if start + len(b) < len(run)]
+        if ends:
+            cut = min(ends)
+            sizes = [int(b['key'].searchsorted(cut, side='right')) for b in blocks]
+        else:
+            sizes = [len(b) for b in blocks]
+        part = concatenate([b[:size] for b, size in zip(blocks, sizes)])
+        part = part[argsort(part['key'], kind='stable')]
+        if keep is not None:
+            part = part[isin(part['source'], keep)]
+        f.write(part.tobytes())
+        count += len(part)
+        starts = [start + size for start, size in zip(starts, sizes)]
+        left = [i for i, run in enumerate(runs) if starts[i] < len(run)]
+        runs, starts = [runs[i] for i in left], [starts[i] for i in left]
+    return count
+
+
+def write_segment(path, runs, keep=None):
+    """write_segment merges sorted runs into a segment file atomically, see `merge_runs`.
+
+    It returns the number of entries written, no file is written for none.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        os.chmod(tmp_path, FILE_MODE)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, INDEX_VERSION, ENTRY.size, 0))
+            count = merge_runs(runs, f, keep)
+            f.seek(0)
+            f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, INDEX_VERSION, ENTRY.size, count))
+        if count:
+            os.replace(tmp_path, path)
+        else:
+            os.unlink(tmp_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return count
+
+
+class Segment():
+    """Segment reads a segment file through `mmap`, nothing is loaded up front."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size, self.count = SEGMENT_HEADER.unpack_from(self.data)
+        if magic != SEGMENT_MAGIC or version != INDEX_VERSION or size != ENTRY.size:
+            self.data.close()
+            raise ValueError('"{}" is not a segment of index version {}'.format(
+                path, INDEX_VERSION))
+
+    def find(self, key):
+        """find yields `(source, game, ply)` of entries with key."""
+        data, offset, size = self.data, SEGMENT_HEADER.size, ENTRY.size
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _KEY.unpack_from(data, offset + mid * size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        for i in range(lo, self.count):
+            entry_key, source, game, ply = ENTRY.unpack_from(data, offset + i * size)
+            if entry_key != key:
+                break
+            yield source, game, ply
+
+    def close(self):
+        """close unmaps the file."""
+        self.data.close()
+
+
+class PositionIndex():
+    """PositionIndex builds and searches the index in folder `path`.
+
+    Sources are numbered in the order they are added. A source whose file is
+    changed gets a new id and the old one is marked dead, as is a source whose
+    file is gone. `params` are the replay parameters, init state and side to
+    move first, an index built with other params is dropped. Without
+    `params` the index is opened for lookup only.
+    """
+
+    def __init__(self, path, params=None):
+        self.path = path
+        self.table_path = os.path.join(path, SOURCES_NAME)
+        self.sources, self.segments, self.next_segment = [], [], 0
+        self.params = params_digest(params) if params is not None else None
+        self._live = {}
+        # _replaced are segment files to remove once the sources table no longer lists them.
+        self._replaced = []
+        self._readers = None
+        if params is not None:
+            os.makedirs(path, exist_ok=True)
+        self.load()
+        if params is not None and self.params != params_digest(params):
+            LOGGER.info('replay parameters changed, drop index "%s"', path)
+            self._replaced += self.segments
+            self.sources, self.segments, self._live = [], [], {}
+            self.params = params_digest(params)
+
+    def load(self):
+        """load reads sources table, a missing one is taken as an empty index."""
+        try:
+            with open(self.table_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError('index "{}" has version {}, expect {}'.format(
+                self.path, data.get('version'), INDEX_VERSION))
+        self.params = data['params']
+        self.sources, self.segments = data['sources'], data['segments']
+        self.next_segment = data['next_segment']
+        self._live = {entry['name']: i for i, entry in enumerate(self.sources) if entry['live']}
+
+    def save(self):
+        """save writes sources table atomically, then removes replaced segment files."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            os.chmod(tmp_path, FILE_MODE)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'params': self.params,
+                           'sources': self.sources, 'segments': self.segments,
+                           'next_segment': self.next_segment}, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.table_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.close()
+        for name in self._replaced:
+            os.unlink(os.path.join(self.path, name))
+        self._replaced = []
+
+    def is_fresh(self, name, source):
+        """is_fresh tells whether source `name` is indexed from the current content of its file."""
+        source_id = self._live.get(name)
+        if source_id is None:
+            return False
+        entry = self.sources[source_id]
+        current = stat_of(os.stat(source))
+        if entry['source'] == source and entry['stat'] == current:
+            return True
+        if file_digest(source) != entry['digest']:
+            return False
+        # touched but not changed, keep the new stat to skip hashing next time.
+        entry['source'], entry['stat'] = source, current
+        return True
+
+    def add_source(self, name, source, data, stat):
+        """add_source records source `name` read as `data`, returns its id.
+
+        `stat` is the `os.stat_result` of source taken when `data` was read.
+        A previous source of the same name is marked dead.
+        """
+        previous = self._live.get(name)
+        if previous is not None:
+            self.sources[previous]['live'] = False
+        self._live[name] = len(self.sources)
+        self.sources.append({'name': name, 'source': source,
+                             'digest': hashlib.blake2b(data, digest_size=20).hexdigest(),
+                             'stat': stat_of(stat), 'live': True})
+        return self._live[name]
+
+    def orphans(self):
+        """orphans returns names of live sources whose file is gone, and marks them dead."""
+        names = sorted(name for name, i in self._live.items()
+                       if not os.path.isfile(self.sources[i]['source']))
+        for name in names:
+            self.sources[self._live.pop(name)]['live'] = False
+        return names
+
+    def add_segment(self, chunks, run_size=RUN_ENTRIES):
+        """add_segment writes ENTRY records of chunks, an iterable of bytes, as a new segment.
+
+        Chunks are taken as they come. Records are sorted about `run_size` at
+        a time, sorted runs are spilled to temporary files in the index folder
+        and merged into the segment, so memory is bounded by a run, not by
+        the number of records. Nothing is written for no records.
+        """
+        # pylint: disable=import-outside-toplevel
+        from numpy import argsort, dtype, frombuffer, memmap
+
+        entry_dtype = dtype(ENTRY_FIELDS)
+        runs, paths, buffer, size = [], [], [], 0
+
+        def sort_buffer():
+            entries = frombuffer(b''.join(buffer), dtype=entry_dtype)
+            buffer.clear()
+            return entries[argsort(entries['key'], kind='stable')]
+
+        try:
+            for chunk in chunks:
+                buffer.append(chunk)
+                size += len(chunk) // ENTRY.size
+                if size >= run_size:
+                    fd, path = tempfile.mkstemp(dir=self.path, suffix='.run')
+                    paths.append(path)
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(sort_buffer().tobytes())
+                    runs.append(memmap(path, dtype=entry_dtype, mode='r'))
+                    size = 0
+            if size:
+                runs.append(sort_buffer())
+            self._add_segment(runs)
+        finally:
+            del runs[:]
+            for path in paths:
+                os.unlink(path)
+
+    def _add_segment(self, runs, keep=None):
+        name = '{:06d}.seg'.format(self.next_segment)
+        count = write_segment(os.path.join(self.path, name), runs, keep)
+        if count:
+            self.next_segment += 1
+            self.segments.append(name)
+            self.close()
+        return count
+
+    def compact(self):
+        """compact merges segments into one leaving out entries of dead sources, returns its size.
+
+        Segments are sorted runs already, they are merged a block at a time.
+        Replaced segment files are removed by the next `save`.
+        """
+        from numpy import dtype, memmap  # pylint: disable=import-outside-toplevel
+
+        entry_dtype = dtype(ENTRY_FIELDS)
+        runs = [memmap(os.path.join(self.path, name), dtype=entry_dtype, mode='r',
+                       offset=SEGMENT_HEADER.size) for name in self.segments]
+        self.close()
+        self._replaced += self.segments
+        self.segments = []
+        return self._add_segment(runs, sorted(self._live.values()))
+
+    def lookup(self, key):
+        """lookup returns `(source name, game index, ply)` of live entries with key, sorted."""
+        if self._readers is None:
+            self._readers = [Segment(os.path.join(self.path, name)) for name in self.segments]
+        sources = self.sources
+        hits = sorted((source, game, ply) for reader in self._readers
+                      for source, game, ply in reader.find(key) if sources[source]['live'])
+        return [(sources[source]['name'], game, ply) for source, game, ply in hits]
+
+    def close(self):
+        """close unmaps segment files opened by lookup."""
+        for reader in self._readers or ():
+            reader.close()
+        self._readers = None
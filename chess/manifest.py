@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""manifest module records what each file in an output folder was rendered from."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from . import FILE_MODE
+
+
+LOGGER = logging.getLogger('ROOT')
+
+MANIFEST_NAME = '.manifest.json'
+MANIFEST_VERSION = 1
+
+
+def file_digest(file_path):
+    """file_digest returns hex digest of file content."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stat_of(info):
+    """stat_of returns size and modification time of an `os.stat_result`, as recorded."""
+    return [info.st_size, info.st_mtime_ns]
+
+
+def params_digest(params):
+    """params_digest returns hex digest of render parameters, a JSON serializable dict."""
+    data = json.dumps(params, sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class Manifest():
+    """Manifest maps output file name to the digests of its source and render parameters.
+
+    Source digests are reused while size and modification time of the source
+    stay the same, so checking an unchanged folder reads no source file.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """load reads manifest file, a missing or unreadable one is taken as empty."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            LOGGER.warning('ignore broken manifest "%s", %s', self.path, e)
+            return
+        if data.get('version') == MANIFEST_VERSION:
+            self.entries = data['entries']
+
+    def save(self):
+        """save writes manifest file atomically."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, suffix='.tmp')
+        try:
+            os.chmod(tmp_path, FILE_MODE)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f,
+                          indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def source_digest(self, name, source):
+        """source_digest returns digest and stat of source, reusing the recorded digest."""
+        entry = self.entries.get(name)
+        current = stat_of(os.stat(source))
+        if entry and entry['source'] == source and entry['stat'] == current:
+            return entry['digest'], current
+        return file_digest(source), current
+
+    def is_fresh(self, name, source, params, data=None, stat=None):
+        """is_fresh tells whether output `name` exists and is rendered from source with params.
+
+        `data` is the part of source the output is rendered from, like a game
+        of an archive, it is compared instead of the whole file. It is given
+        with `stat`, the `os.stat_result` of source taken when `data` was read.
+        """
+        entry = self.entries.get(name)
+        if not entry or entry['params'] != params_digest(params):
+            return False
+        if not os.path.exists(os.path.join(self.output_dir, name)):
+            return False
+        if data is not None:
+            digest, stat = hashlib.blake2b(data, digest_size=20).hexdigest(), stat_of(stat)
+        else:
+            digest, stat = self.source_digest(name, source)
+        if digest != entry['digest']:
+            return False
+        # touched but not changed, keep the new stat to skip hashing next time.
+        entry['source'], entry['stat'] = source, stat
+        return True
+
+    def record(self, name, source, params, data=None, stat=None):
+        """record marks output `name` as rendered from source with params.
+
+        `data` is the source content read for rendering, it saves reading
+        the source again. It is given with `stat`, the `os.stat_result` of
+        source taken when `data` was read, so a source changed since is not
+        recorded with the digest of its older content.
+        """
+        if data is None:
+            digest, stat = self.source_digest(name, source)
+        else:
+            digest, stat = hashlib.blake2b(data, digest_size=20).hexdigest(), stat_of(stat)
+        self.entries[name] = {'source': source, 'digest': digest, 'stat': stat,
+                              'params': params_digest(params)}
+
+    def orphans(self):
+        """orphans returns names of recorded outputs whose source is gone, and drops them."""
+        names = sorted(name for name, entry in self.entries.items()
+                       if not os.path.isfile(entry['source']))
+        for name in names:
+            del self.entries[name]
+        return names
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""metrics module measures wall and CPU time spent in each stage of rendering."""
+
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # pragma: no cover, not available on Windows.
+    resource = None
+
+
+def peak_rss_kb(who='self'):
+    """peak_rss_kb returns peak resident set size in KB of this process or its children."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in bytes on macOS, in KB elsewhere.
+    return usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+
+
+class Metrics():
+    """Metrics accumulates wall time, CPU time and calls per stage, and counters.
+
+    Code in `chess.board` and `chess.codec` reports to the metrics given to
+    it, stages are `parse`, `replay`, `compose`, `convert`, `cache`, `encode`
+    and `write`, counters are `composed` and written `frames`, `bytes` and
+    `cache_hits`.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = Counter()
+
+    @staticmethod
+    def begin():
+        """begin returns the start mark of a stage, which is passed to `end`."""
+        return time.perf_counter(), time.process_time()
+
+    def end(self, name, mark):
+        """end adds the time since mark to stage `name`."""
+        wall, cpu = time.perf_counter() - mark[0], time.process_time() - mark[1]
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = [0.0, 0.0, 0]
+        stage[0] += wall
+        stage[1] += cpu
+        stage[2] += 1
+
+    @contextmanager
+    def stage(self, name):
+        """stage times the block as stage `name`."""
+        mark = self.begin()
+        try:
+            yield
+        finally:
+            self.end(name, mark)
+
+    def add(self, name, value=1):
+        """add increases counter `name` by value."""
+        self.counters[name] += value
+
+    def merge(self, other):
+        """merge adds stages and counters of `other`, a `Metrics` or its `to_dict`."""
+        if isinstance(other, Metrics):
+            other = other.to_dict()
+        for name, stage in other['stages'].items():
+            total = self.stages.setdefault(name, [0.0, 0.0, 0])
+            total[0] += stage['wall']
+            total[1] += stage['cpu']
+            total[2] += stage['calls']
+        self.counters.update(other['counters'])
+
+    def to_dict(self):
+        """to_dict returns stages and counters as a JSON serializable dict."""
+        return {
+            'stages': {name: {'wall': wall, 'cpu': cpu, 'calls': calls}
+                       for name, (wall, cpu, calls) in sorted(self.stages.items())},
+            'counters': dict(sorted(self.counters.items())),
+        }
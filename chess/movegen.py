@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""movegen module generates legal moves of a game and counts them by perft.
+
+A move is a `Move` of origin and destination squares and the piece code of
+a promotion, 0 for none. Castling is the king moving two squares, en
+passant a pawn capturing to `Game.ep`. Moves are made on a `Game` by `push`
+and taken back by `pop`, which keep castling rights, en passant square and
+clocks as `Game.apply` does.
+"""
+
+from collections import namedtuple
+
+from . import WHITE, BLACK
+from .game import (EMPTY, PIECE_NAMES, SQUARE_NAMES, SAN_CODES, KNIGHT_ATTACKS, KING_ATTACKS,
+                   PAWN_ATTACKS, PAWN_CODES, KING_CODES, ROCK_RAYS, BISHOP_RAYS, CASTLING_HOMES,
+                   CASTLING_KEEP, CASTLING_PATHS, is_attacked, slider_behind)
+
+
+# PROMOTIONS are SAN letters of the pieces a pawn promotes to.
+PROMOTIONS = 'QRBN'
+
+# PERFT_POSITIONS maps name to FEN and perft node counts from depth 1 of well known positions.
+PERFT_POSITIONS = {
+    'start': ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+              (20, 400, 8902, 197281, 4865609)),
+    'kiwipete': ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                 (48, 2039, 97862, 4085603)),
+    'endgame': ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+                (14, 191, 2812, 43238, 674624)),
+    'promotions': ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+                   (6, 264, 9467, 422333)),
+    'discovered': ('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+                   (44, 1486, 62379, 2103487)),
+}
+
+
+class Move(namedtuple('Move', ['src', 'dest', 'promotion'])):
+    """Move is a move from square src to dest, promoting to piece code `promotion` if not 0."""
+
+    __slots__ = ()
+
+    def __str__(self):
+        """__str__ returns the move in UCI notation, like `e2e4` or `e7e8q`."""
+        return SQUARE_NAMES[self.src] + SQUARE_NAMES[self.dest] + (
+            PIECE_NAMES[self.promotion][1] if self.promotion else '')
+
+
+def pseudo_legal_moves(game):
+    """pseudo_legal_moves returns moves of the side to move, some may leave its king in check.
+
+    Castling is checked in full: right, empty squares in between, king not
+    in check and not crossing an attacked square.
+    """
+    position, white = game.position, game.is_white_run
+    squares, pieces = position.squares, position.pieces
+    codes = SAN_CODES[WHITE if white else BLACK]
+    moves = []
+    append = moves.append
+
+    def is_target(code):
+        return not code or (code > 6) == white
+
+    for letter, table in (('N', KNIGHT_ATTACKS), ('K', KING_ATTACKS)):
+        for src in pieces[codes[letter]]:
+            for dest in table[src]:
+                if is_target(squares[dest]):
+                    append(Move(src, dest, 0))
+    for letter, rays in (('R', (ROCK_RAYS,)), ('B', (BISHOP_RAYS,)),
+                         ('Q', (ROCK_RAYS, BISHOP_RAYS))):
+        for src in pieces[codes[letter]]:
+            for table in rays:
+                for ray in table[src]:
+                    for dest in ray:
+                        code = squares[dest]
+                        if code:
+                            if (code > 6) == white:
+                                append(Move(src, dest, 0))
+                            break
+                        append(Move(src, dest, 0))
+
+    step, start, last = (8, 1, 7) if white else (-8, 6, 0)
+    promotions = tuple(codes[p] for p in PROMOTIONS)
+    for src in pieces[codes['P']]:
+        dests = []
+        dest = src + step
+        if not 0 <= dest < 64:
+            # a pawn on its last rank, not a legal position.
+            continue
+        if not squares[dest]:
+            dests.append(dest)
+            if src >> 3 == start and not squares[dest + step]:
+                append(Move(src, dest + step, 0))
+        for dest in PAWN_ATTACKS[not white][src]:
+            code = squares[dest]
+            if code and (code > 6) == white or dest == game.ep:
+                dests.append(dest)
+        for dest in dests:
+            if dest >> 3 == last:
+                moves.extend(Move(src, dest, code) for code in promotions)
+            else:
+                append(Move(src, dest, 0))
+
+    for bit in ((0, 1) if white else (2, 3)):
+        king, king_code, rock, rock_code = CASTLING_HOMES[bit]
+        between, crossed = CASTLING_PATHS[bit]
+        if (game.castling >> bit & 1 and squares[king] == king_code and
+                squares[rock] == rock_code and not any(squares[s] for s in between) and
+                not is_attacked(position, king, not white) and
+                not is_attacked(position, crossed[0], not white)):
+            # the square the king lands on is checked like any other move.
+            append(Move(king, crossed[1], 0))
+    return moves
+
+
+def push(game, move):
+    """push makes move on game, returns what `pop` needs to take it back."""
+    position = game.position
+    squares = position.squares
+    src, dest, promotion = move
+    code = squares[src]
+    changes = [(src, code), (dest, squares[dest])]
+    irreversible = bool(squares[dest]) or code in PAWN_CODES
+    ep = None
+    if code in PAWN_CODES:
+        if dest == game.ep:
+            taken = dest - 8 if game.is_white_run else dest + 8
+            changes.append((taken, squares[taken]))
+            position.put(taken, EMPTY)
+        elif dest - src in (16, -16):
+            ep = (src + dest) >> 1
+    elif code in KING_CODES and dest - src in (2, -2):
+        rock, rock_to = (src + 3, src + 1) if dest > src else (src - 4, src - 1)
+        changes += [(rock, squares[rock]), (rock_to, EMPTY)]
+        position.move(rock, rock_to, squares[rock])
+    undo = (changes, game.castling, game.ep, game.halfmove, game.fullmove, game.checked)
+    game.castling &= CASTLING_KEEP[src] & CASTLING_KEEP[dest]
+    position.move(src, dest, promotion or code)
+    game.ep, game.checked = ep, None
+    game.halfmove = 0 if irreversible else game.halfmove + 1
+    if not game.is_white_run:
+        game.fullmove += 1
+    game.is_white_run = not game.is_white_run
+    return undo
+
+
+def pop(game, undo):
+    """pop takes back the move `push` returned undo of."""
+    changes, game.castling, game.ep, game.halfmove, game.fullmove, game.checked = undo
+    put = game.position.put
+    for square, code in reversed(changes):
+        put(square, code)
+    game.is_white_run = not game.is_white_run
+
+
+def legal_moves(game):
+    """legal_moves returns the moves of the side to move which do not leave its king in check.
+
+    Out of check, a move of another piece than the king which is not pinned
+    and is not en passant is legal, other pseudo-legal moves are made and
+    taken back. A board without a king of the side to move takes them all.
+    """
+    position, white = game.position, game.is_white_run
+    squares = position.squares
+    kings = position.pieces[KING_CODES[not white]]
+    if len(kings) != 1:
+        return pseudo_legal_moves(game)
+    king = next(iter(kings))
+    enemy = SAN_CODES[BLACK if white else WHITE]
+    in_check = is_attacked(position, king, not white)
+    moves = []
+    for move in pseudo_legal_moves(game):
+        src = move.src
+        if not in_check and src != king and \
+                not (move.dest == game.ep and squares[src] in PAWN_CODES) and \
+                not slider_behind(squares, king, src, enemy):
+            moves.append(move)
+            continue
+        undo = push(game, move)
+        if not is_attacked(position, move.dest if src == king else king, not white):
+            moves.append(move)
+        pop(game, undo)
+    return moves
+
+
+def perft(game, depth):
+    """perft returns the number of move paths of depth plies from the position of game."""
+    if depth == 0:
+        return 1
+    moves = legal_moves(game)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = push(game, move)
+        nodes += perft(game, depth - 1)
+        pop(game, undo)
+    return nodes
+
+
+def divide(game, depth):
+    """divide returns `(move, nodes)` of perft below each legal move, depth counts the move."""
+    result = []
+    for move in legal_moves(game):
+        undo = push(game, move)
+        result.append((move, perft(game, depth - 1)))
+        pop(game, undo)
+    return result
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""plies module parses which plies of games are rendered, as given by `--plies`."""
+
+
+class PlySelection():
+    """PlySelection selects plies of a game to render, ply 0 is the initial position.
+
+    `spec` is `final` for the final position, `every:K` for every K-th ply
+    from the initial position, or comma separated ply numbers, where a
+    negative number counts from the end, `-1` is the final position.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.every, self.plies = None, ()
+        try:
+            if spec == 'final':
+                self.plies = (-1,)
+            elif spec.startswith('every:'):
+                self.every = int(spec[len('every:'):])
+                if self.every < 1:
+                    raise ValueError
+            else:
+                self.plies = tuple(int(ply) for ply in spec.split(','))
+        except ValueError:
+            raise ValueError(
+                'bad plies "{}", expect final, every:K or N[,N...]'.format(spec)) from None
+
+    @property
+    def single(self):
+        """single tells whether at most one ply is selected in any game."""
+        return self.every is None and len(self.plies) == 1
+
+    def select(self, count):
+        """select returns sorted plies of a game of `count` moves, dropping out of range ones."""
+        if self.every is not None:
+            return list(range(0, count + 1, self.every))
+        plies = {ply + count + 1 if ply < 0 else ply for ply in self.plies}
+        return sorted(ply for ply in plies if 0 <= ply <= count)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""positions module replays games without rendering and writes one record per ply.
+
+Two formats are written:
+
+    fen     NDJSON lines `{"source": ..., "game": 0, "ply": 1, "move": "e4", "fen": ...}`
+    binary  fixed-width records of RECORD_HEADER followed by `Game.pack`
+
+Ply 0 is the initial position, its move is null. Games are numbered from
+0 within their source, a binary record refers to its source by number.
+`validate_bytes` replays the same way and writes nothing, it only reports
+the games which stop at a move.
+"""
+
+import json
+import logging
+import struct
+
+from .codec import load_games_from_bytes
+from .game import Game, PACKED_POSITION
+
+
+LOGGER = logging.getLogger('ROOT')
+
+FORMATS = ('fen', 'binary')
+# RECORD_HEADER is source number, game index and ply of a binary record.
+RECORD_HEADER = struct.Struct('<IIH')
+# RECORD_SIZE is the size in bytes of a binary record.
+RECORD_SIZE = RECORD_HEADER.size + PACKED_POSITION.size
+
+
+def iter_positions(moves, state, is_white_run=True):
+    """iter_positions replays moves from state, yields `(ply, move, game)` per ply.
+
+    The same `Game` is yielded every time, read it before asking for the
+    next ply. Ply 0 is the initial position with move None.
+    """
+    game = Game(state, is_white_run=is_white_run)
+    yield 0, None, game
+    for ply, move in enumerate(moves, 1):
+        game.apply(move)
+        yield ply, move, game
+
+
+def positions_of_games(games, state, is_white_run=True,  # pylint: disable=too-many-arguments
+                       fmt='fen', source='', source_no=0, first=0):
+    """positions_of_games replays PgnGame games, returns records of their plies.
+
+    It returns `(chunk, games, plies, errors)`, `chunk` holds the records of
+    all plies in format `fmt`, `games` and `plies` are their numbers. Games
+    are numbered from `first`, so a range of the games of a source is
+    replayed alone. A game stops at a move which can not be made, positions
+    before it are kept and `(game index, ply, move, message)` is added to
+    `errors`.
+    """
+    chunks, count, plies, errors = [], 0, 0, []
+    binary = fmt == 'binary'
+    source_json = json.dumps(source, ensure_ascii=False)
+    for index, pgn_game in enumerate(games, first):
+        game = Game(state, is_white_run=is_white_run)
+        count += 1
+        if binary:
+            chunks.append(RECORD_HEADER.pack(source_no, index, 0) + game.pack())
+        else:
+            prefix = '{{"source": {}, "game": {}, '.format(source_json, index)
+            chunks.append('{}"ply": 0, "move": null, "fen": "{}"}}\n'.format(prefix, game.fen()))
+        plies += 1
+        for ply, move in enumerate(pgn_game.moves, 1):
+            try:
+                game.apply(move)
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append((index, ply, move, '{}: {}'.format(type(e).__name__, e)))
+                break
+            if binary:
+                chunks.append(RECORD_HEADER.pack(source_no, index, ply) + game.pack())
+            else:
+                chunks.append('{}"ply": {}, "move": {}, "fen": "{}"}}\n'.format(
+                    prefix, ply, json.dumps(move), game.fen()))
+            plies += 1
+    chunk = b''.join(chunks) if binary else ''.join(chunks).encode('utf-8')
+    return chunk, count, plies, errors
+
+
+def positions_of_bytes(data, state, is_white_run=True,  # pylint: disable=too-many-arguments
+                       fmt='fen', source='', source_no=0):
+    """positions_of_bytes replays every game of PGN content, see `positions_of_games`."""
+    return positions_of_games(load_games_from_bytes(data), state, is_white_run=is_white_run,
+                              fmt=fmt, source=source, source_no=source_no)
+
+
+def validate_bytes(data, state, is_white_run=True, strict=True):
+    """validate_bytes replays every game of PGN content, returns `(games, plies, errors)`.
+
+    With `strict`, moves are replayed by `Game(validate=True)` which rejects
+    illegal moves, else only moves no piece can make are found, as rendering
+    does. `errors` holds `(game index, ply, move, message)` of the first bad
+    move of each failed game.
+    """
+    games, plies, errors = 0, 0, []
+    for index, pgn_game in enumerate(load_games_from_bytes(data)):
+        game = Game(state, is_white_run=is_white_run, validate=strict)
+        games += 1
+        for ply, move in enumerate(pgn_game.moves, 1):
+            try:
+                game.apply(move)
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append((index, ply, move, '{}: {}'.format(type(e).__name__, e)))
+                break
+            plies += 1
+    return games, plies, errors
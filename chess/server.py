@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""server module serves GIF rendering over HTTP, boards are kept warm in worker processes.
+
+    POST /render?white=%23EAE9D2&black=%234B7399&delay=1.62&black_first=0&size=520
+
+with PGN text as body answers the GIF of its first game, `GET /stats`
+answers counters of the server as JSON.
+"""
+
+import asyncio
+import io
+import json
+import logging
+import os
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlsplit
+
+from .board import Board, BOARD_SIZE
+from .cache import FrameCache
+from .codec import load_moves_from_bytes, save_game_to_file
+
+
+LOGGER = logging.getLogger('ROOT')
+
+DEFAULT_OPTIONS = {'white': '#EAE9D2', 'black': '#4B7399', 'delay': 1.62, 'black_first': False,
+                   'size': BOARD_SIZE}
+# SIZE_RANGE is the range of board size in pixels a request may ask for.
+SIZE_RANGE = (40, 2048)
+# BOARDS_PER_WORKER is the number of boards, one per colors and size, kept by a worker process.
+BOARDS_PER_WORKER = 8
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           408: 'Request Timeout', 413: 'Payload Too Large', 500: 'Internal Server Error',
+           501: 'Not Implemented', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+# _WORKER holds state and boards of current worker process, see `_init_worker`.
+_WORKER = {}
+
+
+def _init_worker(state, font_path, cache_path=None, cache_size=None):
+    _WORKER['state'] = state
+    _WORKER['font_path'] = font_path
+    _WORKER['boards'] = OrderedDict()
+    _WORKER['cache'] = FrameCache(cache_path, cache_size) if cache_path else None
+    _board(DEFAULT_OPTIONS['white'], DEFAULT_OPTIONS['black'], DEFAULT_OPTIONS['size'])
+
+
+def _board(white, black, size):
+    """_board returns the board of colors and size, boards are created once and kept warm."""
+    boards = _WORKER['boards']
+    key = (white, black, size)
+    if key in boards:
+        boards.move_to_end(key)
+    else:
+        LOGGER.debug('create chess board, white "%s", black "%s", size %s', white, black, size)
+        boards[key] = Board(_WORKER['state'], white_color=white, black_color=black,
+                            font_path=_WORKER['font_path'], size=size)
+        if len(boards) > BOARDS_PER_WORKER:
+            boards.popitem(last=False)
+    return boards[key]
+
+
+def _ping():
+    return os.getpid()
+
+
+def render_gif(pgn, options):
+    """render_gif renders the first game of PGN content in a worker process, returns GIF bytes."""
+    board = _board(options['white'], options['black'], options['size'])
+    board.reset(_WORKER['state'], is_white_run=not options['black_first'])
+    moves = load_moves_from_bytes(pgn)
+    buffer = io.BytesIO()
+    # a move which can not be made raises IllegalMoveError, a ValueError.
+    save_game_to_file(buffer, board, moves, options['delay'], cache=_WORKER['cache'])
+    return buffer.getvalue()
+
+
+def parse_options(query):
+    """parse_options returns render options of query string, raises ValueError on bad value."""
+    options = dict(DEFAULT_OPTIONS)
+    for name, values in parse_qs(query).items():
+        if name not in options:
+            raise ValueError('unknown option "{}"'.format(name))
+        value = values[-1]
+        if name == 'delay':
+            options[name] = float(value)
+            if not 0 <= options[name] <= 655:
+                raise ValueError('delay out of range')
+        elif name == 'size':
+            options[name] = int(value)
+            if not SIZE_RANGE[0] <= options[name] <= SIZE_RANGE[1]:
+                raise ValueError('size out of range')
+        elif name == 'black_first':
+            options[name] = value.lower() in ('1', 'true', 'yes')
+        else:
+            options[name] = value
+    return options
+
+
+class HttpError(Exception):
+    """HttpError is raised while handling a request to answer with an error status."""
+
+    def __init__(self, status, message=None):
+        super().__init__(message or REASONS[status])
+        self.status = status
+
+
+class RenderServer():  # pylint: disable=too-many-instance-attributes
+    """RenderServer is an asyncio HTTP server rendering GIFs by a pool of worker processes.
+
+    At most `queue_size` renders are accepted at a time, running or waiting
+    for a worker, more are answered 503 right away. A render which takes
+    longer than `timeout` seconds is answered 504, and a client which does
+    not send its request in `timeout` is answered 408.
+
+    A render answered 504 is cancelled if it has not started yet. A
+    started one can not be stopped in its worker process. It runs to its
+    end, bounded by `max_body` bytes of PGN, and keeps its place in the
+    queue until then. Abandoned renders therefore never add up to more
+    than `queue_size`.
+
+    Bodies are read by Content-Length or by chunked Transfer-Encoding,
+    other transfer codings are answered 501.
+
+    A worker process which dies breaks the whole pool, its renders are
+    answered 500 and the pool is replaced by a new one for the next requests.
+    """
+
+    def __init__(self, state, jobs=1, queue_size=None,  # pylint: disable=too-many-arguments
+                 timeout=30.0, font_path='/Library/Fonts/Arial.ttf',
+                 cache_path=None, cache_size=None, max_body=1024 * 1024):
+        self.jobs = jobs
+        self.queue_size = queue_size or 2 * jobs
+        self.timeout = timeout
+        self.max_body = max_body
+        self.state = state
+        self.font_path = font_path
+        self._initargs = (state, font_path, cache_path, cache_size)
+        self.executor = self._create_executor()
+        self.pending = 0
+        self.counters = Counter()
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker,
+                                   initargs=self._initargs)
+
+    def _restart(self, executor):
+        """_restart replaces a broken executor, once, however many renders failed with it."""
+        if executor is self.executor:
+            LOGGER.error('worker process died, restart the pool')
+            self.counters['restarts'] += 1
+            executor.shutdown(wait=False)
+            self.executor = self._create_executor()
+
+    async def warm_up(self):
+        """warm_up starts every worker process, so that boards are ready before first request.
+
+        Assets of default colors are loaded before workers are forked, they share them.
+        """
+        Board(self.state, white_color=DEFAULT_OPTIONS['white'],
+              black_color=DEFAULT_OPTIONS['black'], font_path=self.font_path).preload()
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(loop.run_in_executor(self.executor, _ping)
+                                      for _ in range(self.jobs)))
+        LOGGER.debug('workers %s are ready', sorted(set(pids)))
+
+    async def render(self, body, query):
+        """render renders PGN body with options of query in a worker, returns GIF bytes."""
+        try:
+            options = parse_options(query)
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        if self.pending >= self.queue_size:
+            self.counters['rejected'] += 1
+            raise HttpError(503, 'too many requests in queue')
+
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            future = executor.submit(render_gif, body, options)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise HttpError(500, 'worker process died') from None
+        self.pending += 1
+        # the place in queue is given back once the worker is done, not when the request is.
+        future.add_done_callback(lambda _: self._call_soon(loop, self._release))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise HttpError(500, 'worker process died') from None
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            if future.cancelled():
+                self.counters['cancelled'] += 1
+            raise HttpError(504, 'render took longer than {}s'.format(self.timeout))
+        except (KeyError, ValueError) as e:
+            # bad move or color in request.
+            raise HttpError(400, '{}: {}'.format(type(e).__name__, e))
+
+    def _release(self):
+        self.pending -= 1
+
+    @staticmethod
+    def _call_soon(loop, callback):
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # the loop is closed, nobody counts pending renders any more.
+            pass
+
+    async def dispatch(self, method, target, body):
+        """dispatch returns `(content type, payload)` of a request."""
+        url = urlsplit(target)
+        if url.path == '/render':
+            if method != 'POST':
+                raise HttpError(405)
+            return 'image/gif', await self.render(body, url.query)
+        if url.path == '/stats':
+            stats = dict(self.counters, pending=self.pending, queue_size=self.queue_size,
+                         jobs=self.jobs)
+            return 'application/json', json.dumps(stats, sort_keys=True).encode('utf-8')
+        raise HttpError(404)
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise HttpError(400, 'bad request line')
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        encoding = headers.get('transfer-encoding')
+        if encoding is not None:
+            if encoding.lower() != 'chunked':
+                raise HttpError(501, 'transfer encoding "{}" is not supported'.format(encoding))
+            if 'content-length' in headers:
+                raise HttpError(400, 'both content length and transfer encoding')
+            body = await self._read_chunked(reader)
+        else:
+            try:
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                raise HttpError(400, 'bad content length')
+            if length > self.max_body:
+                raise HttpError(413)
+            body = await reader.readexactly(length)
+        keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+        return method, target, body, keep_alive
+
+    async def _read_chunked(self, reader):
+        body = bytearray()
+        while True:
+            line = await reader.readline()
+            try:
+                size = int(line.split(b';', 1)[0], 16)
+            except ValueError:
+                raise HttpError(400, 'bad chunk size') from None
+            if size < 0:
+                raise HttpError(400, 'bad chunk size')
+            if len(body) + size > self.max_body:
+                raise HttpError(413)
+            if not size:
+                break
+            body += await reader.readexactly(size)
+            if await reader.readline() not in (b'\r\n', b'\n'):
+                raise HttpError(400, 'bad chunk')
+        # trailer fields are ignored.
+        while await reader.readline() not in (b'\r\n', b'\n', b''):
+            pass
+        return bytes(body)
+
+    async def handle(self, reader, writer):
+        """handle serves requests of a connection until it is closed."""
+        keep_alive = True
+        try:
+            while keep_alive:
+                status, content_type, request = 200, 'text/plain', None
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.timeout)
+                    if request is None:
+                        break
+                    method, target, body, keep_alive = request
+                    self.counters['requests'] += 1
+                    content_type, payload = await self.dispatch(method, target, body)
+                except asyncio.TimeoutError:
+                    status, payload, keep_alive = 408, b'request timeout', False
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HttpError as e:
+                    status, payload = e.status, str(e).encode('utf-8')
+                    # the rest of a bad request can not be told from the next one.
+                    keep_alive = keep_alive and request is not None
+                except Exception as e:  # pylint: disable=broad-except
+                    LOGGER.exception('failed to serve request')
+                    status, payload = 500, '{}: {}'.format(type(e).__name__, e).encode('utf-8')
+                self.counters[str(status)] += 1
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n'
+                             'Connection: {}\r\n\r\n'.format(
+                                 status, REASONS[status], content_type, len(payload),
+                                 'keep-alive' if keep_alive else 'close').encode('latin-1'))
+                writer.write(payload)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        """serve warms up workers and serves forever."""
+        await self.warm_up()
+        server = await asyncio.start_server(self.handle, host, port)
+        LOGGER.info('serving on http://%s:%s with %s workers', host, port, self.jobs)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        """close shuts worker processes down."""
+        self.executor.shutdown(wait=False)
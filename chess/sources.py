@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""sources module finds input files and feeds them through bounded pools of workers."""
+
+import collections
+import fnmatch
+import logging
+import os
+import queue
+import threading
+
+
+LOGGER = logging.getLogger('ROOT')
+
+DEFAULT_INCLUDE = ('*.pgn',)
+
+
+def _matches(name, patterns):
+    return any(fnmatch.fnmatch(name, p) for p in patterns)
+
+
+def _walk(top, rel, include, exclude):
+    try:
+        with os.scandir(top) as it:
+            entries = sorted(it, key=lambda e: e.name)
+    except OSError as e:
+        LOGGER.warning('skip folder "%s", %s', top, e)
+        return
+    for entry in entries:
+        name = os.path.join(rel, entry.name) if rel else entry.name
+        if _matches(entry.name, exclude) or _matches(name, exclude):
+            continue
+        if entry.is_dir():
+            yield from _walk(entry.path, name, include, exclude)
+        elif entry.is_file() and _matches(entry.name, include):
+            yield entry.path, name
+
+
+def iter_files(paths, include=DEFAULT_INCLUDE, exclude=()):
+    """iter_files yields `(path, name)` of files in paths, folders are walked recursively.
+
+    `name` is the path relative to the folder argument, or the base name of a
+    file argument. Files in folders are taken if their name matches one of
+    `include` globs, files and folders matching one of `exclude` globs, by
+    name or relative path, are left out. Files are yielded while walking, so
+    the first ones come before the whole tree is scanned.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            LOGGER.debug('walk folder "%s"', path)
+            yield from _walk(path, '', include, exclude)
+        elif os.path.isfile(path):
+            yield path, os.path.basename(path)
+        else:
+            LOGGER.warning('skip "%s", no such file or folder', path)
+
+
+def read_file(file_path):
+    """read_file returns content of file in bytes."""
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def read_source(file_path):
+    """read_source returns content of file in bytes and its `os.stat_result`.
+
+    The stat is taken before reading, a file changed while it is read gets a
+    newer stat than the one returned, so it is not taken as unchanged later.
+    """
+    with open(file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        return f.read(), stat
+
+
+def bounded_map(executor, func, items, depth):
+    """bounded_map yields `(args, future)` of `func(*args)` run by executor, in order of items.
+
+    `items` is an iterable of argument tuples. At most `depth` calls are
+    pending at a time, so items are taken from the iterable only as fast as
+    results are consumed.
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append((item, executor.submit(func, *item)))
+        if len(pending) >= depth:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+
+def _put(values, item, stop):
+    while not stop.is_set():
+        try:
+            values.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _drain(func, args, values, stop):
+    try:
+        for value in func(*args):
+            if not _put(values, (True, value), stop):
+                return
+        item = (False, None)
+    except Exception as e:  # pylint: disable=broad-except
+        item = (False, e)
+    _put(values, item, stop)
+
+
+def _iter_values(values):
+    while True:
+        ok, value = values.get()
+        if not ok:
+            if value is not None:
+                raise value
+            return
+        yield value
+
+
+def iter_ahead(executor, func, items, depth, size):
+    """iter_ahead yields `(args, values)`, values of iterator `func(*args)`, in order of items.
+
+    Iterators are run by executor threads while earlier ones are consumed, at
+    most `depth` of them at a time and each at most `size` values ahead of
+    its consumer, so nothing is read as a whole. An exception raised by an
+    iterator is raised by `values`. `values` should be consumed in full
+    before the next one is taken, closing the generator stops every thread.
+    """
+    stop = threading.Event()
+    pending = collections.deque()
+    try:
+        for item in items:
+            values = queue.Queue(size)
+            executor.submit(_drain, func, item, values, stop)
+            pending.append((item, values))
+            if len(pending) >= depth:
+                item, values = pending.popleft()
+                yield item, _iter_values(values)
+        while pending:
+            item, values = pending.popleft()
+            yield item, _iter_values(values)
+    finally:
+        stop.set()
@@ -2,18 +2,33 @@
 """Bootstrap scripts for chess game utilities."""
 
 import argparse
+import heapq
+import json
 import logging
+import marshal
 import os
 import sys
-
-from chess.board import Board
-from chess.codec import load_moves_from_file, load_state_from_file, save_image_to_file
-from chess.game import load_empty_state
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from chess.metrics import Metrics, peak_rss_kb
+from chess.codec import (load_moves_from_bytes, load_games_from_file, load_state_from_file,
+                         parse_games, save_game_to_file, save_plies_to_file)
+from chess.sources import (bounded_map, iter_ahead, iter_files, read_file, read_source,
+                           DEFAULT_INCLUDE)
+from chess.plies import PlySelection
 from chess import list_supported_state_files, EMPTY_STATE, __version__
 
 
 LOGGER = logging.getLogger('ROOT')
 
+# modules of a sub-command, like chess.game, chess.index or chess.archive, are imported by its
+# function, so that commands which do not need them start fast, see benchmarks/bench_startup.py.
+# FORMATS and PERFT_NAMES are those of chess.positions and chess.movegen for the same reason.
+FORMATS = ('fen', 'binary')
+PERFT_NAMES = ('discovered', 'endgame', 'kiwipete', 'promotions', 'start')
+
 
 def init():
     """ init runs initialization."""
@@ -25,6 +40,14 @@ def init():
     LOGGER.addHandler(default_handler)
 
 
+def add_walk_arguments(parser):
+    """add_walk_arguments adds options filtering files of folders in path."""
+    parser.add_argument('--include', action='append',
+                        help='glob of file names taken from folders, default: *.pgn')
+    parser.add_argument('--exclude', action='append', default=[],
+                        help='glob of file or folder names left out from folders')
+
+
 def parse_args():
     """parse_args parses command line arguments."""
 
@@ -36,34 +59,208 @@ def parse_args():
     parser_image.add_argument('-i', '--init_state', default='default',
                               help='initialize board state:'
                               ' empty, default, or target state file path')
-    parser_image.add_argument('-d', '--delay', default=1.62, help='delay between moves in seconds')
+    parser_image.add_argument('-d', '--delay', default=1.62, type=float,
+                              help='delay between moves in seconds')
     parser_image.add_argument('-o', '--out', default=os.getcwd(), help='name of the output folder')
     parser_image.add_argument('-b', '--black_first', help='run black first', action='store_true')
     parser_image.add_argument('--black', default='#4B7399', help='color of the black in hex')
     parser_image.add_argument('--white', default='#EAE9D2', help='color of the white in hex')
     parser_image.add_argument('--font_path', default='/Library/Fonts/Arial.ttf',
                               help='path of the display font used in board')
+    parser_image.add_argument('-s', '--size', default=520, type=int,
+                              help='width of board image in pixels, margins included')
     parser_image.add_argument('-v', '--verbose', help='print final board state',
                               action='store_true')
+    parser_image.add_argument('--plies', help='render selected plies only: final, every:K or'
+                              ' N[,N...], ply 0 is the initial position, -1 the final one,'
+                              ' a single ply is written as PNG')
+    parser_image.add_argument('-j', '--jobs', default=1, type=int,
+                              help='number of processes rendering games in parallel')
+    parser_image.add_argument('--io_threads', default=4, type=int,
+                              help='number of threads reading files ahead')
+    parser_image.add_argument('--profile', help='file to write JSON lines of time spent in each'
+                              ' stage, one per game and one for the batch')
+    parser_image.add_argument('--profile_top', default=0, type=int,
+                              help='run cProfile on every game and dump stats of the N slowest'
+                              ' next to the profile file')
+    parser_image.add_argument('-f', '--force', action='store_true',
+                              help='render games even if they are up to date')
+    parser_image.add_argument('--archive', help='archive written by pack to render instead of'
+                              ' path, the first game of each of its sources')
+    parser_image.add_argument('--cache', help='folder of encoded frames reused across runs')
+    parser_image.add_argument('--cache_size', default=256, type=int,
+                              help='size limit of the frame cache in MB')
     parser_image.add_argument('-L', '--level', choices=('debug', 'info', 'warn'), default='info',
                               help='log level: debug, info')
+    add_walk_arguments(parser_image)
     parser_image.set_defaults(func=run_image)
 
     parser_manual = subparsers.add_parser('manual', help='tool that loads chess manual text')
     parser_manual.add_argument('path', nargs='*', help='path to the pgn file/folder')
     parser_manual.add_argument('-n', '--num', default=1, type=int, help='start number')
     parser_manual.add_argument('-b', '--black_first', help='run black first', action='store_true')
+    parser_manual.add_argument('--io_threads', default=4, type=int,
+                               help='number of threads reading files ahead')
+    parser_manual.add_argument('--read_ahead', default=64, type=int,
+                               help='number of games parsed ahead of printing, per file')
+    parser_manual.add_argument('--profile', help='file to write JSON lines of time spent in'
+                               ' parsing, one per file and one for the batch')
     parser_manual.add_argument('-L', '--level', choices=('debug', 'info', 'warn'), default='info',
                                help='log level: debug, info')
+    add_walk_arguments(parser_manual)
     parser_manual.set_defaults(func=run_manual)
 
+    parser_positions = subparsers.add_parser('positions', help='tool that writes position of'
+                                             ' every ply, no rendering')
+    parser_positions.add_argument('path', nargs='*', help='path to the pgn file/folder')
+    parser_positions.add_argument('-i', '--init_state', default='default',
+                                  help='initialize board state:'
+                                  ' empty, default, or target state file path')
+    parser_positions.add_argument('-b', '--black_first', help='run black first',
+                                  action='store_true')
+    parser_positions.add_argument('--format', choices=FORMATS, default='fen',
+                                  help='NDJSON lines with FEN, or binary records of packed'
+                                  ' positions')
+    parser_positions.add_argument('-o', '--out', help='file to write, default stdout, required'
+                                  ' by binary format, source names go to OUT.sources')
+    parser_positions.add_argument('-j', '--jobs', default=os.cpu_count() or 1, type=int,
+                                  help='number of processes replaying games in parallel')
+    parser_positions.add_argument('--batch', default=256, type=int,
+                                  help='number of games replayed by a process at a time')
+    parser_positions.add_argument('-L', '--level', choices=('debug', 'info', 'warn'),
+                                  default='info', help='log level: debug, info')
+    add_walk_arguments(parser_positions)
+    parser_positions.set_defaults(func=run_positions)
+
+    parser_validate = subparsers.add_parser('validate', help='tool that replays games to find'
+                                            ' bad moves, no rendering')
+    parser_validate.add_argument('path', nargs='+', help='path to the pgn file/folder')
+    parser_validate.add_argument('-i', '--init_state', default='default',
+                                 help='initialize board state:'
+                                 ' empty, default, or target state file path')
+    parser_validate.add_argument('-b', '--black_first', help='run black first',
+                                 action='store_true')
+    parser_validate.add_argument('--lenient', action='store_true',
+                                 help='only find moves no piece can make, as rendering does,'
+                                 ' legality is not checked')
+    parser_validate.add_argument('-j', '--jobs', default=os.cpu_count() or 1, type=int,
+                                 help='number of processes replaying files in parallel')
+    parser_validate.add_argument('--io_threads', default=4, type=int,
+                                 help='number of threads reading files ahead')
+    parser_validate.add_argument('-L', '--level', choices=('debug', 'info', 'warn'),
+                                 default='info', help='log level: debug, info')
+    add_walk_arguments(parser_validate)
+    parser_validate.set_defaults(func=run_validate)
+
+    parser_pack = subparsers.add_parser('pack', help='tool that packs games into an archive of'
+                                        ' resolved moves')
+    parser_pack.add_argument('path', nargs='+', help='path to the pgn file/folder')
+    parser_pack.add_argument('-o', '--out', required=True, help='name of the archive file')
+    parser_pack.add_argument('-i', '--init_state', default='default',
+                             help='initialize board state:'
+                             ' empty, default, or target state file path')
+    parser_pack.add_argument('-b', '--black_first', help='run black first', action='store_true')
+    parser_pack.add_argument('--lenient', action='store_true',
+                             help='resolve moves as rendering does, legality is not checked')
+    parser_pack.add_argument('-j', '--jobs', default=os.cpu_count() or 1, type=int,
+                             help='number of processes resolving files in parallel')
+    parser_pack.add_argument('--io_threads', default=4, type=int,
+                             help='number of threads reading files ahead')
+    parser_pack.add_argument('-L', '--level', choices=('debug', 'info', 'warn'), default='info',
+                             help='log level: debug, info')
+    add_walk_arguments(parser_pack)
+    parser_pack.set_defaults(func=run_pack)
+
+    parser_index = subparsers.add_parser('index', help='tool that indexes positions of games for'
+                                         ' lookup')
+    parser_index.add_argument('path', nargs='*', help='path to the pgn file/folder')
+    parser_index.add_argument('-o', '--out', required=True, help='name of the index folder')
+    parser_index.add_argument('-i', '--init_state', default='default',
+                              help='initialize board state:'
+                              ' empty, default, or target state file path')
+    parser_index.add_argument('-b', '--black_first', help='run black first', action='store_true')
+    parser_index.add_argument('-j', '--jobs', default=os.cpu_count() or 1, type=int,
+                              help='number of processes replaying files in parallel')
+    parser_index.add_argument('--io_threads', default=4, type=int,
+                              help='number of threads reading files ahead')
+    parser_index.add_argument('--compact', action='store_true',
+                              help='merge segments into one, dropping entries of replaced and'
+                              ' removed files')
+    parser_index.add_argument('-L', '--level', choices=('debug', 'info', 'warn'), default='info',
+                              help='log level: debug, info')
+    add_walk_arguments(parser_index)
+    parser_index.set_defaults(func=run_index)
+
+    parser_lookup = subparsers.add_parser('lookup', help='tool that finds games reaching a'
+                                          ' position in an index')
+    parser_lookup.add_argument('index', help='name of the index folder')
+    group = parser_lookup.add_mutually_exclusive_group(required=True)
+    group.add_argument('--fen', help='position in FEN, castling and en passant are ignored')
+    group.add_argument('--moves', help='SAN moves from init state, like "e4 e5 Nf3"')
+    parser_lookup.add_argument('-i', '--init_state', default='default',
+                               help='initialize board state of --moves:'
+                               ' empty, default, or target state file path')
+    parser_lookup.add_argument('-b', '--black_first', help='run black first of --moves',
+                               action='store_true')
+    parser_lookup.add_argument('-n', '--limit', type=int, help='print at most N hits')
+    parser_lookup.add_argument('-L', '--level', choices=('debug', 'info', 'warn'),
+                               default='info', help='log level: debug, info')
+    parser_lookup.set_defaults(func=run_lookup)
+
+    parser_perft = subparsers.add_parser('perft', help='tool that counts legal move paths to'
+                                         ' test the move generator')
+    parser_perft.add_argument('--fen', help='position to count from, default the position of -p')
+    parser_perft.add_argument('-p', '--position', choices=PERFT_NAMES, default='start',
+                              help='well known position whose counts are checked')
+    parser_perft.add_argument('-d', '--depth', default=3, type=int, help='plies to count up to')
+    parser_perft.add_argument('--divide', action='store_true',
+                              help='print count below each legal move at the last depth')
+    parser_perft.add_argument('-L', '--level', choices=('debug', 'info', 'warn'), default='info',
+                              help='log level: debug, info')
+    parser_perft.set_defaults(func=run_perft)
+
+    parser_serve = subparsers.add_parser('serve', help='HTTP server that renders GIF picture')
+    parser_serve.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser_serve.add_argument('-p', '--port', default=8080, type=int, help='port to listen on')
+    parser_serve.add_argument('-i', '--init_state', default='default',
+                              help='initialize board state:'
+                              ' empty, default, or target state file path')
+    parser_serve.add_argument('--font_path', default='/Library/Fonts/Arial.ttf',
+                              help='path of the display font used in board')
+    parser_serve.add_argument('-j', '--jobs', default=os.cpu_count() or 1, type=int,
+                              help='number of worker processes rendering games')
+    parser_serve.add_argument('-q', '--queue', type=int,
+                              help='max requests rendering or waiting, more are answered 503,'
+                              ' default: twice the jobs')
+    parser_serve.add_argument('-t', '--timeout', default=30.0, type=float,
+                              help='seconds to read a request and to render it')
+    parser_serve.add_argument('--cache', help='folder of encoded frames reused across runs')
+    parser_serve.add_argument('--cache_size', default=256, type=int,
+                              help='size limit of the frame cache in MB')
+    parser_serve.add_argument('-L', '--level', choices=('debug', 'info', 'warn'), default='info',
+                              help='log level: debug, info')
+    parser_serve.set_defaults(func=run_serve)
+
     parser.add_argument('-V', '--version', help='print version information', action='store_true')
     parser.set_defaults(func=print_version)
 
     args = parser.parse_args()
+    if getattr(args, 'path', None) is not None and not args.include:
+        args.include = list(DEFAULT_INCLUDE)
+    if getattr(args, 'format', None) == 'binary' and not args.out:
+        parser.error('binary format needs --out')
+    if getattr(args, 'archive', None) and args.path:
+        parser.error('path and --archive are exclusive')
+    if getattr(args, 'size', 520) < 40:
+        parser.error('board size {} is too small'.format(args.size))
+    if getattr(args, 'plies', None) is not None:
+        try:
+            args.plies = PlySelection(args.plies)
+        except ValueError as e:
+            parser.error(str(e))
 
     if args.version:
-        print_version()
+        print_version(args)
         sys.exit(0)
 
     return args
@@ -90,6 +287,8 @@ def logger(func):
 
 def load_state(param):
     """parse_state returns."""
+    from chess.game import load_empty_state  # pylint: disable=import-outside-toplevel
+
     supported_states = list_supported_state_files()
     state = load_empty_state()
 
@@ -111,49 +310,262 @@ def load_state(param):
     return state_path, state
 
 
-def image_name(output_dir, filename):
-    """output_image_name returns the output image name."""
-    name, _ = os.path.splitext(os.path.basename(filename))
-    output_file = os.path.join(output_dir, name + '.gif')
+def image_name(output_dir, filename, ext='.gif'):
+    """output_image_name returns the output image name.
+
+    `filename` may be relative to a walked folder, its folders are kept under
+    `output_dir`.
+    """
+    name, _ = os.path.splitext(filename)
+    output_file = os.path.join(output_dir, name + ext)
     return output_file, os.path.exists(output_file)
 
 
+# _WORKER holds the board and render options of current process, see `init_render_worker`.
+_WORKER = {}
+
+
+def init_render_worker(state, is_white_run, delay,  # pylint: disable=too-many-arguments
+                       board_options, cache_path=None, cache_size=None, profile=0, plies=None):
+    """init_render_worker creates the board once per process, it is reused by every game.
+
+    `profile` is 0 for no profiling, 1 for stage metrics, 2 for cProfile as well.
+    With `plies`, a `PlySelection`, only selected plies of games are rendered.
+    """
+    from chess.board import Board  # pylint: disable=import-outside-toplevel
+    from chess.cache import FrameCache  # pylint: disable=import-outside-toplevel
+
+    LOGGER.debug('create chess board')
+    _WORKER['board'] = Board(state, is_white_run=is_white_run, **board_options)
+    _WORKER['state'] = state
+    _WORKER['is_white_run'] = is_white_run
+    _WORKER['delay'] = delay
+    _WORKER['cache'] = FrameCache(cache_path, cache_size) if cache_path else None
+    _WORKER['profile'] = profile
+    _WORKER['plies'] = plies
+
+
+def render_image(name, source, data, records=None):
+    """render_image renders the game in `data`, PGN content of `source`, to GIF `name`.
+
+    With `records`, MOVE records of a game of an archive, the moves are made
+    as they are and `data` is not read.
+    It returns a dict of `error` message on failure, cache `hits` and
+    `misses` of the game, and with profiling, `metrics` of the game and
+    marshaled cProfile `stats`.
+    """
+    board, cache, profile = _WORKER['board'], _WORKER['cache'], _WORKER['profile']
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    metrics = board.metrics = Metrics() if profile else None
+    profiler = None
+    if profile > 1:
+        import cProfile  # pylint: disable=import-outside-toplevel
+        profiler = cProfile.Profile()
+    result = {'error': None}
+    mark = Metrics.begin()
+    if profiler:
+        profiler.enable()
+    try:
+        board.reset(_WORKER['state'], is_white_run=_WORKER['is_white_run'])
+        if records is not None:
+            from chess.archive import MOVE  # pylint: disable=import-outside-toplevel
+            moves = list(MOVE.iter_unpack(records))
+        elif data is not None:
+            moves = load_moves_from_bytes(data, metrics=metrics)
+        else:
+            moves = []
+        LOGGER.debug('creating "%s" from "%s"...', name, source)
+        os.makedirs(os.path.dirname(name) or '.', exist_ok=True)
+        if _WORKER['plies']:
+            save_plies_to_file(name, board, moves, _WORKER['plies'].select(len(moves)),
+                               _WORKER['delay'], metrics=metrics)
+        else:
+            save_game_to_file(name, board, moves, _WORKER['delay'], cache=cache,
+                              metrics=metrics)
+    except Exception as e:  # pylint: disable=broad-except
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    if profiler:
+        profiler.disable()
+        profiler.create_stats()
+        result['stats'] = marshal.dumps(profiler.stats)
+    if metrics:
+        metrics.end('total', mark)
+        result['metrics'] = dict(metrics.to_dict(), peak_rss_kb=peak_rss_kb())
+    board.metrics = None
+    if cache:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    result.update(hits=hits, misses=misses)
+    return result
+
+
+class ProfileWriter():
+    """ProfileWriter writes JSON lines of metrics, one per job and one for the batch.
+
+    With `top`, cProfile stats of the `top` slowest jobs are dumped to
+    `<path>.<rank>.prof`, which are read by `pstats`.
+    """
+
+    def __init__(self, path, kind, top=0):
+        self.fp = open(path, 'w')
+        self.path = path
+        self.kind = kind
+        self.top = top
+        self.slowest = []
+        self.total = Metrics()
+        self.mark = Metrics.begin()
+        self.jobs = 0
+
+    def write(self, source, metrics, stats=None, **fields):
+        """write writes the record of a job, `metrics` is the dict of `Metrics.to_dict`."""
+        self.jobs += 1
+        self.total.merge(metrics)
+        record = dict(fields, type=self.kind, source=source)
+        record.update(metrics)
+        self.fp.write(json.dumps(record, sort_keys=True) + '\n')
+        if stats is not None and self.top:
+            wall = metrics['stages']['total']['wall']
+            heapq.heappush(self.slowest, (wall, self.jobs, source, stats))
+            if len(self.slowest) > self.top:
+                heapq.heappop(self.slowest)
+
+    def close(self, **fields):
+        """close writes the batch record and cProfile stats of the slowest jobs."""
+        self.total.end('batch', self.mark)
+        record = dict(fields, type='batch', jobs=self.jobs,
+                      peak_rss_kb=max(peak_rss_kb() or 0, peak_rss_kb('children') or 0))
+        record.update(self.total.to_dict())
+        self.fp.write(json.dumps(record, sort_keys=True) + '\n')
+        self.fp.close()
+        for rank, (wall, _, source, stats) in enumerate(sorted(self.slowest, reverse=True), 1):
+            stats_path = '{}.{}.prof'.format(self.path, rank)
+            LOGGER.info('cProfile stats of "%s", %.3fs, in "%s"', source, wall, stats_path)
+            with open(stats_path, 'wb') as f:
+                f.write(stats)
+
+
 @logger
 def run_image(args):
     """image sub-command function."""
+    from concurrent.futures import ProcessPoolExecutor  # pylint: disable=import-outside-toplevel
+    from chess.archive import Archive  # pylint: disable=import-outside-toplevel
+    from chess.manifest import Manifest  # pylint: disable=import-outside-toplevel
 
     LOGGER.debug('load init state')
     state_path, state = load_state(args.init_state)
-
-    LOGGER.debug('create chess board')
-    board = Board(state, font_path=args.font_path,
-                  white_color=args.white, black_color=args.black,
-                  is_white_run=(not args.black_first),
-                  verbose=args.verbose)
-
-    if not args.path:
-        name, is_exists = image_name(args.out, state_path)
-        if is_exists:
-            LOGGER.info('gif with name "%s" already exists, skip', name)
+    is_white_run = not args.black_first
+    archive = None
+
+    if args.archive:
+        archive = Archive(args.archive)
+        # games are replayed from the position they were packed from.
+        state, is_white_run = archive.state, archive.is_white_run
+        entries = (archive.entry(n) for n in range(len(archive)))
+        tasks = [(n, name) for n, (name, index, _) in enumerate(entries) if index == 0]
+    elif args.path:
+        tasks = iter_files(args.path, include=args.include, exclude=args.exclude)
+    else:
+        # render init state only.
+        tasks = [(None, os.path.basename(state_path))]
+
+    # outputs are rendered again once their source or any of params change.
+    params = dict(state=state, is_white_run=is_white_run, delay=args.delay,
+                  white=args.white, black=args.black, font_path=args.font_path,
+                  version=__version__)
+    if args.plies:
+        params['plies'] = args.plies.spec
+    if args.size != 520:
+        params['size'] = args.size
+    ext = '.png' if args.plies and args.plies.single else '.gif'
+    manifest = Manifest(args.out)
+    # stats are those of sources when read, by output name.
+    stats = {}
+
+    def prepare(path, filename):
+        # runs on I/O threads, returns None for up to date GIF.
+        name, _ = image_name(args.out, filename, ext)
+        if archive:
+            # path is the number of the game in archive.
+            source, records = os.path.abspath(args.archive), archive.records(path)
         else:
-            moves = []
-            images = board.render(moves)
-            LOGGER.debug('creating "%s"...', name)
-            save_image_to_file(name, images, args.delay)
-
-    for path in args.path:
-        if os.path.isfile(path):
-            name, is_exists = image_name(args.out, path)
-            if is_exists:
-                LOGGER.info('gif with name "%s" already exists, skip', name)
+            source, records = os.path.abspath(path or state_path), None
+        fresh = not args.force and manifest.is_fresh(
+            os.path.relpath(name, args.out), source, params, data=records,
+            stat=archive.stat if archive else None)
+        if fresh:
+            LOGGER.debug('gif with name "%s" is up to date, skip', name)
+            return None
+        data = None
+        if path and not archive:
+            # the stat taken when reading is recorded with the digest of what was read.
+            data, stats[name] = read_source(path)
+        return name, source, data, records
+
+    def iter_jobs(io_executor):
+        for (path, _), future in bounded_map(io_executor, prepare, tasks, 2 * args.io_threads):
+            try:
+                job = future.result()
+            except OSError as e:
+                LOGGER.error('failed to read "%s", %s', path, e)
+                counts['failed'] += 1
                 continue
-
-            moves = load_moves_from_file(path)
-            images = board.render(moves)
-            LOGGER.debug('creating "%s"...', name)
-            save_image_to_file(name, images, args.delay)
-            # reset state.
-            board.game.state = state
+            if job:
+                yield job
+            else:
+                counts['skipped'] += 1
+
+    initargs = (state, is_white_run, args.delay,
+                dict(font_path=args.font_path, white_color=args.white, black_color=args.black,
+                     verbose=args.verbose, size=args.size),
+                args.cache, args.cache_size * 1024 * 1024,
+                (2 if args.profile_top else 1) if args.profile else 0, args.plies)
+    profile = ProfileWriter(args.profile, 'game', top=args.profile_top) if args.profile else None
+    counts = dict(rendered=0, skipped=0, failed=0, hits=0, misses=0)
+    with ThreadPoolExecutor(max_workers=args.io_threads) as io_executor:
+        if args.jobs > 1:
+            LOGGER.debug('render games by %s processes', args.jobs)
+            # assets loaded by the board of this process are inherited by forked workers.
+            init_render_worker(*initargs)
+            _WORKER['board'].preload()
+            executor = ProcessPoolExecutor(max_workers=args.jobs, initializer=init_render_worker,
+                                           initargs=initargs)
+            results = (job + (future.result(),) for job, future in
+                       bounded_map(executor, render_image, iter_jobs(io_executor), 2 * args.jobs))
+        else:
+            executor = None
+            init_render_worker(*initargs)
+            results = (job + (render_image(*job),) for job in iter_jobs(io_executor))
+
+        try:
+            for name, source, data, records, result in results:
+                stat = archive.stat if archive else stats.pop(name, None)
+                error = result['error']
+                counts['hits'] += result['hits']
+                counts['misses'] += result['misses']
+                if profile:
+                    profile.write(source, result['metrics'], result.get('stats'), output=name,
+                                  error=error)
+                if error:
+                    counts['failed'] += 1
+                    LOGGER.error('failed to create "%s" from "%s", %s', name, source, error)
+                else:
+                    counts['rendered'] += 1
+                    manifest.record(os.path.relpath(name, args.out), source, params,
+                                    records if archive else data, stat)
+        finally:
+            if executor:
+                executor.shutdown()
+            if archive:
+                archive.close()
+
+    for name in manifest.orphans():
+        LOGGER.warning('orphaned "%s", its source is gone', os.path.join(args.out, name))
+    manifest.save()
+    if profile:
+        profile.close(**counts)
+    LOGGER.info('%(rendered)s games rendered, %(skipped)s up to date, %(failed)s failed', counts)
+    if args.cache:
+        LOGGER.info('frame cache "%s": %s hits, %s misses',
+                    args.cache, counts['hits'], counts['misses'])
 
 
 @logger
@@ -173,12 +585,387 @@ def run_manual(args):
             yield '{}. {}'.format(idx, item_sep.join(chunk))
             idx += 1
 
-    for path in args.path:
-        if os.path.isfile(path):
-            moves = load_moves_from_file(path)
-            if args.black_first:
-                moves = [move_holder] + moves
-            print(move_sep.join(pair_chunks(moves, idx=args.num)))
+    profile = ProfileWriter(args.profile, 'file') if args.profile else None
+    files = iter_files(args.path, include=args.include, exclude=args.exclude)
+    tasks = ((path, Metrics() if profile else None) for path, _ in files)
+    # files are streamed by `--io_threads` threads, each `--read_ahead` games ahead.
+    with ThreadPoolExecutor(max_workers=args.io_threads) as executor, \
+            closing(iter_ahead(executor, load_games_from_file, tasks,
+                               args.io_threads, args.read_ahead)) as reads:
+        for (path, metrics), games in reads:
+            mark = Metrics.begin()
+            try:
+                for game in games:
+                    moves = game.moves
+                    if args.black_first:
+                        moves = [move_holder] + moves
+                    print(move_sep.join(pair_chunks(moves, idx=args.num)))
+            except OSError as e:
+                LOGGER.error('failed to read "%s", %s', path, e)
+                continue
+            if metrics:
+                metrics.end('total', mark)
+                profile.write(path, metrics.to_dict())
+    if profile:
+        profile.close()
+
+
+@logger
+def run_positions(args):
+    """positions sub-command function."""
+    from concurrent.futures import ProcessPoolExecutor  # pylint: disable=import-outside-toplevel
+    from chess.positions import positions_of_games  # pylint: disable=import-outside-toplevel
+
+    _, state = load_state(args.init_state)
+    binary = args.format == 'binary'
+    out = open(args.out, 'wb') if args.out else sys.stdout.buffer
+    sources = open(args.out + '.sources', 'w') if binary else None
+    files = iter_files(args.path, include=args.include, exclude=args.exclude)
+    counts = dict(files=0, games=0, plies=0, failed=0)
+    start = time.perf_counter()
+    # one process writes every game as soon as it is replayed.
+    size = args.batch if args.jobs > 1 else 1
+
+    def iter_jobs():
+        # games are streamed from files and cut into ranges of `size` games.
+        for path, name in files:
+            try:
+                f = open(path, encoding='utf-8', errors='replace')
+            except OSError as e:
+                LOGGER.error('failed to read "%s", %s', path, e)
+                continue
+            source_no = counts['files']
+            counts['files'] += 1
+            if sources:
+                sources.write(name + '\n')
+            batch, first = [], 0
+            with f:
+                try:
+                    for game in parse_games(f):
+                        batch.append(game)
+                        if len(batch) == size:
+                            yield (batch, state, not args.black_first, args.format, name,
+                                   source_no, first)
+                            batch, first = [], first + size
+                except OSError as e:
+                    LOGGER.error('failed to read "%s", %s', path, e)
+            if batch:
+                yield batch, state, not args.black_first, args.format, name, source_no, first
+
+    if args.jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=args.jobs)
+        results = ((job[4], future.result()) for job, future in bounded_map(
+            executor, positions_of_games, iter_jobs(), 2 * args.jobs))
+    else:
+        executor = None
+        results = ((job[4], positions_of_games(*job)) for job in iter_jobs())
+    try:
+        for name, (chunk, games, plies, errors) in results:
+            out.write(chunk)
+            counts['games'] += games
+            counts['plies'] += plies
+            counts['failed'] += len(errors)
+            for index, ply, move, message in errors:
+                LOGGER.error('"%s" game %s stops at ply %s "%s", %s',
+                             name, index, ply, move, message)
+    finally:
+        if executor:
+            executor.shutdown()
+        out.flush()
+        if args.out:
+            out.close()
+        if sources:
+            sources.close()
+
+    elapsed = time.perf_counter() - start
+    LOGGER.info('%s plies of %s games in %s files, %s games failed, %.1fs, %.0f plies/s',
+                counts['plies'], counts['games'], counts['files'], counts['failed'], elapsed,
+                counts['plies'] / elapsed if elapsed else 0)
+
+
+def validate_file(name, data, state, is_white_run, strict):
+    """validate_file runs `validate_bytes` on the content of file `name`, returns its result."""
+    from chess.positions import validate_bytes  # pylint: disable=import-outside-toplevel
+
+    LOGGER.debug('validate "%s"', name)
+    return validate_bytes(data, state, is_white_run=is_white_run, strict=strict)
+
+
+@logger
+def run_validate(args):
+    """validate sub-command function.
+
+    It prints an NDJSON line of `source`, `game`, `ply`, `move` and `error`
+    per failed game, and exits with 1 if any game or file failed.
+    """
+    from concurrent.futures import ProcessPoolExecutor  # pylint: disable=import-outside-toplevel
+
+    _, state = load_state(args.init_state)
+    files = iter_files(args.path, include=args.include, exclude=args.exclude)
+    counts = dict(files=0, games=0, plies=0, failed=0, unreadable=0)
+    start = time.perf_counter()
+
+    def iter_jobs(io_executor):
+        reads = bounded_map(io_executor, lambda path, name: read_file(path), files,
+                            2 * args.io_threads)
+        for (path, name), future in reads:
+            try:
+                data = future.result()
+            except OSError as e:
+                LOGGER.error('failed to read "%s", %s', path, e)
+                counts['unreadable'] += 1
+                continue
+            counts['files'] += 1
+            yield name, data, state, not args.black_first, not args.lenient
+
+    with ThreadPoolExecutor(max_workers=args.io_threads) as io_executor:
+        if args.jobs > 1:
+            executor = ProcessPoolExecutor(max_workers=args.jobs)
+            results = ((job[0], future.result()) for job, future in bounded_map(
+                executor, validate_file, iter_jobs(io_executor), 2 * args.jobs))
+        else:
+            executor = None
+            results = ((job[0], validate_file(*job)) for job in iter_jobs(io_executor))
+        try:
+            for name, (games, plies, errors) in results:
+                counts['games'] += games
+                counts['plies'] += plies
+                counts['failed'] += len(errors)
+                for index, ply, move, message in errors:
+                    print(json.dumps({'source': name, 'game': index, 'ply': ply, 'move': move,
+                                      'error': message}, ensure_ascii=False))
+        finally:
+            if executor:
+                executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    LOGGER.info('%s plies of %s games in %s files, %s games failed, %s files unreadable,'
+                ' %.1fs, %.0f plies/s', counts['plies'], counts['games'], counts['files'],
+                counts['failed'], counts['unreadable'], elapsed,
+                counts['plies'] / elapsed if elapsed else 0)
+    if counts['failed'] or counts['unreadable']:
+        sys.exit(1)
+
+
+def pack_file(name, data, state, is_white_run, strict):
+    """pack_file runs `archive_moves_of_bytes` on the content of file `name`, returns its result."""
+    from chess.archive import archive_moves_of_bytes  # pylint: disable=import-outside-toplevel
+
+    LOGGER.debug('pack "%s"', name)
+    return archive_moves_of_bytes(data, state, is_white_run=is_white_run, strict=strict)
+
+
+@logger
+def run_pack(args):
+    """pack sub-command function."""
+    from concurrent.futures import ProcessPoolExecutor  # pylint: disable=import-outside-toplevel
+    from chess.archive import ArchiveWriter, MOVE  # pylint: disable=import-outside-toplevel
+
+    _, state = load_state(args.init_state)
+    files = iter_files(args.path, include=args.include, exclude=args.exclude)
+    counts = dict(files=0, games=0, plies=0, failed=0)
+    start = time.perf_counter()
+
+    def iter_jobs(io_executor):
+        reads = bounded_map(io_executor, lambda path, name: read_file(path), files,
+                            2 * args.io_threads)
+        for (path, name), future in reads:
+            try:
+                data = future.result()
+            except OSError as e:
+                LOGGER.error('failed to read "%s", %s', path, e)
+                continue
+            counts['files'] += 1
+            yield name, data, state, not args.black_first, not args.lenient
+
+    with ThreadPoolExecutor(max_workers=args.io_threads) as io_executor, \
+            ArchiveWriter(args.out, state, is_white_run=not args.black_first) as writer:
+        if args.jobs > 1:
+            executor = ProcessPoolExecutor(max_workers=args.jobs)
+            results = ((job[0], future.result()) for job, future in bounded_map(
+                executor, pack_file, iter_jobs(io_executor), 2 * args.jobs))
+        else:
+            executor = None
+            results = ((job[0], pack_file(*job)) for job in iter_jobs(io_executor))
+        try:
+            for name, (chunk, games, errors) in results:
+                writer.add(name, chunk, games)
+                counts['games'] += len(games)
+                counts['plies'] += len(chunk) // MOVE.size
+                counts['failed'] += len(errors)
+                for index, ply, move, message in errors:
+                    LOGGER.error('"%s" game %s left out, ply %s "%s", %s',
+                                 name, index, ply, move, message)
+        finally:
+            if executor:
+                executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    LOGGER.info('%s plies of %s games in %s files packed, %s games failed, %.1fs, %.0f plies/s',
+                counts['plies'], counts['games'], counts['files'], counts['failed'], elapsed,
+                counts['plies'] / elapsed if elapsed else 0)
+    LOGGER.info('archive "%s" has %s bytes', args.out, os.path.getsize(args.out))
+
+
+@logger
+def run_index(args):
+    """index sub-command function."""
+    from concurrent.futures import ProcessPoolExecutor  # pylint: disable=import-outside-toplevel
+    from chess.index import (  # pylint: disable=import-outside-toplevel
+        index_entries_of_bytes, PositionIndex, MAX_SEGMENTS)
+
+    _, state = load_state(args.init_state)
+    index = PositionIndex(args.out, dict(state=state, is_white_run=not args.black_first))
+    files = iter_files(args.path, include=args.include, exclude=args.exclude)
+    counts = dict(files=0, skipped=0, games=0, plies=0, failed=0)
+    start = time.perf_counter()
+
+    def prepare(path, name):
+        # runs on I/O threads, returns None for a source indexed from its current content.
+        source = os.path.abspath(path)
+        if index.is_fresh(name, source):
+            LOGGER.debug('"%s" is indexed, skip', name)
+            return None
+        return (name, source) + read_source(path)
+
+    def iter_jobs(io_executor):
+        for (path, _), future in bounded_map(io_executor, prepare, files, 2 * args.io_threads):
+            try:
+                job = future.result()
+            except OSError as e:
+                LOGGER.error('failed to read "%s", %s', path, e)
+                continue
+            if not job:
+                counts['skipped'] += 1
+                continue
+            name, source, data, stat = job
+            counts['files'] += 1
+            yield data, state, not args.black_first, index.add_source(name, source, data, stat)
+
+    def iter_chunks(results):
+        for source_id, (chunk, games, plies, errors) in results:
+            counts['games'] += games
+            counts['plies'] += plies
+            counts['failed'] += len(errors)
+            for game, ply, move, message in errors:
+                LOGGER.error('"%s" game %s stops at ply %s "%s", %s',
+                             index.sources[source_id]['name'], game, ply, move, message)
+            yield chunk
+
+    with ThreadPoolExecutor(max_workers=args.io_threads) as io_executor:
+        if args.jobs > 1:
+            executor = ProcessPoolExecutor(max_workers=args.jobs)
+            results = ((job[3], future.result()) for job, future in bounded_map(
+                executor, index_entries_of_bytes, iter_jobs(io_executor), 2 * args.jobs))
+        else:
+            executor = None
+            results = ((job[3], index_entries_of_bytes(*job)) for job in iter_jobs(io_executor))
+        try:
+            # entries are sorted and spilled in runs as they come, then merged into a segment.
+            index.add_segment(iter_chunks(results))
+        finally:
+            if executor:
+                executor.shutdown()
+
+    for name in index.orphans():
+        LOGGER.warning('drop "%s" from index, its file is gone', name)
+    if args.compact or len(index.segments) > MAX_SEGMENTS:
+        LOGGER.info('compact %s segments, %s entries kept',
+                    len(index.segments), index.compact())
+    index.save()
+    elapsed = time.perf_counter() - start
+    LOGGER.info('%(plies)s plies of %(games)s games in %(files)s files indexed,'
+                ' %(skipped)s files up to date, %(failed)s games failed', counts)
+    LOGGER.info('index "%s" has %s segments, %.1fs, %.0f plies/s', args.out,
+                len(index.segments), elapsed, counts['plies'] / elapsed if elapsed else 0)
+
+
+@logger
+def run_lookup(args):
+    """lookup sub-command function."""
+    from chess.game import Game  # pylint: disable=import-outside-toplevel
+    from chess.index import PositionIndex  # pylint: disable=import-outside-toplevel
+
+    if args.fen:
+        try:
+            key = Game.from_fen(args.fen).key
+        except ValueError as e:
+            LOGGER.error('%s', e)
+            sys.exit(1)
+    else:
+        _, state = load_state(args.init_state)
+        game = Game(state, is_white_run=not args.black_first)
+        for move in load_moves_from_bytes(args.moves.encode('utf-8')):
+            game.apply(move)
+        key = game.key
+
+    if not os.path.isdir(args.index):
+        LOGGER.error('no index folder "%s"', args.index)
+        sys.exit(1)
+    start = time.perf_counter()
+    index = PositionIndex(args.index)
+    hits = index.lookup(key)
+    elapsed = time.perf_counter() - start
+    for name, game, ply in hits[:args.limit]:
+        print(json.dumps({'source': name, 'game': game, 'ply': ply}, ensure_ascii=False))
+    index.close()
+    LOGGER.info('%s plies of %s games reach position %016x, %.2f ms', len(hits),
+                len({(name, game) for name, game, _ in hits}), key, elapsed * 1e3)
+
+
+@logger
+def run_perft(args):
+    """perft sub-command function."""
+    from chess.game import Game  # pylint: disable=import-outside-toplevel
+    from chess.movegen import (  # pylint: disable=import-outside-toplevel
+        divide, perft, PERFT_POSITIONS)
+
+    fen, counts = PERFT_POSITIONS[args.position]
+    if args.fen:
+        fen, counts = args.fen, ()
+    try:
+        game = Game.from_fen(fen)
+    except ValueError as e:
+        LOGGER.error('%s', e)
+        sys.exit(1)
+
+    failed = False
+    for depth in range(1, args.depth + 1):
+        start = time.perf_counter()
+        if args.divide and depth == args.depth:
+            moves = divide(game, depth)
+            for move, nodes in sorted(moves, key=lambda item: str(item[0])):
+                print('{}: {}'.format(move, nodes))
+            nodes = sum(n for _, n in moves)
+        else:
+            nodes = perft(game, depth)
+        elapsed = time.perf_counter() - start
+        expected = counts[depth - 1] if depth <= len(counts) else None
+        print('depth {} nodes {} {:.2f}s {:.0f} nodes/s{}'.format(
+            depth, nodes, elapsed, nodes / elapsed if elapsed else 0,
+            '' if expected is None else ', expected {}'.format(expected)))
+        failed = failed or expected not in (None, nodes)
+    if failed:
+        LOGGER.error('node counts differ from the expected ones')
+        sys.exit(1)
+
+
+@logger
+def run_serve(args):
+    """serve sub-command function."""
+    import asyncio  # pylint: disable=import-outside-toplevel
+    from chess.server import RenderServer  # pylint: disable=import-outside-toplevel
+
+    _, state = load_state(args.init_state)
+    server = RenderServer(state, jobs=args.jobs, queue_size=args.queue, timeout=args.timeout,
+                          font_path=args.font_path, cache_path=args.cache,
+                          cache_size=args.cache_size * 1024 * 1024)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        LOGGER.info('shutting down')
+    finally:
+        server.close()
 
 
 def main():
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from chess import list_supported_state_files, FILE_MODE
+from chess.archive import archive_moves_of_bytes, Archive, ArchiveWriter, MOVE
+from chess.codec import load_games_from_bytes, load_state_from_file
+from chess.game import Game, SQUARES
+
+PGN = (b'1. e4 d5 2. exd5 Qxd5 3. Nf3 Bg4 4. Be2 Nc6 5. O-O O-O-O *\n\n'
+       b'1. d4 Qh4 *\n\n'
+       b'1. h4 g5 2. hxg5 f5 3. gxf6 Nh6 4. fxe7 Rg8 5. exd8=Q+ Kxd8 *\n')
+
+
+def default_state():
+    return load_state_from_file(list_supported_state_files()['default'])
+
+
+def test_archive_moves_of_bytes():
+    chunk, games, errors = archive_moves_of_bytes(PGN, default_state())
+    assert games == [(0, 10), (2, 10)]
+    assert len(chunk) == 20 * MOVE.size
+    assert MOVE.unpack_from(chunk) == (SQUARES['e2'], SQUARES['e4'], 0)
+    assert [e[:3] for e in errors] == [(1, 2, 'Qh4')]
+
+
+def test_archive(tmp_path):
+    path = str(tmp_path / 'games.cpga')
+    state = default_state()
+    with ArchiveWriter(path, state) as writer:
+        writer.add('a.pgn', *archive_moves_of_bytes(PGN, state)[:2])
+        writer.add('b.pgn', b'', [])
+        writer.add('c.pgn', *archive_moves_of_bytes(PGN.split(b'\n\n')[-1], state)[:2])
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['games.cpga']
+    assert os.stat(path).st_mode & 0o777 == FILE_MODE
+
+    archive = Archive(path)
+    assert len(archive) == 3
+    assert archive.names == ['a.pgn', 'b.pgn', 'c.pgn']
+    assert Game(archive.state).fen() == Game(state).fen() and archive.is_white_run
+    assert archive.entry(1) == ('a.pgn', 2, 10)
+    assert archive.entry(2) == ('c.pgn', 0, 10)
+    with pytest.raises(IndexError):
+        archive.entry(3)
+
+    # moves are made as they are, to the same positions as SAN.
+    for n, pgn_game in enumerate(g for i, g in enumerate(load_games_from_bytes(PGN)) if i != 1):
+        san, packed = Game(state), Game(archive.state, is_white_run=archive.is_white_run)
+        moves = archive.moves(n)
+        assert len(moves) == len(pgn_game.moves)
+        for move, resolved in zip(pgn_game.moves, moves):
+            san.apply(move)
+            packed.apply(resolved)
+            assert packed.fen() == san.fen()
+    archive.close()
+
+
+def test_archive_writer_discard(tmp_path):
+    path = tmp_path / 'games.cpga'
+    with pytest.raises(RuntimeError):
+        with ArchiveWriter(str(path), default_state()) as writer:
+            writer.add('a.pgn', b'', [])
+            raise RuntimeError('stop')
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_archive_bad_file(tmp_path):
+    path = tmp_path / 'games.pgn'
+    path.write_bytes(b'1. e4 e5 *\n')
+    with pytest.raises(ValueError, match='is not an archive'):
+        Archive(str(path))
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from chess.assets import AssetRegistry
+
+
+def test_asset_registry():
+    registry = AssetRegistry()
+    calls = []
+
+    def create():
+        calls.append(1)
+        return [len(calls)]
+
+    assert registry.get(('a', 1), create) is registry.get(('a', 1), create)
+    assert registry.get(('a', 2), create) == [2]
+    assert (registry.hits, registry.misses) == (1, 2)
+
+    registry.clear()
+    assert registry.get(('a', 1), create) == [3]
+
+
+def test_asset_registry_piece():
+    registry = AssetRegistry()
+    image = registry.piece('wk')
+    assert image.mode == 'RGBA'
+    # pixels are loaded, no file is left open.
+    assert getattr(image, 'fp', None) is None
+    assert registry.piece('wk') is image
+    assert registry.piece('wk', 60) is image
+
+
+def test_asset_registry_piece_resampled():
+    registry = AssetRegistry()
+    image = registry.piece('bq', 14)
+    assert image.size == (14, 14) and image.mode == 'RGBA'
+    assert registry.piece('bq', 14) is image
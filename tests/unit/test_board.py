@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import numpy
 import pytest
 
 from PIL import ImageFont
 
-from chess.board import _get_text_loc, coordinates_of_square, BOARD_MARGIN, SQUARE_EDGE
+from chess.board import (_get_text_loc, coordinates_of_square, to_indices, BOARD_MARGIN,
+                         SQUARE_EDGE, SQUARE_SHADES, SQUARE_COORDINATES, changed_box,
+                         geometry_of_size)
+from chess.game import SQUARES
 
 
 @pytest.fixture()
@@ -33,3 +37,51 @@ def test_get_text_loc(text, font, box, expected):
 )
 def test_coordinates_of_square(crd, expected):
     assert coordinates_of_square(crd) == expected
+
+
+@pytest.mark.parametrize(
+    "square,expected",
+    [
+        ('a1', 1),
+        ('h1', 0),
+        ('a8', 0),
+        ('h8', 1),
+        ('e4', 0),
+    ]
+)
+def test_square_shades(square, expected):
+    assert SQUARE_SHADES[SQUARES[square]] == expected
+
+
+def test_to_indices():
+    palette = bytes([0, 0, 0, 255, 255, 255, 255, 0, 0])
+    image = numpy.array([[(0, 0, 0), (250, 250, 250)], [(200, 10, 10), (255, 0, 0)]],
+                        dtype=numpy.uint8)
+
+    assert to_indices(image, palette).tolist() == [[0, 1], [2, 2]]
+
+
+@pytest.mark.parametrize('size, expected', [
+    (520, (520, 60, 480, 20, 15)),
+    (120, (120, 14, 112, 4, 4)),
+    (1024, (1024, 118, 944, 40, 30)),
+    (121, (120, 14, 112, 4, 4)),
+])
+def test_geometry_of_size(size, expected):
+    geometry = geometry_of_size(size)
+    assert tuple(geometry[:5]) == expected
+    assert geometry.coordinates[0] == (geometry.board_margin,
+                                       geometry.board_margin + 7 * geometry.square_edge)
+
+
+def test_geometry_default():
+    assert geometry_of_size().coordinates == SQUARE_COORDINATES
+    with pytest.raises(ValueError):
+        geometry_of_size(20)
+
+
+def test_changed_box_of_geometry():
+    current, previous = bytearray(64), bytes(64)
+    current[0] = 1
+    assert changed_box(current, previous) == (20, 440, 80, 500)
+    assert changed_box(current, previous, geometry_of_size(120)) == (4, 102, 18, 116)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from chess.cache import cache_key, FrameCache
+
+
+def test_cache_key():
+    assert cache_key('a', b'b') == cache_key(b'a', 'b')
+    assert cache_key('ab', '') != cache_key('a', 'b')
+    assert len(cache_key(b'')) == 40
+
+
+def test_frame_cache(tmp_path):
+    cache = FrameCache(str(tmp_path))
+    key = cache_key('frame')
+    assert cache.get(key) is None
+    cache.put(key, b'data')
+    assert cache.get(key) == b'data'
+    assert FrameCache(str(tmp_path)).get(key) == b'data'
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+
+
+def test_frame_cache_evicted_on_touch(tmp_path, monkeypatch):
+    cache = FrameCache(str(tmp_path))
+    key = cache_key('frame')
+    cache.put(key, b'data')
+
+    def evicted_utime(path, *args, **kwargs):
+        os.unlink(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, 'utime', evicted_utime)
+    assert cache.get(key) == b'data'
+    assert cache.get(key) is None
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+
+
+def test_frame_cache_evict(tmp_path):
+    cache = FrameCache(str(tmp_path))
+    keys = [cache_key(str(i)) for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.put(key, bytes(32))
+        os.utime(cache._entry_path(key), (i, i))
+    # reading an entry makes it the most recently used.
+    assert cache.get(keys[0]) is not None
+    FrameCache(str(tmp_path), max_size=64).evict()
+    assert [cache.get(key) is not None for key in keys] == [True, False, False, True]
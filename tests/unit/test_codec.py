@@ -1,8 +1,19 @@
 # -*- coding: utf-8 -*-
 
+import io
 import os
+import subprocess
+import sys
 
-from chess.codec import load_moves_from_file, load_state_from_file
+import numpy
+import pytest
+from PIL import Image, ImageSequence
+
+from chess import FILE_MODE
+from chess.codec import (load_moves_from_file, load_state_from_file, load_games_from_file,
+                         load_games_from_bytes, load_moves_from_bytes, parse_games,
+                         save_image_to_file, save_deltas_to_file)
+from chess.metrics import Metrics
 
 
 def test_load_moves_from_file(input_path):
@@ -13,9 +24,132 @@ def test_load_moves_from_file(input_path):
     assert moves[0] == 'e4'
 
 
+def test_load_games_from_file(input_path):
+    games = list(load_games_from_file(os.path.join(input_path, 'games.pgn')))
+
+    assert len(games) == 3
+    assert [len(g.moves) for g in games] == [33, 11, 48]
+    assert [g.result for g in games] == ['1-0', '*', '1/2-1/2']
+    assert games[0].tags['White'] == 'Paul Morphy'
+    assert games[0].moves[-4:] == ['Nxd7', 'Qb8', 'Nxb8', 'Rd8']
+    assert games[1].moves == load_moves_from_file(os.path.join(input_path, 'sample.pgn'))
+
+    metrics = Metrics()
+    assert list(load_games_from_file(os.path.join(input_path, 'games.pgn'), metrics)) == games
+    counters = metrics.to_dict()['counters']
+    assert counters == {'bytes': os.path.getsize(os.path.join(input_path, 'games.pgn')),
+                        'games': 3}
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ('1. e4 e5 2. Nf3 (2. f4 exf4 (2... d5)) Nc6 *', [['e4', 'e5', 'Nf3', 'Nc6']]),
+        ('1. e4 {a (comment) 2. d4} e5 $1 2. Nf3!? ; Nc3\nNc6 1-0', [['e4', 'e5', 'Nf3', 'Nc6']]),
+        ('1. e4 e5 1-0\n1. d4 d5 0-1\n', [['e4', 'e5'], ['d4', 'd5']]),
+        ('1. 0-0 0-0-0 2. e8Q exd1=N+ 1/2-1/2', [['O-O', 'O-O-O', 'e8=Q', 'exd1=N']]),
+        ('[Event "A \\"B\\""]\n\n1. e4\n\n[Event "C"]\n1. d4', [['e4'], ['d4']]),
+        ('1. e4 ; see {note\n1... e5 1-0\n[Event "B"]\n1. d4 {a; b}\nd5 0-1\n',
+         [['e4', 'e5'], ['d4', 'd5']]),
+    ]
+)
+def test_parse_games(text, expected):
+    assert [g.moves for g in parse_games(io.StringIO(text))] == expected
+
+
+def test_parse_games_comment_tags():
+    text = '[Event "A"]\n1. e4 ; see {note\ne5 1-0\n\n[Event "B"]\n1. d4 d5 0-1\n'
+    games = list(parse_games(io.StringIO(text)))
+    assert [(g.tags, g.moves, g.result) for g in games] == [
+        ({'Event': 'A'}, ['e4', 'e5'], '1-0'), ({'Event': 'B'}, ['d4', 'd5'], '0-1')]
+
+
 def test_load_state_from_file(input_path):
     state = load_state_from_file(os.path.join(input_path, 'state.bd'))
 
     assert isinstance(state, dict)
     assert len(state) == 2
     assert state['a1'] == 'bk'
+
+
+def test_save_image_to_file(tmp_path):
+    file_path = str(tmp_path / 'test.gif')
+    frames = [numpy.full((40, 30, 3), (i * 60, 255 - i * 60, 0), dtype=numpy.uint8)
+              for i in range(4)]
+    save_image_to_file(file_path, iter(frames), 0.5)
+
+    image = Image.open(file_path)
+    assert image.size == (30, 40)
+    assert image.info['duration'] == 500
+    loaded = [numpy.asarray(f.convert('RGB')) for f in ImageSequence.Iterator(image)]
+    assert len(loaded) == 4
+    assert all((lhs == rhs).all() for lhs, rhs in zip(loaded, frames))
+
+
+def test_save_image_to_file_failed(tmp_path):
+    file_path = str(tmp_path / 'test.gif')
+    frames = [numpy.full((40, 30, 3), i * 60, dtype=numpy.uint8) for i in range(4)]
+    save_image_to_file(file_path, iter(frames), 0.5)
+    with open(file_path, 'rb') as f:
+        expected = f.read()
+
+    def iter_failed():
+        yield from frames[:2]
+        raise ValueError('illegal move')
+
+    with pytest.raises(ValueError):
+        save_image_to_file(file_path, iter_failed(), 0.5)
+    with open(file_path, 'rb') as f:
+        assert f.read() == expected
+    assert os.listdir(str(tmp_path)) == ['test.gif']
+    assert os.stat(file_path).st_mode & 0o777 == FILE_MODE
+
+
+def test_save_deltas_to_file(tmp_path):
+    file_path = str(tmp_path / 'test.gif')
+    frames = []
+
+    def iter_deltas():
+        frame = numpy.zeros((40, 30, 3), dtype=numpy.uint8)
+        for i, box in enumerate([None, (10, 20, 20, 40), (0, 0, 0, 0), (0, 0, 30, 10)]):
+            if box:
+                frame[box[1]:box[3], box[0]:box[2]] = (i * 60, 255 - i * 60, 0)
+            frames.append(frame.copy())
+            yield frame, box
+
+    save_deltas_to_file(file_path, iter_deltas(), 0.5)
+
+    image = Image.open(file_path)
+    loaded = [numpy.asarray(f.convert('RGB')) for f in ImageSequence.Iterator(image)]
+    assert len(loaded) == 4
+    assert all((lhs == rhs).all() for lhs, rhs in zip(loaded, frames))
+
+
+def test_save_image_to_file_with_palette(tmp_path):
+    file_path = str(tmp_path / 'test.gif')
+    palette = bytes(v for i in range(256) for v in (i, 255 - i, 0))
+    frames = [numpy.full((40, 30), i * 50, dtype=numpy.uint8) for i in range(3)]
+    save_image_to_file(file_path, frames, 0.5, palette=palette)
+
+    image = Image.open(file_path)
+    loaded = [numpy.asarray(f.convert('RGB')) for f in ImageSequence.Iterator(image)]
+    assert len(loaded) == 3
+    assert all((lhs == numpy.frombuffer(palette, dtype=numpy.uint8).reshape(-1, 3)[rhs]).all()
+               for lhs, rhs in zip(loaded, frames))
+
+
+def test_load_games_from_bytes():
+    data = b'[Event "a"]\r\n\r\n1. e4 e5 2. Nf3 1-0\r\n\r\n1. d4 *\r\n'
+    games = list(load_games_from_bytes(data))
+    assert [g.moves for g in games] == [['e4', 'e5', 'Nf3'], ['d4']]
+    assert load_moves_from_bytes(data) == ['e4', 'e5', 'Nf3']
+
+
+def test_parse_without_pillow_numpy():
+    # parsing PGN is used by `main.py manual`, which should start fast.
+    code = ('import sys; from chess.codec import load_moves_from_bytes; '
+            'load_moves_from_bytes(b"1. e4 e5 *"); '
+            'print(sorted({"PIL", "numpy"} & set(sys.modules)))')
+    out = subprocess.check_output([sys.executable, '-c', code],
+                                  cwd=os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+    assert out.decode('utf-8').strip() == '[]'
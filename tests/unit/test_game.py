@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import pickle
+
 import pytest
 
-from chess.game import load_empty_state, check_knight_move, check_line, check_diagonal
+from chess.game import (load_empty_state, check_knight_move, check_line, check_diagonal,
+                        Game, Position, SQUARES, PIECE_CODES, KNIGHT_ATTACKS, KING_ATTACKS,
+                        ROCK_PATHS, BISHOP_PATHS, ZOBRIST_BLACK, zobrist_key,
+                        unpack_position, is_attacked, parse_san, IllegalMoveError)
 
 
 @pytest.fixture(scope='function')
@@ -68,3 +73,286 @@ def test_check_line(state, lhs, rhs, expected):
 )
 def test_check_diagnoal(state, lhs, rhs, expected):
     assert check_diagonal(state, lhs, rhs) == expected
+
+
+def test_position_from_state():
+    position = Position.from_state({'a1': 'wr', 'h8': 'bk', 'e4': ''})
+
+    assert isinstance(position.squares, bytearray)
+    assert len(position.squares) == 64
+    assert position.squares[SQUARES['a1']] == PIECE_CODES['wr']
+    assert position.squares[SQUARES['h8']] == PIECE_CODES['bk']
+    assert position.to_state()['e4'] == ''
+    assert Position.from_state(position.to_state()) == position
+
+
+def test_position_pieces():
+    position = Position.from_state({'a1': 'wr', 'h1': 'wr', 'e8': 'bk'})
+    position.put(SQUARES['a1'], 0)
+    position.put(SQUARES['e8'], PIECE_CODES['wr'])
+
+    assert position.pieces[PIECE_CODES['wr']] == {SQUARES['h1'], SQUARES['e8']}
+    assert position.pieces[PIECE_CODES['bk']] == set()
+    assert Position(position.squares).pieces == position.pieces
+
+
+def test_attack_tables():
+    assert sorted(KNIGHT_ATTACKS[SQUARES['a1']]) == [SQUARES['c2'], SQUARES['b3']]
+    assert len(KNIGHT_ATTACKS[SQUARES['d4']]) == 8
+    assert len(KING_ATTACKS[SQUARES['h8']]) == 3
+    assert ROCK_PATHS[SQUARES['a1']][SQUARES['a4']] == (SQUARES['a2'], SQUARES['a3'])
+    assert BISHOP_PATHS[SQUARES['c1']][SQUARES['e3']] == (SQUARES['d2'],)
+    assert SQUARES['b3'] not in BISHOP_PATHS[SQUARES['a1']]
+
+
+def test_game_state_view(state):
+    state.update({'e1': 'wk', 'e8': 'bk'})
+    game = Game(state)
+    game.state['e2'] = 'wp'
+
+    assert game.state['e2'] == 'wp'
+    assert game.state.copy() == dict(state, e2='wp')
+    # initial state is copied, not mutated by game.
+    assert state['e2'] == ''
+
+
+@pytest.mark.parametrize(
+    "init,moves,is_white_run,expected",
+    [
+        ({'e2': 'wp'}, ['e4'], True, {'e4': 'wp'}),
+        ({'e7': 'bp'}, ['e5'], False, {'e5': 'bp'}),
+        ({'e5': 'wp', 'd7': 'bp'}, ['d5', 'exd6'], False, {'d6': 'wp'}),
+        ({'e4': 'bp', 'd2': 'wp'}, ['d4', 'exd3'], True, {'d3': 'bp'}),
+        ({'b7': 'wp', 'a8': 'br'}, ['bxa8=Q'], True, {'a8': 'wq'}),
+        ({'e1': 'wk', 'h1': 'wr'}, ['O-O'], True, {'g1': 'wk', 'f1': 'wr'}),
+        ({'e8': 'bk', 'a8': 'br'}, ['O-O-O'], False, {'c8': 'bk', 'd8': 'br'}),
+        ({'a1': 'wr', 'h1': 'wr'}, ['Rad1'], True, {'d1': 'wr', 'h1': 'wr'}),
+        ({'b1': 'wn', 'f3': 'wn'}, ['Nbd2'], True, {'d2': 'wn', 'f3': 'wn'}),
+        ({'a1': 'wb', 'c1': 'wr', 'h8': 'bb'}, ['Bxh8+'], True, {'h8': 'wb', 'c1': 'wr'}),
+    ]
+)
+@pytest.mark.parametrize("validate", [False, True])
+def test_game_apply(state, init, moves, is_white_run, expected, validate):
+    state.update(init)
+    game = Game(state, is_white_run=is_white_run, verify=True, validate=validate)
+    for move in moves:
+        game.apply(move)
+
+    assert {s: pt for s, pt in game.state.items() if pt} == expected
+
+
+@pytest.mark.parametrize(
+    "init,move,is_white_run,expected",
+    [
+        # SAN has no origin when the other piece which reaches the square is pinned.
+        ({'f1': 'wk', 'e2': 'wr', 'a3': 'wr', 'e3': 'bp', 'a6': 'bb'}, 'Rxe3', True,
+         {'f1': 'wk', 'e2': 'wr', 'e3': 'wr', 'a6': 'bb'}),
+        ({'d8': 'bk', 'b8': 'bn', 'f6': 'bn', 'h4': 'wq'}, 'Nd7', False,
+         {'d8': 'bk', 'd7': 'bn', 'f6': 'bn', 'h4': 'wq'}),
+        ({'a2': 'wk', 'c2': 'wb', 'f5': 'wb', 'h2': 'br'}, 'Bd3', True,
+         {'a2': 'wk', 'c2': 'wb', 'd3': 'wb', 'h2': 'br'}),
+    ]
+)
+@pytest.mark.parametrize("validate", [False, True])
+def test_game_apply_pinned(state, init, move, is_white_run, expected, validate):
+    state.update(init)
+    game = Game(state, is_white_run=is_white_run, validate=validate)
+    game.apply(move)
+
+    assert {s: pt for s, pt in game.state.items() if pt} == expected
+
+
+def test_game_apply_unknown_move(state):
+    state.update({'e1': 'wk', 'e8': 'bk'})
+    with pytest.raises(IllegalMoveError, match='no wn can move to f3'):
+        Game(state).apply('Nf3')
+    with pytest.raises(IllegalMoveError):
+        Game(state).apply('e4')
+
+
+def test_illegal_move_error_pickle():
+    error = pickle.loads(pickle.dumps(IllegalMoveError('Qh5', 'no wq can move to h5')))
+    assert isinstance(error, IllegalMoveError)
+    assert (error.move, error.reason) == ('Qh5', 'no wq can move to h5')
+    assert str(error) == 'illegal move "Qh5", no wq can move to h5'
+
+
+@pytest.mark.parametrize("validate", [False, True])
+@pytest.mark.parametrize(
+    "init,moves,is_white_run",
+    [
+        # no pawn on e4 to capture on d5.
+        ({'d2': 'wp', 'd7': 'bp', 'e1': 'wk', 'e8': 'bk'}, ['d4', 'd5', 'exd5'], True),
+        # nothing on d5 and d6 is not the en passant square.
+        ({'e5': 'wp', 'd5': 'bp', 'e1': 'wk', 'e8': 'bk'}, ['exd6'], True),
+        ({'b2': 'wp', 'e1': 'wk', 'e8': 'bk'}, ['bxa1'], True),
+        ({'a2': 'wp', 'h3': 'bp', 'e1': 'wk', 'e8': 'bk'}, ['axh3'], True),
+        ({'e2': 'wp', 'd3': 'wn', 'e1': 'wk', 'e8': 'bk'}, ['exd3'], True),
+        ({'e2': 'wp', 'e3': 'bp', 'e1': 'wk', 'e8': 'bk'}, ['e3'], True),
+        ({'e2': 'wp', 'e3': 'bn', 'e1': 'wk', 'e8': 'bk'}, ['e4'], True),
+        ({'e3': 'wp', 'e1': 'wk', 'e8': 'bk'}, ['e5'], True),
+        ({'e2': 'wp', 'e1': 'wk', 'h8': 'bk'}, ['e1'], True),
+        ({'a7': 'bp', 'e1': 'wk', 'e8': 'bk'}, ['a8=Q'], True),
+        ({'a7': 'wp', 'a8': 'bn', 'e1': 'wk', 'e8': 'bk'}, ['a8=Q'], True),
+        ({'a7': 'wp', 'e1': 'wk', 'e8': 'bk'}, ['axb8=Q'], True),
+        ({'d7': 'wp', 'e1': 'wk', 'h8': 'bk'}, ['d8'], True),
+        ({}, ['O-O'], True),
+        ({'e1': 'wk', 'h1': 'wr', 'g1': 'wn'}, ['O-O'], True),
+        ({'e8': 'bk', 'a8': 'br', 'b8': 'bn'}, ['O-O-O'], False),
+        ({'e1': 'wk', 'e2': 'wp', 'e8': 'bk'}, ['Ke2'], True),
+        ({'b1': 'wn', 'd2': 'wp', 'e1': 'wk', 'e8': 'bk'}, ['Nd2'], True),
+        ({'g1': 'wn', 'e1': 'wk', 'e8': 'bk'}, ['Nb1c3'], True),
+    ]
+)
+def test_game_apply_impossible(state, init, moves, is_white_run, validate):
+    state.update(init)
+    game = Game(state, is_white_run=is_white_run, validate=validate)
+    for move in moves[:-1]:
+        game.apply(move)
+    squares = bytes(game.position.squares)
+    with pytest.raises(IllegalMoveError):
+        game.apply(moves[-1])
+    # nothing is changed by a move no piece can make.
+    assert bytes(game.position.squares) == squares
+
+
+def test_is_attacked(state):
+    state.update({'e1': 'wk', 'e2': 'wp', 'b4': 'bb', 'h4': 'br', 'g6': 'bn'})
+    position = Game(state).position
+    assert is_attacked(position, SQUARES['e1'], False) is True
+    assert is_attacked(position, SQUARES['e3'], False) is False
+    assert is_attacked(position, SQUARES['d3'], True) is True
+    assert is_attacked(position, SQUARES['e4'], False) is True
+    assert is_attacked(position, SQUARES['d2'], False) is True
+    assert is_attacked(position, SQUARES['f2'], False) is False
+
+
+def test_parse_san():
+    assert parse_san('O-O-O+') == ('O-O-O', None, None, None, False, None, None)
+    assert parse_san('Nbxd2') == (None, 'N', 1, None, True, SQUARES['d2'], None)
+    assert parse_san('exd8=Q#') == (None, None, 4, None, True, SQUARES['d8'], 'Q')
+    with pytest.raises(ValueError):
+        parse_san('Nz9')
+
+
+@pytest.mark.parametrize(
+    "init,moves,is_white_run,reason",
+    [
+        ({'e1': 'wk', 'e2': 'wn', 'e8': 'br'}, ['Nf4'], True, 'no wn can move'),
+        ({'e1': 'wk', 'e8': 'br', 'a2': 'wp'}, ['a3'], True, 'no wp can move'),
+        ({'e1': 'wk', 'd8': 'br'}, ['Kd2'], True, 'no wk can move'),
+        ({'e1': 'wk', 'h1': 'wr', 'f8': 'br'}, ['O-O'], True, 'crosses an attacked square'),
+        ({'e1': 'wk', 'h1': 'wr', 'g1': 'wn'}, ['O-O'], True, 'blocked'),
+        ({'e1': 'wk', 'a1': 'wr'}, ['O-O'], True, 'no castling right'),
+        ({'b1': 'wn', 'f3': 'wn'}, ['Nd2'], True, 'more than one'),
+        ({'b1': 'wn', 'c3': 'bp'}, ['Nc3'], True, 'marked by x'),
+        ({'e4': 'wp', 'e5': 'bp'}, ['e5'], True, 'capture diagonally'),
+        ({'e4': 'wp'}, ['exd5'], True, 'nothing to capture'),
+        ({'e7': 'wp'}, ['e8'], True, 'promote'),
+        ({'e1': 'wq'}, ['Qe2=Q'], True, 'only pawns promote'),
+        ({'e1': 'wk', 'e2': 'wq'}, ['Qe1'], True, 'own piece'),
+        ({}, ['Z9'], True, 'not SAN'),
+        # en passant would open the rank between the king and the rock.
+        ({'a5': 'wk', 'b5': 'wp', 'c7': 'bp', 'h5': 'br'}, ['c5', 'bxc6'], False, 'no wp'),
+    ]
+)
+def test_game_apply_illegal(state, init, moves, is_white_run, reason):
+    state.update(init)
+    game = Game(state, is_white_run=is_white_run, validate=True)
+    for move in moves[:-1]:
+        game.apply(move)
+    with pytest.raises(IllegalMoveError, match=reason):
+        game.apply(moves[-1])
+
+
+def test_game_checked(state):
+    state.update({'e1': 'wk', 'a1': 'wr', 'd2': 'wb', 'e8': 'bk', 'e5': 'bn'})
+    game = Game(state, validate=True)
+    checks = []
+    for move in ['Ra8+', 'Kd7', 'Bb4', 'Nd3+', 'Kd2', 'Nxb4']:
+        game.apply(move)
+        checks.append(game.checked)
+    assert checks == [True, False, False, True, False, False]
+
+
+def test_game_key(state):
+    state.update({'e1': 'wk', 'g1': 'wn', 'b1': 'wn', 'e8': 'bk', 'g8': 'bn'})
+    game = Game(state)
+    assert game.key == zobrist_key(game.position.squares)
+    for move in ['Nf3', 'Nf6', 'Nc3']:
+        game.apply(move)
+
+    transposed = Game(state)
+    for move in ['Nc3', 'Nf6', 'Nf3']:
+        transposed.apply(move)
+
+    assert game.key == transposed.key
+    assert game.key == zobrist_key(game.position.squares, is_white_run=False)
+    assert game.key ^ ZOBRIST_BLACK == game.position.key
+    assert Game(state).key != game.key
+
+
+def test_game_fen(state):
+    state.update({'e1': 'wk', 'a1': 'wr', 'h1': 'wr', 'd2': 'wp', 'e8': 'bk', 'h8': 'br',
+                  'e7': 'bp'})
+    game = Game(state)
+    fens = [game.fen()]
+    for move in ['d4', 'Rh7', 'O-O', 'Kd8', 'd5', 'e5', 'dxe6']:
+        game.apply(move)
+        fens.append(game.fen())
+
+    assert fens == [
+        '4k2r/4p3/8/8/8/8/3P4/R3K2R w KQk - 0 1',
+        '4k2r/4p3/8/8/3P4/8/8/R3K2R b KQk d3 0 1',
+        '4k3/4p2r/8/8/3P4/8/8/R3K2R w KQ - 1 2',
+        '4k3/4p2r/8/8/3P4/8/8/R4RK1 b - - 2 2',
+        '3k4/4p2r/8/8/3P4/8/8/R4RK1 w - - 3 3',
+        '3k4/4p2r/8/3P4/8/8/8/R4RK1 b - - 0 3',
+        '3k4/7r/8/3Pp3/8/8/8/R4RK1 w - e6 0 4',
+        '3k4/7r/4P3/8/8/8/8/R4RK1 b - - 0 4',
+    ]
+
+
+def test_game_from_fen(state):
+    fen = '3k4/7r/8/3Pp3/8/8/8/R4RK1 w - e6 0 4'
+    game = Game.from_fen(fen)
+    assert game.fen() == fen
+    state.update({'d8': 'bk', 'h7': 'br', 'd5': 'wp', 'e5': 'bp', 'a1': 'wr', 'f1': 'wr',
+                  'g1': 'wk'})
+    assert game.key == Game(state).key
+    assert Game.from_fen('4k3/8/8/8/8/8/8/4K2R b K').fen() == '4k3/8/8/8/8/8/8/4K2R b K - 0 1'
+
+    for fen in ['', '8/8/8/8/8/8/8 w', '8/8/8/8/8/8/8/7x w', '8/8/8/8/8/8/8/8 x',
+                '8/8/8/8/8/8/8/8 w KX', '8/8/8/8/8/8/8/8 w - i3']:
+        with pytest.raises(ValueError):
+            Game.from_fen(fen)
+
+
+def test_game_pack(state):
+    state.update({'e1': 'wk', 'h1': 'wr', 'e8': 'bk', 'b7': 'bp'})
+    game = Game(state)
+    for move in ['Kf1', 'b5']:
+        game.apply(move)
+
+    record = game.pack()
+    assert len(record) == 38
+    position = unpack_position(record)
+    assert position.squares == game.position.squares
+    assert (position.is_white_run, position.castling, position.ep) == (True, 0, SQUARES['b6'])
+    assert (position.halfmove, position.fullmove) == (0, 2)
+
+
+@pytest.mark.parametrize("validate", [False, True])
+def test_game_last(state, validate):
+    state.update({'e1': 'wk', 'h1': 'wr', 'b7': 'wp', 'e5': 'wp', 'e8': 'bk', 'd7': 'bp'})
+    game = Game(state, validate=validate)
+    replay = Game(state)
+    last = []
+    for move in ['O-O', 'd5', 'exd6', 'Kd7', 'b8=N+']:
+        game.apply(move)
+        last.append(game.last)
+        replay.apply(game.last)
+        assert replay.fen() == game.fen()
+    assert last == [(SQUARES['e1'], SQUARES['g1'], 0), (SQUARES['d7'], SQUARES['d5'], 0),
+                    (SQUARES['e5'], SQUARES['d6'], 0), (SQUARES['e8'], SQUARES['d7'], 0),
+                    (SQUARES['b7'], SQUARES['b8'], PIECE_CODES['wn'])]
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+
+import numpy
+
+from chess import list_supported_state_files, FILE_MODE
+from chess.codec import load_state_from_file
+from chess.game import Game
+from chess.index import (index_entries_of_bytes, merge_runs, PositionIndex, ENTRY, ENTRY_FIELDS,
+                         SEGMENT_HEADER)
+from chess.sources import read_source
+
+PGN = b'1. e4 e5 2. Nf3 *\n\n1. e4 c5 *\n'
+
+
+def default_state():
+    return load_state_from_file(list_supported_state_files()['default'])
+
+
+def key_after(moves):
+    game = Game(default_state())
+    for move in moves:
+        game.apply(move)
+    return game.key
+
+
+def build(index_dir, files):
+    state = default_state()
+    index = PositionIndex(index_dir, dict(state=state, is_white_run=True))
+    chunks = []
+    for path in files:
+        if index.is_fresh(os.path.basename(path), path):
+            continue
+        data, stat = read_source(path)
+        source_id = index.add_source(os.path.basename(path), path, data, stat)
+        chunks.append(index_entries_of_bytes(data, state, source_id=source_id)[0])
+    index.add_segment(chunks)
+    index.orphans()
+    index.save()
+    return index
+
+
+def test_index_entries_of_bytes():
+    chunk, games, plies, errors = index_entries_of_bytes(PGN, default_state(), source_id=3)
+    assert (games, plies, errors) == (2, 7, [])
+    entries = [ENTRY.unpack_from(chunk, i * ENTRY.size) for i in range(plies)]
+    assert entries[1] == (key_after(['e4']), 3, 0, 1)
+    assert entries[4] == (key_after([]), 3, 1, 0)
+
+
+def test_position_index(tmp_path):
+    index_dir = str(tmp_path / 'index')
+    a, b = str(tmp_path / 'a.pgn'), str(tmp_path / 'b.pgn')
+    with open(a, 'wb') as f:
+        f.write(PGN)
+    build(index_dir, [a]).close()
+
+    index = PositionIndex(index_dir)
+    assert index.lookup(key_after(['e4'])) == [('a.pgn', 0, 1), ('a.pgn', 1, 1)]
+    assert index.lookup(key_after(['e4', 'c5'])) == [('a.pgn', 1, 2)]
+    assert index.lookup(key_after(['d4'])) == []
+    index.close()
+
+    # a new file gets a segment of its own, the indexed one is not replayed.
+    with open(b, 'wb') as f:
+        f.write(b'1. d4 d5 *\n')
+    index = build(index_dir, [a, b])
+    assert len(index.segments) == 2
+    assert index.lookup(key_after(['d4'])) == [('b.pgn', 0, 1)]
+
+    # a changed file hides its old entries, a removed file hides all of them.
+    with open(a, 'wb') as f:
+        f.write(b'1. d4 *\n')
+    os.remove(b)
+    index = build(index_dir, [a])
+    assert index.lookup(key_after(['e4'])) == []
+    assert index.lookup(key_after(['d4'])) == [('a.pgn', 0, 1)]
+
+    assert index.compact() == 2
+    index.save()
+    assert len(os.listdir(index_dir)) == 2
+    assert [os.stat(os.path.join(index_dir, name)).st_mode & 0o777
+            for name in os.listdir(index_dir)] == [FILE_MODE] * 2
+    assert index.lookup(key_after(['d4'])) == [('a.pgn', 0, 1)]
+    index.close()
+
+
+def test_merge_runs():
+    rng = numpy.random.default_rng(7)
+    runs = []
+    for size in [0, 1, 50, 333]:
+        run = numpy.zeros(size, dtype=numpy.dtype(ENTRY_FIELDS))
+        run['key'] = rng.integers(0, 40, size)
+        run['source'] = rng.integers(0, 3, size)
+        runs.append(numpy.sort(run, order='key'))
+    f = io.BytesIO()
+    assert merge_runs(runs, f, keep=[0, 2], block=8) == sum(
+        (run['source'] != 1).sum() for run in runs)
+    merged = numpy.frombuffer(f.getvalue(), dtype=numpy.dtype(ENTRY_FIELDS))
+    assert (merged['key'][1:] >= merged['key'][:-1]).all()
+    expected = numpy.concatenate(runs)
+    expected = expected[expected['source'] != 1]
+    assert sorted(merged.tolist()) == sorted(expected.tolist())
+
+
+def test_add_segment_in_runs(tmp_path):
+    state = default_state()
+    chunk = index_entries_of_bytes(PGN * 5, state)[0]
+    chunks = [chunk[i:i + 3 * ENTRY.size] for i in range(0, len(chunk), 3 * ENTRY.size)]
+    segments = []
+    for run_size in [1, 4, 1 << 20]:
+        index = PositionIndex(str(tmp_path / str(run_size)), dict(state=state, is_white_run=True))
+        index.add_source('a.pgn', '/a.pgn', b'', os.stat(str(tmp_path)))
+        index.add_segment(iter(chunks), run_size=run_size)
+        assert index.lookup(key_after(['e4'])) == [('a.pgn', i, 1) for i in range(10)]
+        entries = numpy.fromfile(os.path.join(index.path, index.segments[0]),
+                                 dtype=numpy.dtype(ENTRY_FIELDS), offset=SEGMENT_HEADER.size)
+        assert (entries['key'][1:] >= entries['key'][:-1]).all()
+        segments.append(sorted(entries.tolist()))
+        # spilled runs are removed.
+        assert sorted(os.listdir(index.path)) == index.segments
+        index.close()
+    assert segments[0] == segments[1] == segments[2]
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from chess import FILE_MODE
+from chess.manifest import Manifest
+from chess.sources import read_source
+
+
+def test_manifest(tmp_path):
+    source = tmp_path / 'game.pgn'
+    source.write_text('1. e4 e5')
+    (tmp_path / 'game.gif').write_bytes(b'GIF89a')
+    params = {'delay': 1.0}
+
+    manifest = Manifest(str(tmp_path))
+    assert not manifest.is_fresh('game.gif', str(source), params)
+    manifest.record('game.gif', str(source), params)
+    manifest.save()
+    assert os.stat(manifest.path).st_mode & 0o777 == FILE_MODE
+
+    manifest = Manifest(str(tmp_path))
+    assert manifest.is_fresh('game.gif', str(source), params)
+    assert not manifest.is_fresh('game.gif', str(source), {'delay': 2.0})
+
+    # touched but same content.
+    os.utime(str(source), (0, 0))
+    assert manifest.is_fresh('game.gif', str(source), params)
+    source.write_text('1. d4 d5')
+    assert not manifest.is_fresh('game.gif', str(source), params)
+
+    os.remove(str(tmp_path / 'game.gif'))
+    manifest.record('game.gif', str(source), params)
+    assert not manifest.is_fresh('game.gif', str(source), params)
+
+
+def test_manifest_orphans(tmp_path):
+    source = tmp_path / 'game.pgn'
+    source.write_text('1. e4 e5')
+    manifest = Manifest(str(tmp_path))
+    manifest.record('game.gif', str(source), {})
+    assert manifest.orphans() == []
+
+    os.remove(str(source))
+    assert manifest.orphans() == ['game.gif']
+    assert manifest.entries == {}
+
+
+def test_manifest_broken(tmp_path):
+    (tmp_path / '.manifest.json').write_text('{')
+    assert Manifest(str(tmp_path)).entries == {}
+
+
+def test_manifest_part_of_source(tmp_path):
+    source = tmp_path / 'games.cpga'
+    source.write_bytes(b'game one|game two')
+    (tmp_path / 'one.gif').write_bytes(b'GIF89a')
+
+    manifest = Manifest(str(tmp_path))
+    manifest.record('one.gif', str(source), {}, b'game one', os.stat(str(source)))
+    assert manifest.is_fresh('one.gif', str(source), {}, data=b'game one',
+                             stat=os.stat(str(source)))
+
+    # other parts of the source changed.
+    source.write_bytes(b'game one|game three')
+    assert manifest.is_fresh('one.gif', str(source), {}, data=b'game one',
+                             stat=os.stat(str(source)))
+    assert not manifest.is_fresh('one.gif', str(source), {}, data=b'game 1',
+                                 stat=os.stat(str(source)))
+
+
+def test_manifest_changed_after_read(tmp_path):
+    source = tmp_path / 'game.pgn'
+    source.write_text('1. e4 e5')
+    (tmp_path / 'game.gif').write_bytes(b'GIF89a')
+    data, stat = read_source(str(source))
+
+    # changed while the game is rendered from what was read.
+    source.write_text('1. d4 d5')
+    os.utime(str(source), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    manifest = Manifest(str(tmp_path))
+    manifest.record('game.gif', str(source), {}, data, stat)
+    assert manifest.entries['game.gif']['stat'] == [stat.st_size, stat.st_mtime_ns]
+    assert not manifest.is_fresh('game.gif', str(source), {})
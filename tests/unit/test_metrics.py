@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy
+
+from chess.codec import load_games_from_bytes, save_image_to_file
+from chess.metrics import Metrics, peak_rss_kb
+
+
+def test_metrics():
+    metrics = Metrics()
+    with metrics.stage('parse'):
+        sum(range(1000))
+    with metrics.stage('parse'):
+        pass
+    metrics.add('frames', 3)
+
+    other = Metrics()
+    other.merge(metrics)
+    other.merge(metrics.to_dict())
+    result = other.to_dict()
+
+    assert result['stages']['parse']['calls'] == 4
+    assert result['stages']['parse']['wall'] >= 0
+    assert result['counters'] == {'frames': 6}
+    assert peak_rss_kb() > 0
+
+
+def test_metrics_of_codec(tmp_path):
+    metrics = Metrics()
+    games = list(load_games_from_bytes(b'1. e4 e5 1-0\n\n1. d4 *\n', metrics=metrics))
+    assert len(games) == 2
+    assert metrics.stages['parse'][2] == 3
+
+    file_path = str(tmp_path / 'test.gif')
+    frames = [numpy.full((40, 30, 3), i * 60, dtype=numpy.uint8) for i in range(4)]
+    save_image_to_file(file_path, frames, 0.5, metrics=metrics)
+
+    assert metrics.counters['games'] == 2
+    assert metrics.counters['frames'] == 4
+    assert metrics.counters['bytes'] == os.path.getsize(file_path)
+    assert metrics.stages['encode'][2] == 4
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from chess.game import Game, SQUARES
+from chess.movegen import divide, legal_moves, perft, pop, push, Move, PERFT_POSITIONS
+
+
+@pytest.mark.parametrize(
+    "name,depth",
+    [
+        ('start', 3),
+        ('kiwipete', 2),
+        ('endgame', 3),
+        ('promotions', 2),
+        ('discovered', 2),
+    ]
+)
+def test_perft(name, depth):
+    fen, counts = PERFT_POSITIONS[name]
+    assert [perft(Game.from_fen(fen), d) for d in range(1, depth + 1)] == list(counts[:depth])
+
+
+def test_divide():
+    fen, counts = PERFT_POSITIONS['kiwipete']
+    result = dict((str(move), nodes) for move, nodes in divide(Game.from_fen(fen), 2))
+    assert sum(result.values()) == counts[1]
+    assert result['e1g1'] == 43 and result['e1c1'] == 43 and result['d5e6'] == 46
+
+
+def test_push_pop():
+    fen = PERFT_POSITIONS['kiwipete'][0]
+    game = Game.from_fen(fen)
+    key = game.key
+    for move in legal_moves(game):
+        undo = push(game, move)
+        pop(game, undo)
+        assert (game.fen(), game.key) == (fen, key)
+
+
+def test_push_castling_and_en_passant():
+    game = Game.from_fen('r3k2r/8/8/8/3p4/8/4P3/R3K2R w KQkq - 0 1')
+    push(game, Move(SQUARES['e1'], SQUARES['g1'], 0))
+    assert game.fen() == 'r3k2r/8/8/8/3p4/8/4P3/R4RK1 b kq - 1 1'
+    push(game, Move(SQUARES['a8'], SQUARES['b8'], 0))
+    push(game, Move(SQUARES['e2'], SQUARES['e4'], 0))
+    assert game.ep == SQUARES['e3']
+    assert Move(SQUARES['d4'], SQUARES['e3'], 0) in legal_moves(game)
+    push(game, Move(SQUARES['d4'], SQUARES['e3'], 0))
+    assert game.fen() == '1r2k2r/8/8/8/8/4p3/8/R4RK1 w k - 0 3'
+
+
+def test_move_str():
+    game = Game.from_fen('8/4P3/8/8/8/8/8/k1K5 w - - 0 1')
+    assert sorted(str(m) for m in legal_moves(game) if m.promotion) == [
+        'e7e8b', 'e7e8n', 'e7e8q', 'e7e8r']
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from chess.plies import PlySelection
+
+
+@pytest.mark.parametrize('spec, count, expected', [
+    ('final', 30, [30]),
+    ('final', 0, [0]),
+    ('every:10', 25, [0, 10, 20]),
+    ('0,5,-1', 30, [0, 5, 30]),
+    ('-1,30,40', 30, [30]),
+    ('-2', 3, [2]),
+])
+def test_ply_selection(spec, count, expected):
+    assert PlySelection(spec).select(count) == expected
+
+
+def test_ply_selection_single():
+    assert PlySelection('final').single and PlySelection('7').single
+    assert not PlySelection('every:1').single and not PlySelection('1,2').single
+    for spec in ['every:0', 'last', '1,x', '']:
+        with pytest.raises(ValueError, match='bad plies') as e:
+            PlySelection(spec)
+        assert e.value.__suppress_context__
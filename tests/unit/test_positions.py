@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from chess import list_supported_state_files
+from chess.codec import load_state_from_file
+from chess.game import unpack_position
+from chess.codec import load_games_from_bytes
+from chess.positions import (iter_positions, positions_of_bytes, positions_of_games, validate_bytes,
+                             RECORD_HEADER, RECORD_SIZE)
+
+PGN = b'[Event "a"]\n\n1. e4 e5 2. Nf3 1-0\n\n1. d4 Qh4 *\n'
+
+
+def default_state():
+    return load_state_from_file(list_supported_state_files()['default'])
+
+
+def test_iter_positions():
+    fens = [(ply, move, game.fen()) for ply, move, game in
+            iter_positions(['e4', 'c5'], default_state())]
+    assert fens == [
+        (0, None, 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'),
+        (1, 'e4', 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1'),
+        (2, 'c5', 'rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2'),
+    ]
+
+
+def test_positions_of_bytes_fen():
+    chunk, games, plies, errors = positions_of_bytes(PGN, default_state(), source='a.pgn')
+    records = [json.loads(line) for line in chunk.decode('utf-8').splitlines()]
+    assert (games, plies, len(records)) == (2, 6, 6)
+    assert records[3] == {'source': 'a.pgn', 'game': 0, 'ply': 3, 'move': 'Nf3',
+                          'fen': 'rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2'}
+    assert [r['game'] for r in records] == [0, 0, 0, 0, 1, 1]
+    # Qh4 can not be made, the queen is still behind the pawn.
+    assert errors[0][:3] == (1, 2, 'Qh4')
+
+
+def test_positions_of_games_range():
+    games = list(load_games_from_bytes(PGN))
+    whole = positions_of_bytes(PGN, default_state(), source='a.pgn')
+    parts = [positions_of_games(games[i:i + 1], default_state(), source='a.pgn', first=i)
+             for i in range(len(games))]
+    assert b''.join(p[0] for p in parts) == whole[0]
+    assert [e for p in parts for e in p[3]] == whole[3]
+
+
+def test_positions_of_bytes_binary():
+    chunk, _, plies, _ = positions_of_bytes(PGN, default_state(), fmt='binary', source_no=7)
+    assert len(chunk) == plies * RECORD_SIZE
+    record = chunk[RECORD_SIZE:2 * RECORD_SIZE]
+    assert RECORD_HEADER.unpack(record[:RECORD_HEADER.size]) == (7, 0, 1)
+    position = unpack_position(record[RECORD_HEADER.size:])
+    assert not position.is_white_run and position.fullmove == 1
+
+
+def test_validate_bytes():
+    data = PGN + b'\n1. e4 f6 2. Qh5+ a6 3. Qe8# 1-0\n'
+    games, plies, errors = validate_bytes(data, default_state())
+    assert (games, plies) == (3, 7)
+    assert [e[:3] for e in errors] == [(1, 2, 'Qh4'), (2, 4, 'a6')]
+    assert errors[1][3].startswith('IllegalMoveError: ')
+
+    # black leaving its king in check is only found by strict replay.
+    games, plies, errors = validate_bytes(data, default_state(), strict=False)
+    assert (games, plies) == (3, 9)
+    assert [e[:3] for e in errors] == [(1, 2, 'Qh4')]
+
+
+def test_validate_bytes_lenient():
+    # no white pawn on e4 to capture on d5, in either mode.
+    for strict in (True, False):
+        games, plies, errors = validate_bytes(b'1. d4 d5 2. exd5 *\n', default_state(),
+                                              strict=strict)
+        assert (games, plies) == (1, 2)
+        assert [e[:3] for e in errors] == [(0, 3, 'exd5')]
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from chess import list_supported_state_files
+from chess import server as server_module
+from chess.assets import FONT_PATH
+from chess.codec import load_state_from_file
+from chess.server import parse_options, render_gif, HttpError, RenderServer
+
+
+def _crash_or_render(pgn, options):
+    if pgn == b'crash':
+        os._exit(1)  # pylint: disable=protected-access
+    return render_gif(pgn, options)
+
+
+def test_parse_options():
+    options = parse_options('white=%23FFFFFF&delay=0.5&black_first=1&size=120')
+    assert options == {'white': '#FFFFFF', 'black': '#4B7399', 'delay': 0.5, 'black_first': True,
+                       'size': 120}
+
+    for query in ['delay=x', 'delay=-1', 'size=3', 'size=x', 'width=3']:
+        with pytest.raises(ValueError):
+            parse_options(query)
+
+
+def test_render_server_http():
+    server = RenderServer({}, jobs=1)
+
+    async def request(port, data):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(data)
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def run():
+        tcp_server = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        port = tcp_server.sockets[0].getsockname()[1]
+        async with tcp_server:
+            return [await request(port, data) for data in [
+                b'GET /stats HTTP/1.1\r\nConnection: close\r\n\r\n',
+                b'GET /none HTTP/1.1\r\nConnection: close\r\n\r\n',
+                b'GET /render HTTP/1.1\r\nConnection: close\r\n\r\n',
+                b'POST /render?delay=x HTTP/1.0\r\nContent-Length: 2\r\n\r\ne4',
+                b'POST /render HTTP/1.1\r\nContent-Length: 9999999\r\n\r\n',
+            ]]
+
+    try:
+        responses = asyncio.run(run())
+    finally:
+        server.close()
+
+    assert responses[0].startswith(b'HTTP/1.1 200 OK\r\n')
+    assert b'"queue_size": 2' in responses[0]
+    assert [r.split(b'\r\n')[0] for r in responses[1:]] == [
+        b'HTTP/1.1 404 Not Found', b'HTTP/1.1 405 Method Not Allowed',
+        b'HTTP/1.1 400 Bad Request', b'HTTP/1.1 413 Payload Too Large']
+
+
+def test_render_server_chunked():
+    server = RenderServer({}, jobs=1, max_body=8)
+
+    async def request(port, data):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(data)
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def run():
+        tcp_server = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        port = tcp_server.sockets[0].getsockname()[1]
+        async with tcp_server:
+            return [await request(port, data) for data in [
+                # the next request on the connection is read after the chunked body.
+                b'POST /stats HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'2;ext=1\r\ne4\r\n3\r\n e5\r\n0\r\nX-Trailer: 1\r\n\r\n'
+                b'GET /none HTTP/1.1\r\nConnection: close\r\n\r\n',
+                b'POST /stats HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n9\r\n',
+                b'POST /stats HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nx\r\n',
+                b'POST /stats HTTP/1.1\r\nTransfer-Encoding: gzip\r\n\r\n',
+                b'POST /stats HTTP/1.1\r\nTransfer-Encoding: chunked\r\n'
+                b'Content-Length: 2\r\n\r\n',
+            ]]
+
+    try:
+        responses = asyncio.run(run())
+    finally:
+        server.close()
+
+    first, _, second = responses[0].partition(b'HTTP/1.1 404 Not Found\r\n')
+    assert first.startswith(b'HTTP/1.1 200 OK\r\n') and second
+    assert [r.split(b'\r\n')[0] for r in responses[1:]] == [
+        b'HTTP/1.1 413 Payload Too Large', b'HTTP/1.1 400 Bad Request',
+        b'HTTP/1.1 501 Not Implemented', b'HTTP/1.1 400 Bad Request']
+
+
+def test_render_server_timeout(monkeypatch):
+    server = RenderServer({}, jobs=1, queue_size=1, timeout=0.05)
+    server.executor.shutdown()
+    server.executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(server_module, 'render_gif', lambda body, options: time.sleep(0.3))
+
+    async def status(body):
+        try:
+            await server.render(body, '')
+        except HttpError as e:
+            return e.status
+        return 200
+
+    async def run():
+        statuses = [await status(b'1. e4 *')]
+        # the render answered 504 still holds its worker and place in queue.
+        statuses.append(await status(b'1. d4 *'))
+        pending = server.pending
+        await asyncio.sleep(0.5)
+        return statuses, pending, server.pending
+
+    try:
+        assert asyncio.run(run()) == ([504, 503], 1, 0)
+    finally:
+        server.close()
+    assert (server.counters['timeouts'], server.counters['rejected']) == (1, 1)
+
+
+def test_render_server_pool(monkeypatch):
+    state = load_state_from_file(list_supported_state_files()['default'])
+    server = RenderServer(state, jobs=1, font_path=FONT_PATH)
+    monkeypatch.setattr(server_module, 'render_gif', _crash_or_render)
+
+    async def render(body):
+        try:
+            return 200, await server.render(body, 'size=80')
+        except HttpError as e:
+            return e.status, str(e).encode('utf-8')
+
+    async def run():
+        await server.warm_up()
+        return [await render(body) for body in [b'1. e4 e5 2. Ke3 *', b'1. e4 e5 *', b'crash',
+                                                b'1. d4 d5 *']]
+
+    try:
+        responses = asyncio.run(run())
+    finally:
+        server.close()
+
+    assert [status for status, _ in responses] == [400, 200, 500, 200]
+    assert b'illegal move "Ke3"' in responses[0][1]
+    assert responses[1][1].startswith(b'GIF89a') and responses[3][1].startswith(b'GIF89a')
+    assert server.counters['restarts'] == 1
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from chess.sources import bounded_map, iter_ahead, iter_files
+
+
+def test_iter_files(tmp_path):
+    for name in ['b.pgn', 'a/c.pgn', 'a/d.txt', 'a/skip/e.pgn', 'f.pgn']:
+        path = tmp_path / 'games' / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('')
+    top = str(tmp_path / 'games')
+
+    assert [name for _, name in iter_files([top])] == [
+        'a/c.pgn', 'a/skip/e.pgn', 'b.pgn', 'f.pgn']
+    assert [name for _, name in iter_files([top], include=['*.pgn', '*.txt'],
+                                           exclude=['skip', 'f.*'])] == [
+        'a/c.pgn', 'a/d.txt', 'b.pgn']
+    # file arguments are taken as they are.
+    assert list(iter_files([top + '/a/d.txt', top + '/none'])) == [(top + '/a/d.txt', 'd.txt')]
+
+
+def test_bounded_map():
+    taken = []
+
+    def items():
+        for i in range(10):
+            taken.append(i)
+            yield (i,)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = bounded_map(executor, lambda x: x * x, items(), 3)
+        assert next(results)[1].result() == 0
+        assert len(taken) == 3
+        assert [f.result() for _, f in results] == [i * i for i in range(1, 10)]
+
+
+def test_iter_ahead():
+    def count(n):
+        if n < 0:
+            raise OSError('no file')
+        yield from range(n)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        reads = iter_ahead(executor, count, [(3,), (-1,), (1000,), (2,)], 2, 4)
+        assert [(args, list(values)) for args, values in [next(reads)]] == [((3,), [0, 1, 2])]
+        _, values = next(reads)
+        with pytest.raises(OSError):
+            list(values)
+        _, values = next(reads)
+        assert next(values) == 0
+        # closing stops threads left blocked on values nobody takes.
+        reads.close()